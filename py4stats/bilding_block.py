@@ -319,6 +319,40 @@ def style_percent(x, digits = 2, unit = 100, symbol = '%'):
 # In[ ]:
 
 
+def format_number(x, digits = 2, big_mark = ',', prefix = '', suffix = ''):
+  """
+  数値の配列をまとめて固定小数点形式の文字列に変換します。
+  引数の検証は配列全体に対して1回だけ行い、要素毎のラムダ式を使わずに書式を適用します。
+  返り値は x と同じ形状をもつ、文字列（object 型）の np.ndarray です。
+  """
+  x = np.asarray(x, dtype = 'float64')
+  assert_count(digits, arg_name = 'digits')
+  arg_match(big_mark, [',', '_', ''], arg_name = 'big_mark')
+
+  fmt = f'{prefix}{{:{big_mark}.{digits}f}}{suffix}'.format
+  res = np.array(list(map(fmt, x.ravel().tolist())), dtype = object)
+  return res.reshape(x.shape)
+
+
+def format_stars(p_value, stars = {'***':0.01, '**':0.05, '*':0.1}):
+  """
+  p-値の配列を、有意性を表すアスタリスクの文字列の配列にまとめて変換します。
+  `p_stars()` と同様に、p-値が stars の値以下となる最も厳しい水準のラベルを返し、どの水準も満たさない場合は '' を返します。
+  """
+  p_value = np.asarray(p_value, dtype = 'float64')
+  stars = pd.Series(stars).sort_values(ascending = True)
+  assert_numeric(stars, lower = 0, arg_name = 'stars')
+
+  labels = np.array(stars.index.to_list() + [''], dtype = object)
+  position = np.searchsorted(stars.to_numpy(), p_value, side = 'left')
+  # p-値が欠測値の場合はアスタリスクを付けません。
+  position[np.isnan(p_value)] = len(stars)
+  return labels[position]
+
+
+# In[ ]:
+
+
 @np.vectorize
 def pad_zero(x, digits = 2):
     s = str(x)
@@ -364,3 +398,37 @@ def oxford_comma_and(x, quotation = True):
 def oxford_comma_or(x, quotation = True):
   return oxford_comma(x, quotation = quotation, sep_last = 'or')
 
+
+# ## チャンク毎のデータの読み込み
+
+# In[ ]:
+
+
+import os
+
+def read_chunks(data, chunksize = 100_000, columns = None, **kwargs):
+  """
+  ファイルのパス、データフレーム、またはデータフレームのイテラブルから、データフレームを順に返すジェネレーター
+  columns を指定した場合は、その列だけを読み込みます。
+  """
+  if isinstance(data, pd.DataFrame):
+    yield data if columns is None else data[columns]
+    return
+
+  if isinstance(data, (str, os.PathLike)):
+    assert_count(chunksize, lower = 1, arg_name = 'chunksize')
+    ext = os.path.splitext(str(data))[1].lower()
+    if ext in ['.parquet', '.pq']:
+      import pyarrow.parquet as pq
+      for batch in pq.ParquetFile(data).iter_batches(batch_size = chunksize, columns = columns, **kwargs):
+        yield batch.to_pandas()
+    else:
+      if columns is not None: kwargs = {**kwargs, 'usecols':columns}
+      with pd.read_csv(data, chunksize = chunksize, **kwargs) as reader:
+        yield from reader
+    return
+
+  for chunk in data:
+    assert isinstance(chunk, pd.DataFrame), \
+      "argument 'data' must be a path to CSV/Parquet file or an iterable of pandas.DataFrame."
+    yield chunk if columns is None else chunk[columns]
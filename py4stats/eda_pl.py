@@ -25,22 +25,42 @@ import tidypolars as tp
 
 # diagnose の polars 版
 @eda.diagnose.register(pl.DataFrame)
-def diagnose_pl(self):
+def diagnose_pl(self, approx = False, precision = 14):
+  # approx = True の場合は polars の HyperLogLog 実装で近似します（precision は使用しません）
+  if approx:
+    unique_count = self.select(pl.all().approx_n_unique()).row(0)
+  else:
+    unique_count = [self[col].n_unique() for col in self.columns]
+
+  return _diagnose_table(
+      self.columns, self.dtypes, self.null_count().row(0), unique_count, len(self)
+      )
+
+def _diagnose_table(columns, dtypes, missing_count, unique_count, n):
   res = pl.DataFrame({
-      'columns':self.columns,
-      'dtype':self.dtypes,
-      'missing_count':self.null_count().row(0),
-      'unique_count':[self[col].n_unique() for col in self.columns]
+      'columns':columns,
+      'dtype':dtypes,
+      'missing_count':missing_count,
+      'unique_count':unique_count
   }).with_columns(
-      (100 * pl.col('missing_count') / len(self)).alias('missing_percent'),
-      (100 * pl.col('unique_count') / len(self)).alias('unique_rate')
+      (100 * pl.col('missing_count') / n).alias('missing_percent'),
+      (100 * pl.col('unique_count') / n).alias('unique_rate')
   )\
     .select('columns', 'dtype', 'missing_count', 'missing_percent', 'unique_count', 'unique_rate')
   return res
 
 @eda.diagnose.register(tp.tibble.Tibble)
-def diagnose_tp(self):
-  return diagnose_pl(self.to_polars())
+def diagnose_tp(self, approx = False, precision = 14):
+  return diagnose_pl(self.to_polars(), approx = approx, precision = precision)
+
+
+# In[ ]:
+
+
+def _as_polars(data):
+  """tidypolars の Tibble を polars.DataFrame に変換します。"""
+  if isinstance(data, tp.tibble.Tibble): return data.to_polars()
+  return data
 
 
 # In[ ]:
@@ -49,8 +69,24 @@ def diagnose_tp(self):
 @eda.remove_constant.register(pl.DataFrame)
 @eda.remove_constant.register(tp.tibble.Tibble)
 def remove_constant_pl(self, quiet = True, dropna = False):
-  res = eda.remove_constant(self.to_pandas(), quiet = quiet, dropna = dropna)
-  return pl.from_pandas(res)
+  self = _as_polars(self)
+  df_shape = self.shape
+  # 全ての列のユニーク値の数を1つのクエリで計算します。
+  if dropna:
+    n_unique = self.select(pl.all().drop_nulls().n_unique()).row(0)
+  else:
+    n_unique = self.select(pl.all().n_unique()).row(0)
+
+  col_removed = [col for col, n in zip(self.columns, n_unique) if n == 1]
+  self = self.drop(col_removed)
+
+  if not(quiet) :
+    print(
+        f"Removing {len(col_removed)} constant column(s) out of {df_shape[1]} columns" +
+        f"(Removed: {','.join(col_removed)}). "
+     )
+
+  return self
 
 
 # ## グループ別平均（中央値）の比較
@@ -58,12 +94,25 @@ def remove_constant_pl(self, quiet = True, dropna = False):
 # In[ ]:
 
 
+import polars.selectors as cs
+
+def _numeric_stats(data, fun):
+  """数値列（および bool 型の列）に関数 fun を適用した結果を pd.Series として返します。"""
+  res = data.select(fun((cs.numeric() | cs.boolean()).cast(pl.Float64)))
+  return pd.Series(res.row(0), index = res.columns, dtype = 'float64')
+
 @eda.compare_group_means.register(pl.DataFrame)
 @eda.compare_group_means.register(tp.tibble.Tibble)
 def compare_group_means_pl(group1, group2, group_names = ['group1', 'group2']):
-  group1 = group1.to_pandas()
-  group2 = group2.to_pandas()
-  res = eda.compare_group_means(group1, group2, group_names = group_names)
+  group1 = remove_constant_pl(group1)
+  group2 = remove_constant_pl(group2)
+
+  res = eda._group_means_table(
+      _numeric_stats(group1, lambda x: x.mean()), _numeric_stats(group2, lambda x: x.mean()),
+      _numeric_stats(group1, lambda x: x.var()), _numeric_stats(group2, lambda x: x.var()),
+      group1.height, group2.height,
+      group_names = group_names
+      )
   return res
 
 
@@ -73,9 +122,13 @@ def compare_group_means_pl(group1, group2, group_names = ['group1', 'group2']):
 @eda.compare_group_median.register(pl.DataFrame)
 @eda.compare_group_median.register(tp.tibble.Tibble)
 def compare_group_median_pl(group1, group2, group_names = ['group1', 'group2']):
-  group1 = group1.to_pandas()
-  group2 = group2.to_pandas()
-  res = eda.compare_group_median(group1, group2, group_names = group_names)
+  group1 = remove_constant_pl(group1)
+  group2 = remove_constant_pl(group2)
+
+  res = eda._group_median_table(
+      _numeric_stats(group1, lambda x: x.median()), _numeric_stats(group2, lambda x: x.median()),
+      group_names = group_names
+      )
   return res
 
 
@@ -86,21 +139,181 @@ def compare_group_median_pl(group1, group2, group_names = ['group1', 'group2']):
 
 @eda.freq_table.register(tp.tibble.Tibble)
 @eda.freq_table.register(pl.DataFrame)
-def freq_table_pl(self, subset, **kwargs):
-  res = eda.freq_table(self.to_pandas(), subset = subset, **kwargs)
-  return pl.from_pandas(res.reset_index())
+def freq_table_pl(
+    self, subset, sort = True, ascending = False, dropna = False,
+    top_k = None, other_name = 'other'
+    ):
+  # polars.LazyFrame を与えた場合は、集計のクエリを組み立てるだけで実行はしません。
+  self = _as_polars(self)
+  if isinstance(subset, str): subset = [subset]
+
+  data = self.select(subset)
+  if dropna: data = data.drop_nulls()
+
+  res = data.group_by(subset).agg(pl.len().cast(pl.Int64).alias('freq'))
+  if top_k is not None:
+    res = _top_k_with_other_pl(
+        res, subset, top_k, sort = sort, ascending = ascending, other_name = other_name
+        )
+  elif sort:
+    # 度数が同じ場合の並び順を固定するため、subset の値でもソートします。
+    res = res.sort(
+        ['freq'] + subset, descending = [not ascending] + [False] * len(subset),
+        nulls_last = True
+        )
+  else:
+    res = res.sort(subset, nulls_last = True)
+
+  res = res.with_columns(
+      (pl.col('freq') / pl.col('freq').sum()).alias('perc'),
+      pl.col('freq').cum_sum().alias('cumfreq')
+      ).with_columns(
+      (pl.col('cumfreq') / pl.col('freq').sum()).alias('cumperc')
+      )
+  return res
+
+def _top_k_with_other_pl(res, subset, top_k, sort = True, ascending = False, other_name = 'other'):
+  """度数の上位 top_k 件を抽出し、残りの度数の合計を other_name の行として追加します。"""
+  bild.assert_count(top_k, lower = 1, arg_name = 'top_k')
+  if ascending:
+    top = res.bottom_k(top_k, by = ['freq'] + subset, reverse = [False] + [True] * len(subset))
+  else:
+    top = res.top_k(top_k, by = ['freq'] + subset, reverse = [False] + [True] * len(subset))
+
+  if sort:
+    top = top.sort(
+        ['freq'] + subset, descending = [not ascending] + [False] * len(subset),
+        nulls_last = True
+        )
+  else:
+    top = top.sort(subset, nulls_last = True)
+
+  # 上位 top_k 件に含まれない度数の合計
+  other = top.select(pl.col('freq').sum().alias('__top'))\
+    .join(res.select(pl.col('freq').sum().alias('__total')), how = 'cross')\
+    .select(
+        [pl.lit(other_name if i == 0 else '').alias(col) for i, col in enumerate(subset)] +
+        [(pl.col('__total') - pl.col('__top')).alias('freq')]
+        )\
+    .filter(pl.col('freq') > 0)
+
+  return pl.concat(
+      [top.with_columns(pl.col(subset).cast(pl.Utf8)), other],
+      how = 'vertical_relaxed'
+      )
 
 
 # In[ ]:
 
 
-@eda.crosstab2.register(tp.tibble.Tibble)
-@eda.crosstab2.register(pl.DataFrame)
-def crosstab2_pl(data, index, columns, **kwargs):
+def _level_names(name, dtype):
+  """pivot() で作成する列の名前として、列 name の水準を文字列に変換します。bool 型は pandas と同じく 'True' / 'False' とします。"""
+  expr = pl.col(name)
+  if dtype == pl.Boolean:
+    return pl.when(expr).then(pl.lit('True')).when(~expr).then(pl.lit('False')).alias(name)
+  return expr.cast(pl.Utf8)
+
+def _crosstab_pl(
+    data, index, columns, values = None, aggfunc = None,
+    margins = False, margins_name = 'All', weights = None, dropna = True
+    ):
+  """group_by() と pivot() によって、度数（または aggfunc による集計値）のクロス集計表を作成します。
+  weights に列名を指定した場合は、その列を各行の度数として集計します。
+  dropna = False の場合、index または columns が欠測値の行も1つの水準として集計し、その列の名前は 'null' とします。
+  """
+  if weights is not None:
+    expr = pl.col(weights).sum().cast(pl.Int64)
+  elif values is None:
+    expr = pl.len().cast(pl.Int64)
+  else:
+    assert isinstance(aggfunc, str), "argument 'aggfunc' must be a name of polars aggregation method."
+    expr = getattr(pl.col(values), aggfunc)()
+
+  # pd.crosstab() と同様に、dropna = True では index または columns が欠測値の行を集計から除外します。
+  if dropna: data = data.drop_nulls([index, columns])
+  # 列の水準は元の値の順に並べてから、pivot() が作成する列の名前（文字列）に変換します。
+  data = data.with_columns(_level_names(columns, data.schema[columns]))
+  col_levels = data.select(pl.col(columns).unique().sort(nulls_last = True)).to_series()
+  col_names = ['null' if v is None else v for v in col_levels]
+
+  res = data.group_by([index, columns]).agg(expr.alias('value'))\
+    .pivot(on = columns, index = index, values = 'value')\
+    .sort(index, nulls_last = True)
+
+  if values is None:
+    res = res.with_columns(pl.col(col_names).fill_null(0))
+  res = res.select([index] + col_names)
+
+  if margins:
+    row_margin = data.group_by(index).agg(expr.alias(margins_name))
+    res = res.join(row_margin, on = index, how = 'left', nulls_equal = True)
+
+    col_margin = data.group_by(columns).agg(expr.alias('value'))\
+      .with_columns(pl.lit(margins_name).alias(index))\
+      .pivot(on = columns, index = index, values = 'value')
+    col_margin = col_margin.with_columns(
+        data.select(expr.alias(margins_name))
+        ).select(res.columns)
+
+    res = pl.concat([
+        res.with_columns(pl.col(index).cast(pl.Utf8)),
+        col_margin.with_columns(pl.col(index).cast(pl.Utf8))
+        ], how = 'vertical_relaxed')
 
-  res = eda.crosstab2(data.to_pandas(), index = index, columns = columns, **kwargs)
+  return res
 
-  return pl.from_pandas(res.reset_index())
+@eda.crosstab2.register(tp.tibble.Tibble)
+@eda.crosstab2.register(pl.DataFrame)
+def crosstab2_pl(
+    data, index, columns, values = None, rownames = None, colnames = None,
+    aggfunc = None, margins = False, margins_name = 'All', dropna = True, normalize = False
+    ):
+  data = _as_polars(data)
+  return _crosstab2_pl(
+      data, index, columns, values = values, rownames = rownames, colnames = colnames,
+      aggfunc = aggfunc, margins = margins, margins_name = margins_name,
+      dropna = dropna, normalize = normalize
+      )
+
+def _crosstab2_pl(
+    data, index, columns, values = None, rownames = None, colnames = None,
+    aggfunc = None, margins = False, margins_name = 'All', dropna = True, normalize = False,
+    weights = None
+    ):
+  # 集計関数に文字列以外が指定された場合などには pandas 版を使用します。
+  # weights（LazyFrame で集計済みの度数）は values = None の場合だけ指定されるため、pandas 版には渡りません。
+  if (values is not None and not isinstance(aggfunc, str)) or \
+     (values is not None and normalize is not False):
+    data = data.to_pandas()
+    if isinstance(values, str): values = data[values]
+    res = eda.crosstab2(
+        data, index = index, columns = columns, values = values,
+        rownames = rownames, colnames = colnames, aggfunc = aggfunc,
+        margins = margins, margins_name = margins_name,
+        dropna = dropna, normalize = normalize
+        )
+    return pl.from_pandas(res.reset_index())
+
+  res = _crosstab_pl(
+      data, index, columns, values = values, aggfunc = aggfunc,
+      margins = margins, margins_name = margins_name, weights = weights, dropna = dropna
+      )
+
+  if normalize is not False:
+    normalize = bild.arg_match(
+        'all' if normalize is True else normalize,
+        ['index', 'columns', 'all'], arg_name = 'normalize'
+        )
+    res_pd = eda._normalize_crosstab(
+        res.to_pandas().set_index(index), normalize = normalize,
+        margins = margins, margins_name = margins_name
+        )
+    res = pl.from_pandas(res_pd.reset_index())
+
+  # 行名は index の列の名前とします。列名は pandas 版を pl.DataFrame に変換した場合と同じく、表には残りません。
+  if rownames is not None:
+    res = res.rename({index:rownames if isinstance(rownames, str) else rownames[0]})
+  return res
 
 
 # In[ ]:
@@ -108,9 +321,139 @@ def crosstab2_pl(data, index, columns, **kwargs):
 
 @eda.tabyl.register(tp.tibble.Tibble)
 @eda.tabyl.register(pl.DataFrame)
-def tabyl_pl(data, index, columns, **kwargs):
+def tabyl_pl(
+    data, index, columns, margins = True, margins_name = 'All',
+    normalize = 'index', dropna = False, rownames = None, colnames = None, digits = 1
+    ):
+  data = _as_polars(data)
+  if(not isinstance(normalize, bool)):
+    normalize = bild.arg_match(
+        normalize, ['index', 'columns', 'all'],
+        arg_name = 'normalize'
+        )
+  # 集計は polars で行い、行数が小さくなった度数クロス集計表だけを pandas に変換します。
+  # pandas 版と同じく、bool 型の列は 'True' / 'False' の文字列として集計します。
+  data = data.with_columns([
+      _level_names(v, pl.Boolean) for v in (index, columns) if data.schema[v] == pl.Boolean
+      ])
+  c_tab1 = _crosstab_pl(
+      data, index, columns, margins = margins, margins_name = margins_name, dropna = dropna
+      ).to_pandas().set_index(index)
+  # 欠測値の水準は、pandas 版と同じく NaN を名前とする行と列にします。
+  c_tab1.index = c_tab1.index.map(lambda v: np.nan if v is None else v)
+  if not dropna and data[columns].null_count() > 0:
+    c_tab1 = c_tab1.rename(columns = {'null':np.nan})
+
+  c_tab1.columns.name = columns if colnames is None else colnames
+  if rownames is not None: c_tab1.index.name = rownames
+
+  res = eda.TabylResult(
+      c_tab1, normalize = normalize,
+      margins = margins, margins_name = margins_name, digits = digits
+      )
+  return res
 
-  res = eda.tabyl(data.to_pandas(), index = index, columns = columns, **kwargs)
 
-  return res
+# ## `polars.LazyFrame` 向けのメソッド
+# 
+# 　`pl.scan_parquet()` などで作成した `LazyFrame` を与えると、集計を1つのクエリとして組み立ててから
+# ストリーミングエンジンで実行します。集計に使わない列や行グループはファイルから読み込まれません。
+
+# In[ ]:
+
+
+def _collect_streaming(lf):
+  """LazyFrame をストリーミングエンジンで実行します。"""
+  try:
+    return lf.collect(engine = 'streaming')
+  except TypeError:
+    # polars の古いバージョン向け
+    return lf.collect(streaming = True)
+
+
+# In[ ]:
+
+
+@eda.diagnose.register(pl.LazyFrame)
+def diagnose_lazy(self, approx = False, precision = 14):
+  schema = self.collect_schema()
+  n_unique = pl.all().approx_n_unique() if approx else pl.all().n_unique()
+
+  # 欠測値の数、ユニーク値の数、行数を1つのクエリで計算します。
+  res = _collect_streaming(self.select(
+      pl.all().null_count().name.suffix('__missing'),
+      n_unique.name.suffix('__unique'),
+      pl.len().alias('__nrow')
+      )).row(0, named = True)
+
+  columns = list(schema.names())
+  return _diagnose_table(
+      columns, list(schema.dtypes()),
+      [res[f'{col}__missing'] for col in columns],
+      [res[f'{col}__unique'] for col in columns],
+      res['__nrow']
+      )
+
+
+# In[ ]:
+
+
+@eda.remove_constant.register(pl.LazyFrame)
+def remove_constant_lazy(self, quiet = True, dropna = False):
+  columns = self.collect_schema().names()
+  if dropna:
+    n_unique = _collect_streaming(self.select(pl.all().drop_nulls().n_unique())).row(0)
+  else:
+    n_unique = _collect_streaming(self.select(pl.all().n_unique())).row(0)
+
+  col_removed = [col for col, n in zip(columns, n_unique) if n == 1]
+
+  if not(quiet) :
+    print(
+        f"Removing {len(col_removed)} constant column(s) out of {len(columns)} columns" +
+        f"(Removed: {','.join(col_removed)}). "
+     )
+  # 定数列を除いた LazyFrame を返します。
+  return self.drop(col_removed)
+
+
+# In[ ]:
+
+
+@eda.freq_table.register(pl.LazyFrame)
+def freq_table_lazy(
+    self, subset, sort = True, ascending = False, dropna = False,
+    top_k = None, other_name = 'other'
+    ):
+  res = freq_table_pl(
+      self, subset, sort = sort, ascending = ascending, dropna = dropna,
+      top_k = top_k, other_name = other_name
+      )
+  return _collect_streaming(res)
+
+
+# In[ ]:
+
 
+@eda.crosstab2.register(pl.LazyFrame)
+def crosstab2_lazy(
+    data, index, columns, values = None, rownames = None, colnames = None,
+    aggfunc = None, margins = False, margins_name = 'All', dropna = True, normalize = False
+    ):
+  if values is None:
+    # セル毎の度数を lazy に集計し、行数の小さくなった集計結果からクロス集計表を作成します。
+    if dropna: data = data.drop_nulls([index, columns])
+    counts = _collect_streaming(
+        data.group_by([index, columns]).agg(pl.len().alias('__freq'))
+        )
+    weights = '__freq'
+  else:
+    # 集計に使用する列だけを読み込みます。
+    counts = _collect_streaming(data.select([index, columns, values]))
+    weights = None
+
+  return _crosstab2_pl(
+      counts, index, columns, values = values, rownames = rownames, colnames = colnames,
+      aggfunc = aggfunc, margins = margins, margins_name = margins_name,
+      dropna = dropna, normalize = normalize, weights = weights
+      )
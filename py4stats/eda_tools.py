@@ -14,6 +14,88 @@ import pandas_flavor as pf
 import pandas as pd
 import numpy as np
 import scipy as sp
+import pandas.api.types
+
+
+# ### ユニーク値の数を近似的に数えるスケッチ
+# 
+# 　HyperLogLog（Flajolet et al. 2007）による基数推定。レジスタ数を `m = 2 ** precision` とすると、
+# 推定値の相対標準誤差はおおよそ `1.04 / sqrt(m)` で、初期設定の `precision = 14` なら約 0.81% です。
+# 同じ `precision` のスケッチ同士は `merge()` で結合できるため、チャンク毎の集計結果を後から合算することもできます。
+
+# In[ ]:
+
+
+class HyperLogLog:
+  """HyperLogLog によるユニーク値の数の近似計算"""
+  def __init__(self, precision = 14):
+    bild.assert_count(precision, lower = 4, upper = 18, arg_name = 'precision')
+    self.precision = precision
+    self.m = 2 ** precision
+    self.registers = np.zeros(self.m, dtype = np.uint8)
+    self.n = 0 # 追加した値の数（ユニーク値の数の上限）
+
+  def update(self, x):
+    """欠測値を除いた x の値をスケッチに追加します。"""
+    x = pd.Series(x)
+    x = x[x.notna()]
+    if len(x) == 0: return self
+    self.n += len(x)
+
+    # 高カーディナリティの列を想定して、事前の factorize を行わずにハッシュ化します。
+    h = _hash_values(x)
+    p = np.uint64(self.precision)
+    idx = (h >> (np.uint64(64) - p)).astype(np.intp)
+    # 残りのビット列で先頭に連続する 0 の数 + 1 を計算
+    rest = h & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+    rank = (64 - self.precision) - _bit_length(rest) + 1
+
+    np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+    return self
+
+  def merge(self, other):
+    """同じ precision をもつ別のスケッチを結合します。"""
+    assert self.precision == other.precision,\
+     "HyperLogLog sketches with different 'precision' cannot be merged."
+    np.maximum(self.registers, other.registers, out = self.registers)
+    self.n += other.n
+    return self
+
+  def count(self):
+    """ユニーク値の数の推定値を返します。"""
+    m = self.m
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+    n_zero = np.sum(self.registers == 0)
+    # 値の数が少ない場合は linear counting で補正
+    if (estimate <= 2.5 * m) and (n_zero > 0):
+      estimate = m * np.log(m / n_zero)
+    # 推定値が追加した値の数を超えないように制限
+    return min(int(round(estimate)), self.n)
+
+def _hash_values(x):
+  """
+  欠測値を含まない pd.Series の値を np.uint64 にハッシュ化します。
+  int と float で同じ値が同じハッシュ値になるように、整数は int64 のまま、
+  float のうち整数値をとるものは int64 に変換してからハッシュ化します（2**53 を超える整数も区別されます）。
+  """
+  kind = x.dtype.kind
+  if kind in 'iu':
+    dtype = 'uint64' if (kind == 'u' and x.dtype.itemsize == 8) else 'int64'
+    return pd.util.hash_array(x.to_numpy(dtype = dtype), categorize = False)
+  if kind == 'f':
+    vals = x.to_numpy(dtype = 'float64')
+    h = pd.util.hash_array(vals, categorize = False)
+    is_int = (vals == np.floor(vals)) & (np.abs(vals) < 2.0 ** 63)
+    if is_int.any():
+      h[is_int] = pd.util.hash_array(vals[is_int].astype('int64'), categorize = False)
+    return h
+  return pd.util.hash_pandas_object(x, index = False, categorize = False).to_numpy()
+
+def _bit_length(x):
+  """np.uint64 の配列の各要素について、ビット長を計算します。"""
+  # float64 への変換による丸めの影響は 2**-53 程度なので無視します。
+  return np.frexp(x.astype(np.float64))[1]
 
 
 # In[ ]:
@@ -26,7 +108,7 @@ def missing_percent(x, axis = 'index', pct = True):
 
 @pf.register_dataframe_method
 @singledispatch
-def diagnose(self):
+def diagnose(self, approx = False, precision = 14):
   """
   ## `diagnose()`
   ### ## 返り値 Value
@@ -37,20 +119,207 @@ def diagnose(self):
   - `missing_percent`：該当する列のなかで欠測値が占めている割合で 欠`missing_percent = 100 * missing_count/ nrow` として計算されます。もし `missing_percent = 100` なら、その列は完全に空白です。
   - `unique_count`：その列で重複を除外したユニークな値の数。例えばある列の中身が「a, a, b, b, b」であればユニークな値は `a` と `b` の2つなのでユニーク値の数は2です。もし ユニーク値の数 = 1 であれば、その行にはたった1種類の値しか含まれていないことが分かりますし、例えば都道府県を表す列のユニーク値の数が47より多ければ、都道府県以外のものが混ざっていると考えられます。
   - `unique_rate`： サンプルに占めるユニークな値の割合。 `unique_rate = 100 * unique_count / nrow`と計算されます。 `unique_rate = 100` であれば、全ての行に異なる値が入っています。一般的に実数値の列はユニーク率が高くなりますが、年齢の「20代」や価格の「400円代」のように、階級に分けられている場合にはユニーク率が低くなります。
+
+  `approx = True` の場合、`unique_count` を HyperLogLog による近似値で計算します（相対誤差は約 `1.04 / sqrt(2 ** precision)`）。
   """
-  self = self.copy()
-  # 各種集計値の計算 ------------
+  bild.assert_logical(approx, arg_name = 'approx')
+  n = len(self)
+  # データフレームをコピーせず、1列ずつ欠測値の数とユニーク値の数を計算します。
+  missing_count = []
+  unique_count = []
+  for _, x in self.items():
+    missing_count.append(int(x.isna().sum()))
+    if approx:
+      unique_count.append(HyperLogLog(precision).update(x).count())
+    else:
+      unique_count.append(x.nunique())
+
+  missing_count = np.array(missing_count, dtype = 'int64')
+  unique_count = np.array(unique_count, dtype = 'int64')
+
   result = pd.DataFrame({
     'dtype':self.dtypes,
-    'missing_count':self.isna().sum(),
-    'missing_percent':missing_percent(self),
-    'unique_count':self.nunique(),
-    'unique_rate': 100 * self.nunique() / len(self),
+    'missing_count':missing_count,
+    'missing_percent':100 * missing_count / n,
+    'unique_count':unique_count,
+    'unique_rate': 100 * unique_count / n,
   })
 
   return result
 
 
+# ### ファイルを分割して読み込みながら集計する `diagnose()`
+# 
+# 　1つの `pd.DataFrame` に読み込めない大きさの CSV / Parquet ファイルを、`chunksize` 行ずつ読み込みながら集計します。
+# 列毎の集計値（欠測値の数、dtype の変化、ユニーク値の数のスケッチ、最頻値の候補）は `merge()` で結合できるため、
+# ファイルを分割して別々のプロセスで集計した結果を後から合算することもできます。
+
+# In[ ]:
+
+
+import os
+
+
+# In[ ]:
+
+
+class MisraGries:
+  """Misra-Gries の要約による頻出値（heavy hitters）の近似計算
+
+  高々 k 個のカウンターだけを保持します。推定した度数 `est` と真の度数 `freq` の間には、
+  総度数を n として `est <= freq <= est + n / (k + 1)` が成り立ちます。
+  """
+  def __init__(self, k = 100):
+    bild.assert_count(k, lower = 1, arg_name = 'k')
+    self.k = k
+    self.n = 0
+    self.counters = pd.Series(dtype = 'int64')
+
+  def update(self, x, dropna = False):
+    """x の値（データフレームの場合は行）をまとめて集計し、要約に追加します。"""
+    if not isinstance(x, pd.DataFrame): x = pd.Series(x)
+    counts = x.value_counts(dropna = dropna)
+    self.n += int(counts.sum())
+    return self._merge_counts(counts)
+
+  def merge(self, other):
+    """別の要約を結合します。"""
+    self.n += other.n
+    return self._merge_counts(other.counters)
+
+  def _merge_counts(self, counts):
+    if len(self.counters) == 0:
+      merged = counts.copy()
+    else:
+      # 値に欠測値や異なる型が混在していても並べ替えずに結合します。
+      merged = pd.concat([self.counters, counts])
+      merged = merged.groupby(
+          level = list(range(merged.index.nlevels)), sort = False, dropna = False
+          ).sum()
+    if len(merged) > self.k:
+      # (k + 1) 番目に大きい度数を全てのカウンターから差し引き、正の値だけを残します。
+      kth = np.partition(merged.to_numpy(), -(self.k + 1))[-(self.k + 1)]
+      merged = merged - kth
+      merged = merged[merged > 0]
+    self.counters = merged.astype('int64')
+    return self
+
+  @property
+  def error_bound(self):
+    """推定した度数の誤差の上限"""
+    return self.n / (self.k + 1)
+
+  def top(self, n = None):
+    """推定した度数の大きい順に、値と推定度数を返します。"""
+    res = self.counters.sort_values(ascending = False)
+    if n is not None: res = res.head(n)
+    return res
+
+
+# In[ ]:
+
+
+class DiagnoseState:
+  """
+  `diagnose_file()` で使用する列毎の集計値の状態
+  top_k を指定した場合に限り、列毎の最頻値の候補を Misra-Gries の要約 `top_values` で集計し、
+  `result()` に最頻値 `top` とその度数の下限 `top_freq` の列を追加します。
+  """
+  def __init__(self, precision = 14, top_k = None):
+    if top_k is not None: bild.assert_count(top_k, lower = 1, arg_name = 'top_k')
+    self.precision = precision
+    self.top_k = top_k
+    self.n = 0
+    self.columns = []
+    self.dtypes = {}
+    self.missing_count = {}
+    self.sketch = {}
+    self.top_values = {}
+
+  def _add_column(self, col):
+    self.columns.append(col)
+    self.dtypes[col] = []
+    self.missing_count[col] = 0
+    self.sketch[col] = HyperLogLog(self.precision)
+    if self.top_k is not None: self.top_values[col] = MisraGries(self.top_k)
+
+  def update(self, chunk):
+    """データフレーム chunk の集計値を追加します。"""
+    for col, x in chunk.items():
+      if col not in self.dtypes: self._add_column(col)
+      if x.dtype not in self.dtypes[col]: self.dtypes[col].append(x.dtype)
+      self.missing_count[col] += int(x.isna().sum())
+      self.sketch[col].update(x)
+      if self.top_k is not None: self.top_values[col].update(x, dropna = True)
+
+    # それまでのチャンクに存在しなかった列は、全て欠測値として扱います。
+    for col in self.columns:
+      if col not in chunk.columns: self.missing_count[col] += len(chunk)
+    self.n += len(chunk)
+    return self
+
+  def merge(self, other):
+    """別の集計値の状態を結合します。"""
+    for col in other.columns:
+      if col not in self.dtypes:
+        self._add_column(col)
+        self.missing_count[col] += self.n
+      for dtype in other.dtypes[col]:
+        if dtype not in self.dtypes[col]: self.dtypes[col].append(dtype)
+      self.missing_count[col] += other.missing_count[col]
+      self.sketch[col].merge(other.sketch[col])
+      if self.top_k is not None: self.top_values[col].merge(other.top_values[col])
+
+    for col in self.columns:
+      if col not in other.dtypes: self.missing_count[col] += other.n
+    self.n += other.n
+    return self
+
+  def result(self):
+    """`diagnose()` と同じ形式の集計表を返します。"""
+    missing_count = np.array([self.missing_count[col] for col in self.columns], dtype = 'int64')
+    unique_count = np.array([self.sketch[col].count() for col in self.columns], dtype = 'int64')
+
+    result = pd.DataFrame({
+      'dtype':[_common_dtype(self.dtypes[col]) for col in self.columns],
+      'missing_count':missing_count,
+      'missing_percent':100 * missing_count / self.n,
+      'unique_count':unique_count,
+      'unique_rate': 100 * unique_count / self.n,
+    }, index = self.columns)
+
+    if self.top_k is not None:
+      top = [self.top_values[col].top(1) for col in self.columns]
+      result['top'] = [v.index[0] if len(v) else np.nan for v in top]
+      result['top_freq'] = np.array([v.iloc[0] if len(v) else 0 for v in top], dtype = 'int64')
+    return result
+
+def _common_dtype(dtypes):
+  """チャンク毎に異なる dtype が推定された場合に、それらを統合した dtype を返します。"""
+  if len(dtypes) == 1: return dtypes[0]
+  try:
+    return np.result_type(*dtypes)
+  except TypeError:
+    return np.dtype('O')
+
+
+# In[ ]:
+
+
+def diagnose_file(path, chunksize = 100_000, precision = 14, top_k = None, **kwargs):
+  """
+  CSV または Parquet ファイルを `chunksize` 行ずつ読み込みながら `diagnose()` と同じ集計表を作成します。
+  使用するメモリはファイルの大きさではなく `chunksize` に比例します。
+  `unique_count` は HyperLogLog による近似値です。
+  `top_k` を指定すると、`top_k` 個のカウンターで推定した最頻値 `top` とその度数の下限 `top_freq` の列を追加します。
+  `**kwargs` はファイルの読み込みに使う `pd.read_csv()` または `pyarrow.parquet.ParquetFile.iter_batches()` に渡されます。
+  """
+  state = DiagnoseState(precision = precision, top_k = top_k)
+  for chunk in bild.read_chunks(path, chunksize = chunksize, **kwargs):
+    state.update(chunk)
+  return state.result()
+
+
 # ### 異なるデータフレームの列を比較する関数
 
 # In[ ]:
@@ -93,18 +362,30 @@ def compare_df_cols(df_list, return_match = 'all', df_name = None, dropna = Fals
 # In[ ]:
 
 
-import itertools
+def _read_file(path, **kwargs):
+  """CSV または Parquet ファイルを pd.DataFrame として読み込みます。"""
+  ext = os.path.splitext(str(path))[1].lower()
+  if ext in ['.parquet', '.pq']:
+    return pd.read_parquet(path, **kwargs)
+  return pd.read_csv(path, **kwargs)
 
 def compare_df_stats(
     df_list, return_match = 'all', df_name = None,
     stats = 'mean', rtol = 1e-05, atol = 1e-08,
+    read_kwargs = None,
     **kwargs
     ):
-  """複数の pandas.DataFrame に含まれる同じ名前を持つ列同士のデータ型 `dtype` を比較します。"""
+  """複数の pandas.DataFrame に含まれる同じ名前を持つ列同士の統計値 `stats` を比較します。
+
+  `df_list` には pandas.DataFrame の代わりに CSV / Parquet ファイルのパスを指定することもでき、
+  その場合はファイルを1つずつ読み込んで統計値を計算します（`read_kwargs` は読み込み関数に渡されます）。
+  全てのデータフレームの統計値が、最大値と最小値の差が `atol + rtol * 絶対値の最小値` 以下であるとき、
+  `match_stats = True` と判定します。これは全てのペアに `np.isclose()` を適用した結果が True になるための十分条件です。
+  """
   # 引数のアサーション ----------------------
   assert isinstance(df_list, list) & \
-        all([isinstance(v, pd.DataFrame) for v in df_list]),\
-        "argument 'df_list' is must be a list of pandas.DataFrame."
+        all([isinstance(v, (pd.DataFrame, str, os.PathLike)) for v in df_list]),\
+        "argument 'df_list' is must be a list of pandas.DataFrame or paths to CSV/Parquet files."
 
   return_match = bild.arg_match(
       return_match,
@@ -116,30 +397,30 @@ def compare_df_stats(
   if df_name is None:
       df_name = [f'df{i + 1}' for i in range(len(df_list))]
 
-  df_list = [v.copy() for v in df_list] # コピーを作成
-  stats_list = [
-      v.select_dtypes(include = ['int', 'float', 'bool'])\
-      .dropna(axis = 1, how = 'all').agg(stats, **kwargs)
-      for v in df_list
-      ]
+  read_kwargs = read_kwargs or {}
+  # データフレーム毎に1回だけ統計値を計算します（コピーは作成しません）。
+  stats_list = []
+  for v in df_list:
+    if not isinstance(v, pd.DataFrame): v = _read_file(v, **read_kwargs)
+    stats_list.append(
+        v.select_dtypes(include = ['int', 'float', 'bool'])\
+        .dropna(axis = 1, how = 'all').agg(stats, **kwargs)
+        )
+    del v
+
   res = pd.concat(stats_list, axis = 1)
   res.columns = df_name
   res.index.name = 'term'
 
-  # データフレームのペア毎に、統計値が近いかどうかを比較します。
-  pairwise_comparesion = \
-   [pd.Series(
-    np.isclose(
-        res.iloc[:, i], res.iloc[:, j],
-        rtol = rtol, atol = atol
-    ), index = res.index)
-   for i, j in itertools.combinations(range(len(res.columns)), 2)
-    ]
-
-  res['match_stats'] = pd.concat(pairwise_comparesion, axis = 1).all(axis = 1)
+  # 統計値の行列全体に対して、最大値と最小値の差が許容誤差以内かどうかを一度に判定します。
+  # 欠測値を含む行は np.isclose() と同様に False になります。
+  values = res.to_numpy(dtype = 'float64')
+  value_range = values.max(axis = 1) - values.min(axis = 1)
+  tolerance = atol + rtol * np.abs(values).min(axis = 1)
+  res['match_stats'] = value_range <= tolerance
 
-  if(return_match == 'match_stats'):
-    res = res[res['match']]
+  if(return_match == 'match'):
+    res = res[res['match_stats']]
   elif(return_match == 'mismatch'):
     res = res[~res['match_stats']]
 
@@ -150,21 +431,108 @@ def compare_df_stats(
 
 
 # レコード毎の近接性（数値の場合）または一致性（数値以外）で評価する関数
-def compare_df_record(df1, df2, rtol = 1e-05, atol = 1e-08):
+def compare_df_record(df1, df2, rtol = 1e-05, atol = 1e-08, key = None, chunksize = 1_000_000):
+  """
+  2つのデータフレームをレコード毎に比較します。
+
+  `key = None`（初期設定）の場合は2つのデータフレームの行の並びが同じであると仮定して、
+  数値の列は `np.isclose()` による近接性、それ以外の列は一致性を判定したブール値のデータフレームを返します。
+
+  `key` に列名（またはそのリスト）を指定すると、その列の値で行を対応させて比較し、
+  差異のあったセルと、片方のデータフレームにだけ存在するキーのみを縦長のデータフレームとして返します。
+  - `status`：`'changed'`（値が異なるセル）、`'removed'`（df1 にだけ存在するキー）、`'added'`（df2 にだけ存在するキー）
+  - `column`：値が異なる列の名前
+  - `df1`, `df2`：それぞれのデータフレームにおける値
+  行の内容のハッシュ値が一致する行は比較を省略し、残りの行を `chunksize` 行ずつ比較します。
+  """
+  if key is not None:
+    return _compare_df_keyed(df1, df2, key, rtol = rtol, atol = atol, chunksize = chunksize)
+
   all_columns = df1.columns
   number_col = df1.select_dtypes(include = 'number').columns
-  nonnum_col = df1.select_dtypes(exclude = 'number').columns
 
-  res_number_col = [np.isclose(df1[v], df2[v]) for v in number_col]
+  result = pd.DataFrame({
+      v: np.isclose(df1[v], df2[v], rtol = rtol, atol = atol) if v in number_col \
+        else (df1[v].to_numpy() == df2[v].to_numpy())
+      for v in all_columns
+  }, index = df1.index)
 
-  res_nonnum_col = [(df1[v] == df2[v]) for v in nonnum_col]
+  return result
 
-  result = pd.concat([
-      pd.DataFrame(res_number_col, index = number_col).T,
-      pd.DataFrame(res_nonnum_col, index = nonnum_col).T
-  ], axis = 'columns').loc[:, all_columns]
 
-  return result
+# In[ ]:
+
+
+def _row_hash(data, chunksize = 1_000_000):
+  """データフレームの各行の内容から uint64 のハッシュ値を計算します。"""
+  res = np.empty(len(data), dtype = np.uint64)
+  for start in range(0, len(data), chunksize):
+    chunk = data.iloc[start:start + chunksize]
+    res[start:start + chunksize] = pd.util.hash_pandas_object(chunk, index = False).to_numpy()
+  return res
+
+def _key_index(data, key):
+  if len(key) == 1: return pd.Index(data[key[0]])
+  return pd.MultiIndex.from_frame(data[key])
+
+def _compare_df_keyed(df1, df2, key, rtol = 1e-05, atol = 1e-08, chunksize = 1_000_000):
+  if isinstance(key, str): key = [key]
+  bild.assert_count(chunksize, lower = 1, arg_name = 'chunksize')
+  value_cols = [v for v in df1.columns if (v not in key) and (v in df2.columns)]
+  number_col = df1[value_cols].select_dtypes(include = 'number').columns
+
+  key1 = _key_index(df1, key)
+  key2 = _key_index(df2, key)
+  assert key1.is_unique and key2.is_unique, "values of 'key' must be unique in each data frame."
+
+  # キーで行を対応付けます（-1 は対応する行がないことを表します）。
+  pos2 = key2.get_indexer(key1)
+  removed = np.flatnonzero(pos2 == -1)
+  added = np.flatnonzero(key1.get_indexer(key2) == -1)
+
+  # 行の内容のハッシュ値が異なる行だけを比較の対象とします。
+  common = np.flatnonzero(pos2 != -1)
+  h1 = _row_hash(df1[value_cols], chunksize)
+  h2 = _row_hash(df2[value_cols], chunksize)
+  cand1 = common[h1[common] != h2[pos2[common]]]
+  cand2 = pos2[cand1]
+
+  result_list = []
+  for start in range(0, len(cand1), chunksize):
+    sub1 = df1.iloc[cand1[start:start + chunksize]]
+    sub2 = df2.iloc[cand2[start:start + chunksize]]
+    for v in value_cols:
+      x1 = sub1[v].to_numpy()
+      x2 = sub2[v].to_numpy()
+      # 片方だけが欠測値の行は変更とし、値の比較は両方とも欠測値でない行だけで行います。
+      # Int64 や string など nullable な型の pd.NA は比較の結果も NA となり、bool に変換できないためです。
+      na1, na2 = pd.isna(x1), pd.isna(x2)
+      differ = na1 != na2
+      both = ~(na1 | na2)
+      if v in number_col:
+        differ[both] = ~np.isclose(
+            x1[both].astype('float64'), x2[both].astype('float64'), rtol = rtol, atol = atol
+            )
+      else:
+        differ[both] = x1[both] != x2[both]
+      if differ.any():
+        res = sub1.loc[differ, key].reset_index(drop = True)
+        res['status'] = 'changed'
+        res['column'] = v
+        res['df1'] = pd.Series(x1[differ], dtype = object)
+        res['df2'] = pd.Series(x2[differ], dtype = object)
+        result_list.append(res)
+
+  for status, df, pos in [('removed', df1, removed), ('added', df2, added)]:
+    if len(pos) > 0:
+      res = df.iloc[pos][key].reset_index(drop = True)
+      res['status'] = status
+      result_list.append(res)
+
+  columns = key + ['status', 'column', 'df1', 'df2']
+  if len(result_list) == 0:
+    return pd.DataFrame(columns = columns)
+  return pd.concat(result_list, ignore_index = True).reindex(columns = columns)
 
 
 # ## グループ別平均（中央値）の比較
@@ -177,16 +545,21 @@ def compare_group_means(group1, group2, group_names = ['group1', 'group2']):
   group1 = remove_constant(group1)
   group2 = remove_constant(group2)
 
+  res = _group_means_table(
+      group1.mean(numeric_only = True), group2.mean(numeric_only = True),
+      group1.var(numeric_only = True), group2.var(numeric_only = True),
+      group1.shape[0], group2.shape[0],
+      group_names = group_names
+      )
+  return res
+
+def _group_means_table(mean1, mean2, s2A, s2B, nA, nB, group_names = ['group1', 'group2']):
+  """グループ別の平均値と分散から、compare_group_means() の集計表を作成します。"""
   res = pd.DataFrame({
-    group_names[0]:group1.mean(numeric_only = True),
-    group_names[1]:group2.mean(numeric_only = True)
+    group_names[0]:mean1,
+    group_names[1]:mean2
     })
 
-  s2A = group1.var(numeric_only = True)
-  s2B = group2.var(numeric_only = True)
-  nA = group1.shape[0]
-  nB = group2.shape[0]
-
   s2_pooled = ((nA - 1) * s2A + (nB - 1) * s2B) / (nA + nB - 2)
   res['norm_diff'] = (res[group_names[0]] - res[group_names[1]]) / np.sqrt(s2_pooled)
 
@@ -204,9 +577,17 @@ def compare_group_median(group1, group2, group_names = ['group1', 'group2']):
   group1 = remove_constant(group1)
   group2 = remove_constant(group2)
 
+  res = _group_median_table(
+      group1.median(numeric_only = True), group2.median(numeric_only = True),
+      group_names = group_names
+      )
+  return res
+
+def _group_median_table(median1, median2, group_names = ['group1', 'group2']):
+  """グループ別の中央値から、compare_group_median() の集計表を作成します。"""
   res = pd.DataFrame({
-    group_names[0]:group1.median(numeric_only = True),
-    group_names[1]:group2.median(numeric_only = True)
+    group_names[0]:median1,
+    group_names[1]:median2
     })
 
   res['abs_diff'] = (res[group_names[0]] - res[group_names[1]]).abs()
@@ -317,6 +698,95 @@ def remove_constant(self, quiet = True, dropna = False):
 # In[ ]:
 
 
+def _scan_column(x, empty = True, constant = True, dropna = False, block_size = 1024):
+  """
+  列が空白列（'empty'）か定数列（'constant'）かを判定し、どちらでもなければ None を返します。
+  列を先頭から徐々に大きくしたブロックごとに調べ、欠測値以外の最初の値と異なる値が見つかった時点で打ち切ります。
+  """
+  if isinstance(x.dtype, pd.CategoricalDtype):
+    values = x.cat.codes.to_numpy()
+    isna = lambda v: v < 0
+  else:
+    values = x.to_numpy()
+    isna = pd.isna
+  n = len(values)
+  if n == 0: return None
+
+  first = None
+  has_na = False
+  start = 0
+  while start < n:
+    chunk = values[start:start + block_size]
+    is_na = isna(chunk)
+    has_na = has_na or bool(is_na.any())
+    if first is None:
+      position = np.flatnonzero(~is_na)
+      if len(position) > 0: first = chunk[position[0]]
+    if first is not None:
+      # 欠測値以外の値が見つかった時点で、空白列ではないことが確定します。
+      if not constant: return None
+      # dropna = False では、欠測値と1種類の値からなる列は定数列ではありません。
+      if has_na and not dropna: return None
+      if np.any(chunk[~is_na] != first): return None
+    start += block_size
+    block_size *= 2
+
+  if first is None:
+    if empty: return 'empty'
+    # 全て欠測値の列は、dropna = False であれば nunique() == 1 の定数列です。
+    return 'constant' if constant and not dropna else None
+  return 'constant'
+
+@pf.register_dataframe_method
+def prune(self, empty = True, constant = True, dropna = False, n_jobs = 1, backend = 'thread'):
+  """
+  空白列・空白行（`empty = True`）と定数列（`constant = True`）をまとめて除外し、除外後のデータフレームと除外した列（行）の一覧を返します。
+  結果は `self.remove_empty().remove_constant(dropna = dropna)` と同じで、空白列、空白行、定数列の順に判定します。
+  各列は `_scan_column()` で判定するため、2種類目の値（空白列の判定では最初の欠測値以外の値）が見つかった時点で走査を打ち切ります。
+  """
+  report = []
+  def scan(data, **kwargs):
+    reason = _map_columns(
+        functools.partial(_scan_column, dropna = dropna, **kwargs),
+        [data.iloc[:, j] for j in range(data.shape[1])],
+        n_jobs = n_jobs, backend = backend
+        )
+    report.append(pd.DataFrame({
+        'axis':'columns',
+        'name':[v for v, r in zip(data.columns, reason) if r is not None],
+        'reason':[r for r in reason if r is not None]
+        }))
+    keep = [r is None for r in reason]
+    return data if all(keep) else data.loc[:, keep]
+
+  if empty:
+    # 空白列の判定は、欠測値以外の最初の値が見つかった時点で打ち切ります。
+    self = scan(self, empty = True, constant = False)
+
+  if empty and self.shape[1] > 0:
+    empty_rows = np.ones(len(self), dtype = bool)
+    for j in range(self.shape[1]):
+      empty_rows &= self.iloc[:, j].isna().to_numpy()
+      # 空白行の候補がなくなった時点で打ち切ります。
+      if not empty_rows.any(): break
+    if empty_rows.any():
+      report.append(pd.DataFrame({
+          'axis':'index', 'name':self.index[empty_rows], 'reason':'empty'
+          }))
+      self = self.loc[~empty_rows, :]
+
+  if constant:
+    # 定数列は空白行を除いたデータで判定します。
+    self = scan(self, empty = False, constant = True)
+
+  report = pd.concat(report, ignore_index = True) if len(report) > 0 \
+    else pd.DataFrame(columns = ['axis', 'name', 'reason'])
+  return self, report
+
+
+# In[ ]:
+
+
 # 列名に特定の文字列を含む列を除外する関数
 @pf.register_dataframe_method
 def filtering_out(self, contains = None, starts_with = None, ends_with = None, axis = 1):
@@ -378,16 +848,96 @@ def crosstab2(
 
 @pf.register_dataframe_method
 @singledispatch
-def freq_table(self, subset, sort = True, ascending = False, dropna = False):
+def freq_table(
+    self, subset, sort = True, ascending = False, dropna = False,
+    top_k = None, other_name = 'other'
+    ):
+  # 度数は1回だけ集計し、相対度数はその結果から計算します。
   count = self.value_counts(
-      subset = subset, sort = sort, ascending = ascending,
+      subset = subset, sort = sort and (top_k is None), ascending = ascending,
       normalize=False, dropna = dropna
       )
+  total = count.sum()
+
+  if top_k is not None:
+    count = _top_k_with_other(
+        count, top_k, total = total, sort = sort, ascending = ascending, other_name = other_name
+        )
+
+  rel_count = count / total
+
+  res = pd.DataFrame({
+          'freq':count,
+          'perc':rel_count,
+          'cumfreq':count.cumsum(),
+          'cumperc':rel_count.cumsum()
+      })
+  return res
+
+def _top_k_with_other(count, top_k, total, sort = True, ascending = False, other_name = 'other'):
+  """度数の上位 top_k 件を部分選択で抽出し、残りの度数の合計を other_name の行として追加します。"""
+  bild.assert_count(top_k, lower = 1, arg_name = 'top_k')
+  if len(count) <= top_k:
+    return count.sort_values(ascending = ascending) if sort else count
+
+  # 全体をソートせずに上位（ascending = True なら下位）top_k 件だけを位置で選択します。
+  # 欠測値を含む MultiIndex でも動作するように、ラベルではなく位置を使います。
+  key = count.to_numpy() if ascending else -count.to_numpy()
+  kth = np.partition(key, top_k - 1)[top_k - 1]
+  is_top = key < kth
+  # 境界の度数が同じ場合は、先に現れたものを選択します（nlargest(keep = 'first') と同じ）。
+  is_top[np.flatnonzero(key == kth)[:top_k - is_top.sum()]] = True
+  pos = np.flatnonzero(is_top)
+  if sort:
+    top = count.iloc[pos[np.argsort(key[pos], kind = 'stable')]]
+  else:
+    top = count.iloc[pos].sort_index()
 
-  rel_count = self.value_counts(
-      subset = subset, sort = sort, ascending = ascending,
-      normalize=True, dropna = dropna
+  if isinstance(count.index, pd.MultiIndex):
+    other_key = (other_name, ) + ('', ) * (count.index.nlevels - 1)
+  else:
+    other_key = other_name
+  other = pd.Series(
+      [total - top.sum()],
+      index = pd.Index([other_key], tupleize_cols = True, name = count.index.name) \
+        if not isinstance(count.index, pd.MultiIndex) \
+        else pd.MultiIndex.from_tuples([other_key], names = count.index.names),
+      name = count.name
       )
+  return pd.concat([top, other])
+
+
+# In[ ]:
+
+
+def freq_table_stream(
+    data, subset, top_k = 10, capacity = None, dropna = False,
+    other_name = 'other', chunksize = 100_000, **kwargs
+    ):
+  """
+  ファイルまたはデータフレームのイテラブルを分割して読み込みながら、上位 `top_k` 件の近似的な度数分布表を計算します。
+  度数は Misra-Gries の要約で推定するため、保持するカウンターの数は `capacity`（初期設定は `10 * top_k`）個に抑えられます。
+  推定された `freq` は真の度数の下限で、誤差は最大で `総度数 / (capacity + 1)` です。
+  推定誤差に相当する度数は `other_name` の行に含まれます。
+  """
+  bild.assert_count(top_k, lower = 1, arg_name = 'top_k')
+  if capacity is None: capacity = 10 * top_k
+  bild.assert_count(capacity, lower = top_k, arg_name = 'capacity')
+  if isinstance(subset, str): subset = [subset]
+
+  summary = MisraGries(capacity)
+  for chunk in bild.read_chunks(data, chunksize = chunksize, **kwargs):
+    summary.update(chunk[subset], dropna = dropna)
+
+  count = summary.top()
+  if len(subset) == 1:
+    count.index = count.index.get_level_values(0) \
+      if isinstance(count.index, pd.MultiIndex) else count.index
+  count.index.names = subset
+  count.name = 'count'
+
+  count = _top_k_with_other(count, top_k, total = summary.n, other_name = other_name)
+  rel_count = count / summary.n
 
   res = pd.DataFrame({
           'freq':count,
@@ -421,40 +971,115 @@ def tabyl(
           arg_name = 'normalize'
           )
 
-    if self[index].dtype == "bool":
-        self[index] = self[index].astype(str)
-    if self[columns].dtype == "bool":
-        self[columns] = self[columns].astype(str)
+    # 入力されたデータフレームを書き換えないように、bool 型の列は集計用のコピーで文字列に変換します。
+    row = self[index].astype(str) if self[index].dtype == "bool" else self[index]
+    col = self[columns].astype(str) if self[columns].dtype == "bool" else self[columns]
 
     # 度数クロス集計表（最終的な表では左側の数字）
     c_tab1 = pd.crosstab(
-        index = self[index], columns = self[columns], values = None,
+        index = row, columns = col, values = None,
         rownames = rownames, colnames = colnames,
         aggfunc = None, margins = margins, margins_name = margins_name,
         dropna = dropna, normalize = False
         )
 
-    c_tab1 = c_tab1.apply(bild.style_number, digits = 0)
+    return TabylResult(
+        c_tab1, normalize = normalize,
+        margins = margins, margins_name = margins_name, digits = digits
+        )
 
-    if(normalize != False):
+def _normalize_crosstab(c_tab, normalize = 'index', margins = True, margins_name = 'All'):
+  """度数クロス集計表から、pd.crosstab(normalize = ...) と同じ相対度数の表を計算します。"""
+  if normalize is True: normalize = 'all'
+  # pd.crosstab() と同様に、相対度数は合計の行と列を除いた表から計算します。
+  body = c_tab.drop(index = margins_name, columns = margins_name) if margins else c_tab
+  if(normalize == 'index'):
+    res = body.div(body.sum(axis = 'columns'), axis = 'index')
+  elif(normalize == 'columns'):
+    res = body / body.sum(axis = 'index')
+  else:
+    res = body / body.to_numpy().sum()
+  if not margins: return res.fillna(0)
+
+  # 合計の行と列は、それぞれの合計値の構成比とします（欠測値の列が 0 となる pd.crosstab() の合計行でも同じ結果になります）。
+  col_margin = c_tab[margins_name].drop(index = margins_name)
+  row_margin = c_tab.loc[margins_name].drop(margins_name)
+  if normalize in ['columns', 'all']:
+    res = res.reindex(columns = c_tab.columns)
+    res[margins_name] = col_margin / col_margin.sum()
+  if normalize in ['index', 'all']:
+    res = res.reindex(index = c_tab.index)
+    res.loc[margins_name] = (row_margin / row_margin.sum()).reindex(res.columns)
+    if normalize == 'all': res.loc[margins_name, margins_name] = 1.0
+  return res.fillna(0)
+
+class TabylResult:
+  """
+  `tabyl()` の返り値。度数クロス集計表 `counts` だけを数値として保持し、
+  相対度数 `proportions` はそこから計算します。「度数 (相対度数%)」形式の文字列への変換は、
+  表示（`print()` や Jupyter での表示）や `to_frame()` の呼び出し時にはじめて行います。
+  `loc` や `to_csv()` など `pd.DataFrame` の属性には、文字列化した表を通してアクセスできます。
+  """
+  def __init__(self, counts, normalize = 'index', margins = True, margins_name = 'All', digits = 1):
+    bild.assert_count(digits, arg_name = 'digits')
+    self.counts = counts
+    self.normalize = normalize
+    self.margins = margins
+    self.margins_name = margins_name
+    self.digits = digits
+    self._rendered = None
+
+  @property
+  def proportions(self):
+    """相対度数のクロス集計表（normalize = False の場合は None）"""
+    if self.normalize is False: return None
+    return _normalize_crosstab(
+        self.counts, normalize = self.normalize,
+        margins = self.margins, margins_name = self.margins_name
+        )
 
-      # 回答率クロス集計表（最終的な表では括弧内の数字）
-      c_tab2 = pd.crosstab(
-          index = self[index], columns = self[columns], values = None,
-          rownames = rownames, colnames = colnames,
-          aggfunc = None, margins = margins, margins_name = margins_name,
-          dropna = dropna, normalize = normalize
-          )
+  def to_frame(self, digits = None):
+    """各セルを「度数 (相対度数%)」の形式の文字列に変換した pd.DataFrame を返します。"""
+    if digits is None:
+      if self._rendered is None: self._rendered = self._render(self.digits)
+      return self._rendered
+    return self._render(digits)
 
-      # 2つめのクロス集計表の回答率をdigitsで指定した桁数のパーセントに換算し、文字列化します。
-      c_tab2 = c_tab2.apply(bild.style_percent, digits = digits)
+  def _render(self, digits):
+    # 度数クロス集計表（最終的な表では左側の数字）
+    c_tab_str = pd.DataFrame(
+        bild.format_number(self.counts.to_numpy(), digits = 0),
+        index = self.counts.index, columns = self.counts.columns
+        )
+
+    if(self.normalize is not False):
+      # 回答率クロス集計表（最終的な表では括弧内の数字）は、度数クロス集計表から計算します。
+      c_tab2 = self.proportions
+      pct = bild.format_number(100 * c_tab2.to_numpy(), digits = digits, big_mark = '', suffix = '%')
+
+      # 相対度数が計算されているセルにだけ、丸括弧で囲んだパーセントを追加します。
+      row_pos = c_tab_str.index.get_indexer(c_tab2.index)
+      col_pos = c_tab_str.columns.get_indexer(c_tab2.columns)
+      cells = c_tab_str.to_numpy()
+      cells[np.ix_(row_pos, col_pos)] = cells[np.ix_(row_pos, col_pos)] + ' (' + pct + ')'
+      c_tab_str = pd.DataFrame(cells, index = c_tab_str.index, columns = c_tab_str.columns)
+
+    return c_tab_str
+
+  def __repr__(self): return repr(self.to_frame())
 
-      col = c_tab2.columns
-      idx = c_tab2.index
-      # 1つめのクロス集計表も文字列化して、↑で計算したパーセントに丸括弧と%記号を追加したものを文字列として結合します。
-      c_tab1.loc[idx, col] = c_tab1.astype('str').loc[idx, col] + ' (' + c_tab2 + ')'
+  def __str__(self): return str(self.to_frame())
 
-    return c_tab1
+  def _repr_html_(self): return self.to_frame()._repr_html_()
+
+  def __getitem__(self, key): return self.to_frame()[key]
+
+  def __len__(self): return len(self.counts)
+
+  def __getattr__(self, name):
+    # 属性が見つからない場合は、文字列化した表の属性を返します。
+    if name.startswith('_'): raise AttributeError(name)
+    return getattr(self.to_frame(), name)
 
 
 # ## `diagnose_category()`：カテゴリー変数専用の要約関数
@@ -490,32 +1115,88 @@ def freq_mode(x, normalize = False):
     res = x.value_counts(normalize = normalize, dropna = False).iloc[0]
     return res
 
+# In[ ]:
+
+
+import concurrent.futures
+
+def _map_columns(fun, columns, n_jobs = 1, backend = 'thread'):
+  """列（pd.Series）のリストに関数 fun を適用します。n_jobs > 1 ならスレッドまたはプロセスで並列化します。"""
+  bild.assert_count(n_jobs, lower = 1, arg_name = 'n_jobs')
+  backend = bild.arg_match(backend, ['thread', 'process'], arg_name = 'backend')
+
+  if n_jobs == 1 or len(columns) <= 1:
+    return [fun(x) for x in columns]
+
+  if backend == 'thread':
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = n_jobs)
+  else:
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = n_jobs)
+
+  with executor:
+    res = list(executor.map(fun, columns))
+  return res
+
+
+# In[ ]:
+
+
+def _summarise_category(x):
+  """1回の value_counts() の結果から、diagnose_category() の集計値を計算します。"""
+  n = len(x)
+  vc = x.value_counts(dropna = False, sort = True)
+  # 観測されていないカテゴリーは除外します。
+  vc = vc[vc > 0]
+
+  # 01のダミー変数はロジカル変数として扱います。
+  if pandas.api.types.is_numeric_dtype(x) and not pandas.api.types.is_bool_dtype(x):
+    vc.index = vc.index == 1
+
+  is_na = vc.index.isna()
+  n_na = vc[is_na].sum()
+  non_na = vc[~is_na]
+  K = len(non_na)
+
+  res = {
+      'count':n - n_na,
+      'missing_percent':100 * (n_na / n),
+      'unique':K,
+      'unique_percent':100 * len(vc) / n,
+      'top':non_na.index[0] if K > 0 else np.nan,
+      'freq':non_na.iloc[0] if K > 0 else 0,
+      'pct_mode':100 * ((non_na.iloc[0] if K > 0 else 0) / n),
+      'std_entropy':sp.stats.entropy(pk = non_na.to_numpy(), base = K) if K > 1 else 0.0
+  }
+  return res
+
 # カテゴリカル変数についての概要を示す関数
-def diagnose_category(data):
-    # 01のダミー変数はロジカル変数に変換
-    data = data.copy()
-    data.loc[:, is_dummy(data)] = (data.loc[:, is_dummy(data)] == 1)
-    # 文字列 or カテゴリー変数のみ抽出
-    data = data.select_dtypes(include = [object, 'category', bool])
-
-    n = len(data)
-    # describe で集計表の大まかな形を作成
-    res = data.describe().T
-    res['freq'] = res['freq'].astype('int')
-    # 追加の集計値を計算して代入
-    res = res.assign(
-        unique_percent = 100 * data.nunique(dropna = False) / n,
-        missing_percent = missing_percent(data),
-        pct_mode = (100 * (res['freq'] / n)),
-        std_entropy = data.agg(std_entropy)
-    )
-    # 見やすいように並べ替え
-    res = res.loc[:, [
+def diagnose_category(data, n_jobs = 1, backend = 'thread'):
+  """
+  文字列、カテゴリー、bool 型の列と、0 と 1 からなるダミー変数の列について要約します。
+  各列の度数は `value_counts()` で1回だけ集計し、全ての集計値をその結果から計算します。
+  `n_jobs > 1` を指定すると、列毎の集計をスレッド（`backend = 'thread'`）またはプロセス（`backend = 'process'`）で並列化します。
+  """
+  # 文字列 or カテゴリー変数、および01のダミー変数を抽出
+  target = []
+  for col, x in data.items():
+    if isinstance(x.dtype, pd.CategoricalDtype) or \
+       pandas.api.types.is_object_dtype(x) or pandas.api.types.is_bool_dtype(x):
+      target.append(col)
+    elif pandas.api.types.is_numeric_dtype(x) and is_dummy(x):
+      target.append(col)
+
+  result = _map_columns(
+      _summarise_category, [data[col] for col in target],
+      n_jobs = n_jobs, backend = backend
+      )
+
+  res = pd.DataFrame(result, index = target, columns = [
         'count', 'missing_percent', 'unique', 'unique_percent',
         'top', 'freq', 'pct_mode', 'std_entropy'
-        ]]
+        ])
+  res = res.astype({'count':'int64', 'unique':'int64', 'freq':'int64'})
 
-    return res
+  return res
 
 
 # ## その他の補助関数
@@ -544,20 +1225,21 @@ def min_max(x):
 import matplotlib.pyplot as plt
 
 # パレート図に使用するランキングを作成する関数
-def make_rank_table(data, group, values, aggfunc = 'sum'):
-    # ピボットテーブルを使って、カテゴリー group（例：メーカー）ごとの values （例：販売額）の合計を計算
-    p_table = pd.pivot_table(
-        data = data,
-        index = group,
-        values = values,
-        aggfunc = aggfunc,
-        fill_value = 0
-        )
-    # values の値に基づいてソート
-    rank_table = p_table.sort_values(values, ascending=False)
+def make_rank_table(data, group, values, aggfunc = 'sum', top_n = None, other_name = 'others'):
+    # カテゴリー group（例：メーカー）ごとの values （例：販売額）の合計を計算
+    agg = data.groupby(group, observed = False)[values].agg(aggfunc).fillna(0)
+    total = agg.sum()
+
+    if top_n is None:
+      # values の値に基づいてソート
+      agg = agg.sort_values(ascending = False)
+    else:
+      # 上位 top_n 件だけを部分選択し、残りのカテゴリーは other_name の行にまとめます。
+      agg = _top_k_with_other(agg, top_n, total = total, other_name = other_name)
+    rank_table = agg.to_frame(values)
 
     # シェア率と累積相対度数を計算
-    rank_table['share'] = (rank_table[values] / rank_table[values].sum())
+    rank_table['share'] = (rank_table[values] / total)
     rank_table['cumshare'] = rank_table['share'].cumsum()
     return rank_table
 
@@ -583,11 +1265,12 @@ def Pareto_plot(
   bild.assert_character(palette)
 
   # 指定された変数でのランクを表すデータフレームを作成
+  # top_n が指定されていた場合、上位 top_n 件だけを部分選択で集計します。
   if values is None:
-      shere_rank = freq_table(data, group, dropna = True)
+      shere_rank = freq_table(data, group, dropna = True, top_k = top_n)
       cumlative = 'cumfreq'
   else:
-      shere_rank = make_rank_table(data, group, values, aggfunc = aggfunc)
+      shere_rank = make_rank_table(data, group, values, aggfunc = aggfunc, top_n = top_n)
       cumlative = 'cumshare'
 
   # グラフの描画
@@ -596,7 +1279,7 @@ def Pareto_plot(
 
   # yで指定された変数の棒グラフ
 
-  # top_n が指定されていた場合、上位 top_n 件を抽出します。
+  # 描画するのは上位 top_n 件のみで、残りをまとめた行は含めません。
   if top_n is not None:
     shere_rank = shere_rank.head(top_n)
 
@@ -656,47 +1339,103 @@ def Pareto_plot(
 # In[ ]:
 
 
+def _var_name(self):
+  if(isinstance(self, pd.DataFrame)):
+    return self.columns
+  return [self.name]
+
+def _long_by_variable(table_dict):
+  """グループ×変数の表を (グループ, variable) を index とする縦長のデータフレームにまとめます。"""
+  first = list(table_dict.values())[0]
+  n_var = first.shape[1]
+  idx = first.index.repeat(n_var)
+  levels = [idx.get_level_values(i) for i in range(idx.nlevels)]
+  index = pd.MultiIndex.from_arrays(
+      levels + [np.tile(first.columns, len(first))],
+      names = list(first.index.names) + ['variable']
+      )
+  return pd.DataFrame({
+      key:table.to_numpy().ravel() for key, table in table_dict.items()
+      }, index = index)
+
+def _groupby(self, by):
+  # Series のグループ集計も列名を持つ表として扱います。
+  if isinstance(self, pd.Series): self = self.to_frame()
+  return self.groupby(by, sort = True, observed = True)
+
+def _point_qi(self, point_fun, width, by = None):
+  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'width')
+
+  if by is None:
+    # 下限と上限は1回の quantile() で計算します。
+    qi = self.quantile([1 - width, width])
+    res = pd.DataFrame({
+        point_fun:self.apply(point_fun),
+        'lower':qi.iloc[0],
+        'upper':qi.iloc[1],
+    }, index = _var_name(self)
+    )
+    res.index.name = 'variable'
+    return res
+
+  grouped = _groupby(self, by)
+  qi = grouped.quantile([1 - width, width])
+  point = grouped.agg(point_fun)
+  # quantile() の結果は index の最後の水準が確率になっています。
+  q_level = qi.index.get_level_values(-1)
+  lower = qi[q_level == 1 - width].set_axis(point.index)
+  upper = qi[q_level == width].set_axis(point.index)
+  return _long_by_variable({point_fun:point, 'lower':lower, 'upper':upper})
+
 @pf.register_dataframe_method
 @pf.register_series_method
-def mean_qi(self, width = 0.975, point_fun = 'mean'):
+def mean_qi(self, width = 0.975, point_fun = 'mean', by = None):
+  return _point_qi(self, 'mean', width, by = by)
 
-  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither')
-  if(isinstance(self, pd.DataFrame)):
-    var_name = self.columns
-  else:
-    var_name = [self.name]
 
-  res = pd.DataFrame({
-      'mean':self.apply('mean'),
-      'lower':self.quantile(1 - width),
-      'upper':self.quantile(width),
-  }, index = var_name
-  )
+# In[ ]:
 
-  res.index.name = 'variable'
-  return res
+
+@pf.register_dataframe_method
+@pf.register_series_method
+def median_qi(self, width = 0.975, point_fun = 'median', by = None):
+  return _point_qi(self, 'median', width, by = by)
 
 
 # In[ ]:
 
 
+from scipy.stats import t
 @pf.register_dataframe_method
 @pf.register_series_method
-def median_qi(self, width = 0.975, point_fun = 'median'):
+def mean_ci(self, width = 0.95, by = None):
 
-  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither')
-  if(isinstance(self, pd.DataFrame)):
-    var_name = self.columns
+  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'width')
+
+  if by is None:
+    n = len(self)
+    x_mean = self.mean()
+    x_std = self.std()
   else:
-    var_name = [self.name]
+    grouped = _groupby(self, by)
+    stats = grouped.agg(['size', 'mean', 'std'])
+    n = stats.xs('size', axis = 'columns', level = 1)
+    x_mean = stats.xs('mean', axis = 'columns', level = 1)
+    x_std = stats.xs('std', axis = 'columns', level = 1)
 
-  res = pd.DataFrame({
-      'median':self.apply('median'),
-      'lower':self.quantile(1 - width),
-      'upper':self.quantile(width),
-  }, index = var_name
-  )
+  t_alpha = t.isf((1 - width) / 2, df = n - 1)
+  lower = x_mean - t_alpha * x_std / np.sqrt(n)
+  upper = x_mean + t_alpha * x_std / np.sqrt(n)
+
+  if by is not None:
+    return _long_by_variable({'mean':x_mean, 'lower':lower, 'upper':upper})
 
+  res = pd.DataFrame({
+      'mean':x_mean,
+      'lower':lower,
+      'upper':upper,
+      }, index = _var_name(self)
+    )
   res.index.name = 'variable'
   return res
 
@@ -704,28 +1443,229 @@ def median_qi(self, width = 0.975, point_fun = 'median'):
 # In[ ]:
 
 
-from scipy.stats import t
+# boot_ci() で使用する統計量。いずれも (リサンプル数, n) の配列を行毎に集計します。
+_BOOT_STATS = {
+    'mean':lambda a: a.mean(axis = -1),
+    'median':lambda a: np.median(a, axis = -1),
+    'std':lambda a: a.std(axis = -1, ddof = 1),
+    'var':lambda a: a.var(axis = -1, ddof = 1),
+}
+
+def _boot_stat_fun(stat):
+  if isinstance(stat, str): return _BOOT_STATS[stat]
+  return functools.partial(stat, axis = -1)
+
+_boot_data = None
+
+def _boot_init(x):
+  """プロセスごとにデータを1回だけ受け取ります。"""
+  global _boot_data
+  _boot_data = x
+
+def _boot_batch(args):
+  stat, size, seed, x = args
+  if x is None: x = _boot_data
+  stat_fun = _boot_stat_fun(stat)
+  rng = np.random.default_rng(seed)
+  dtype = np.int32 if len(x) < 2 ** 31 else np.int64
+  index = rng.integers(0, len(x), size = (size, len(x)), dtype = dtype)
+  return np.asarray(stat_fun(x[index]), dtype = 'float64')
+
+def _boot_replicates(x, stat, B, batch_size, n_jobs, backend, seed):
+  n_batch = int(np.ceil(B / batch_size))
+  sizes = [batch_size] * (n_batch - 1) + [B - batch_size * (n_batch - 1)]
+  # バッチ毎に独立した乱数列を用いるため、結果は n_jobs に依存しません。
+  seeds = seed.spawn(n_batch)
+
+  if n_jobs == 1 or n_batch == 1:
+    res = [_boot_batch((stat, size, s, x)) for size, s in zip(sizes, seeds)]
+  elif backend == 'thread':
+    with concurrent.futures.ThreadPoolExecutor(max_workers = n_jobs) as executor:
+      res = list(executor.map(_boot_batch, [(stat, size, s, x) for size, s in zip(sizes, seeds)]))
+  else:
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers = n_jobs, initializer = _boot_init, initargs = (x, )
+        ) as executor:
+      res = list(executor.map(_boot_batch, [(stat, size, s, None) for size, s in zip(sizes, seeds)]))
+  return np.concatenate(res)
+
+def _jackknife(x, stat, n_block = 200):
+  """ジャックナイフ推定値。平均値は解析的に、それ以外は最大 n_block 個のブロックを除いて計算します。"""
+  n = len(x)
+  if stat == 'mean':
+    return (x.sum() - x) / (n - 1)
+  stat_fun = _boot_stat_fun(stat)
+  n_block = min(n, n_block)
+  block = np.arange(n) % n_block
+  return np.array([
+      stat_fun(x[block != b][np.newaxis, :])[0] for b in range(n_block)
+      ])
+
+def _boot_ci_1d(x, stat, B, width, method, batch_size, n_jobs, backend, seed):
+  x = pd.Series(x).dropna().to_numpy(dtype = 'float64')
+  stat_fun = _boot_stat_fun(stat)
+  theta = float(np.asarray(stat_fun(x[np.newaxis, :]))[0])
+  if batch_size is None:
+    # 1バッチで生成するインデックス行列が約 2^22 要素になるようにします。
+    batch_size = max(1, min(B, 2 ** 22 // max(len(x), 1)))
+  boot = _boot_replicates(x, stat, B, batch_size, n_jobs, backend, seed)
+
+  alpha = np.array([(1 - width) / 2, (1 + width) / 2])
+  if method == 'bca':
+    prop = (np.sum(boot < theta) + 0.5 * np.sum(boot == theta)) / B
+    prop = np.clip(prop, 1 / (B + 1), B / (B + 1))
+    z0 = sp.stats.norm.ppf(prop)
+    jack = _jackknife(x, stat)
+    d = jack.mean() - jack
+    denom = 6 * np.sum(d ** 2) ** 1.5
+    accel = np.sum(d ** 3) / denom if denom > 0 else 0.0
+    z = sp.stats.norm.ppf(alpha)
+    alpha = sp.stats.norm.cdf(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+
+  lower, upper = np.quantile(boot, alpha)
+  return theta, lower, upper
+
 @pf.register_dataframe_method
 @pf.register_series_method
-def mean_ci(self, width = 0.95):
+def boot_ci(
+    self, stat = 'mean', B = 1000, width = 0.95, method = 'percentile',
+    batch_size = None, n_jobs = 1, backend = 'process', random_state = None
+    ):
+  """
+  ブートストラップ法による信頼区間を計算します。
+  - `stat`：`'mean'`, `'median'`, `'std'`, `'var'` または `np.mean` のように `stat(a, axis = -1)` で2次元配列 a を行毎に集計する関数
+  - `method`：`'percentile'`（パーセンタイル法）または `'bca'`（BCa 法）
+  リサンプルは `batch_size` 個ずつインデックス行列として生成して統計量をまとめて計算し、
+  `n_jobs > 1` の場合はバッチをプロセス（`backend = 'process'`）またはスレッドに分散します。
+  各バッチの乱数列は `random_state` から `SeedSequence.spawn()` で生成するため、結果は `n_jobs` によらず再現できます。
+  """
+  if not callable(stat):
+    stat = bild.arg_match(stat, list(_BOOT_STATS.keys()), arg_name = 'stat')
+  bild.assert_count(B, lower = 1, arg_name = 'B')
+  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'width')
+  method = bild.arg_match(method, ['percentile', 'bca'], arg_name = 'method')
+  if batch_size is not None: bild.assert_count(batch_size, lower = 1, arg_name = 'batch_size')
+  bild.assert_count(n_jobs, lower = 1, arg_name = 'n_jobs')
+  backend = bild.arg_match(backend, ['thread', 'process'], arg_name = 'backend')
+
+  var_name = _var_name(self)
+  columns = [self[v] for v in var_name] if isinstance(self, pd.DataFrame) else [self]
+  seeds = np.random.SeedSequence(random_state).spawn(len(columns))
+
+  result = [
+      _boot_ci_1d(x, stat, B, width, method, batch_size, n_jobs, backend, seed)
+      for x, seed in zip(columns, seeds)
+      ]
+  stat_name = stat if isinstance(stat, str) else getattr(stat, '__name__', 'stat')
+  res = pd.DataFrame(result, index = var_name, columns = [stat_name, 'lower', 'upper'])
+  res.index.name = 'variable'
+  return res
 
-  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither')
-  if(isinstance(self, pd.DataFrame)):
-    var_name = self.columns
-  else:
-    var_name = [self.name]
 
-  n = len(self)
-  t_alpha = t.isf((1 - width) / 2, df = n - 1)
-  x_mean = self.mean()
-  x_std = self.std()
+# In[ ]:
 
-  res = pd.DataFrame({
-      'mean':x_mean,
-      'lower':x_mean - t_alpha * x_std / np.sqrt(n),
-      'upper':x_mean + t_alpha * x_std / np.sqrt(n),
-      }, index = var_name
-    )
+
+class KLLSketch:
+  """KLL スケッチによる分位点の近似計算
+
+  レベル h の要素は 2^h 個の観測値を代表し、各レベルの容量は上位のレベルから c = 2/3 の比率で小さくなります。
+  保持する要素数はデータの件数によらず高々 3k 程度で、分位点の順位の誤差（正規化した順位誤差）はおおむね 2.3 / k^0.97 以下です
+  （k = 200 のとき約 1.3%）。`merge()` で別のスケッチを結合できるため、チャンクやワーカーごとに作成したスケッチをまとめられます。
+  """
+  def __init__(self, k = 200, random_state = None):
+    bild.assert_count(k, lower = 8, arg_name = 'k')
+    self.k = k
+    self.n = 0
+    self.levels = [np.empty(0)]
+    self.rng = np.random.default_rng(random_state)
+
+  def _capacity(self, h):
+    depth = len(self.levels) - h - 1
+    return max(int(np.ceil(self.k * (2 / 3) ** depth)), 8)
+
+  def update(self, x):
+    """x の欠測値以外の値をスケッチに追加します。"""
+    x = pd.Series(x).dropna().to_numpy(dtype = 'float64')
+    self.n += len(x)
+    self.levels[0] = np.concatenate([self.levels[0], x])
+    return self._compress()
+
+  def merge(self, other):
+    """別のスケッチを結合します。"""
+    while len(self.levels) < len(other.levels): self.levels.append(np.empty(0))
+    for h, items in enumerate(other.levels):
+      self.levels[h] = np.concatenate([self.levels[h], items])
+    self.n += other.n
+    return self._compress()
+
+  def _compress(self):
+    h = 0
+    while h < len(self.levels):
+      items = self.levels[h]
+      if len(items) > self._capacity(h):
+        # レベルが増えると下位のレベルの容量が小さくなるため、最初のレベルから確認し直します。
+        added = h + 1 == len(self.levels)
+        if added: self.levels.append(np.empty(0))
+        items = np.sort(items)
+        # 要素数が奇数の場合は、最大値を1つこのレベルに残します。
+        keep = items[len(items) - len(items) % 2:]
+        items = items[:len(items) - len(items) % 2]
+        # 隣り合う2つの要素から無作為に一方を選び、重みを2倍にして上のレベルに移します。
+        offset = self.rng.integers(2)
+        self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[offset::2]])
+        self.levels[h] = keep
+        h = 0 if added else h + 1
+      else:
+        h += 1
+    return self
+
+  def quantile(self, q):
+    """分位点の推定値を返します。"""
+    q = np.asarray(q, dtype = 'float64')
+    if self.n == 0: return np.full(q.shape, np.nan) if q.ndim > 0 else np.nan
+    items = np.concatenate(self.levels)
+    weights = np.concatenate([
+        np.full(len(v), 2 ** h, dtype = 'float64') for h, v in enumerate(self.levels)
+        ])
+    order = np.argsort(items, kind = 'stable')
+    items = items[order]
+    cum_weights = np.cumsum(weights[order])
+    position = np.searchsorted(cum_weights, q * cum_weights[-1], side = 'left')
+    return items[np.clip(position, 0, len(items) - 1)]
+
+
+# In[ ]:
+
+
+def median_qi_stream(
+    data, subset = None, width = 0.975, k = 200,
+    chunksize = 100_000, random_state = None, **kwargs
+    ):
+  """
+  ファイルまたはデータフレームのイテラブルを分割して読み込みながら、`median_qi()` の近似値を計算します。
+  列毎に `KLLSketch` を作成するため、使用するメモリはデータの件数によらず一定です。
+  推定値の順位の誤差は、おおむね `2.3 / k^0.97` 以下です（k = 200 のとき約 1.3%）。
+  """
+  bild.assert_numeric(width, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'width')
+  if isinstance(subset, str): subset = [subset]
+
+  seeds = None
+  sketches = {}
+  for chunk in bild.read_chunks(data, chunksize = chunksize, **kwargs):
+    if subset is None:
+      subset = chunk.select_dtypes(include = 'number').columns.to_list()
+    if seeds is None:
+      seeds = np.random.SeedSequence(random_state).spawn(len(subset))
+      sketches = {
+          col: KLLSketch(k, random_state = seed) for col, seed in zip(subset, seeds)
+          }
+    for col in subset:
+      sketches[col].update(chunk[col])
+
+  res = pd.DataFrame(
+      [sketches[col].quantile([0.5, 1 - width, width]) for col in subset],
+      index = subset, columns = ['median', 'lower', 'upper']
+      )
   res.index.name = 'variable'
   return res
 
@@ -736,37 +1676,64 @@ def mean_ci(self, width = 0.95):
 
 
 import regex
+import re
+
+_KANZI_PATTERN = regex.compile(r'.*\p{Script=Han}+.*')
+
 def detect_Kanzi(s):
-  p = regex.compile(r'.*\p{Script=Han}+.*')
-  res = p.fullmatch(s)
+  res = _KANZI_PATTERN.fullmatch(s)
   return res is not None
 
 
 # In[ ]:
 
 
-@pf.register_series_method
-def is_number(self, na_default = True):
-  """文字列が数字であるかどうかを判定する関数"""
-  rex_phone = '[0-9]{0,4}(?: |-)[0-9]{0,4}(?: |-)[0-9]{0,4}'
-  rex_han = '[Script=Han]+'
+# 判定に使う正規表現はモジュールの読み込み時に一度だけコンパイルします。
+_REX_YMD = re.compile('[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}')
+_REX_YMD_LIKE = re.compile('[Script=Han]{0,2}[0-9]{1,4}(?:年|-)[0-9]{1,2}(?:月|-)[0-9]{1,2}(?:日)?')
+_REX_DIGIT = re.compile('[0-9]+')
+_REX_EXPONENT = re.compile('[0-9]+[E,e]+(?:\\+|-)[0-9]+')
+# 数字ではないと判定する条件（電話番号・ひらがな・カタカナ・アルファベット・日付）を1つにまとめたもの
+_REX_NOT_NUMBER = re.compile('|'.join([
+    '[0-9]{0,4}(?: |-)[0-9]{0,4}(?: |-)[0-9]{0,4}',
+    '[\u3041-\u309F]+',
+    '[\u30A1-\u30FF]+',
+    '[A-z]+',
+    _REX_YMD_LIKE.pattern
+    ]))
+
+def _classify_number(s):
+  if _REX_EXPONENT.search(s) is not None: return True
+  return (_REX_DIGIT.search(s) is not None) \
+    and (_REX_NOT_NUMBER.search(s) is None) \
+    and not detect_Kanzi(s)
+
+def _classify_distinct(self, classify, na_default):
+  """ユニーク値ごとに `classify` を1回だけ適用し、その結果を元の Series の形に戻します。"""
+  if isinstance(self.dtype, pd.CategoricalDtype):
+    codes = self.cat.codes.to_numpy()
+    uniques = self.cat.categories
+  else:
+    codes, uniques = pd.factorize(self)
+  uniques = pd.Index(uniques).astype(str)
 
-  self_str = self.copy().astype(str)
+  flags = np.fromiter(map(classify, uniques), dtype = bool, count = len(uniques))
+  # 欠測値のコード -1 は末尾の要素を参照します。
+  flags = np.append(flags, False)
 
-  res = self_str.str.contains('[0-9]+', regex = True)\
-    & ~ self_str.str.contains(rex_phone, regex = True)\
-    & ~ self_str.str.contains('[\u3041-\u309F]+', regex = True)\
-    & ~ self_str.str.contains('[\u30A1-\u30FF]+', regex = True)\
-    & ~ self_str.str.contains('[A-z]+', regex = True)\
-    & ~ self_str.map(detect_Kanzi)\
-    & ~ is_ymd_like(self_str)
+  res = pd.Series(flags[codes], index = self.index, name = self.name)
+  is_na = codes < 0
+  if is_na.any(): res.loc[is_na] = na_default
+  return res
 
-  exponent = self_str.str.contains('[0-9]+[E,e]+(?:\+|-)[0-9]+', regex = True)
-  res[exponent] = True
 
-  res[self.isna()] = na_default
+# In[ ]:
 
-  return res
+
+@pf.register_series_method
+def is_number(self, na_default = True):
+  """文字列が数字であるかどうかを判定する関数"""
+  return _classify_distinct(self, _classify_number, na_default)
 
 
 # In[ ]:
@@ -775,27 +1742,98 @@ def is_number(self, na_default = True):
 @pf.register_series_method
 def is_ymd(self, na_default = True):
   """与えられた文字列が ymd 形式の日付かどうかを判定する関数"""
-  rex_ymd = '[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}'
+  return _classify_distinct(
+      self, lambda s: _REX_YMD.search(s) is not None, na_default
+      )
 
-  self_str = self.copy().astype(str)
+@pf.register_series_method
+def is_ymd_like(self, na_default = True):
+  """与えられた文字列が ymd 形式っぽい日付かどうかを判定する関数"""
+  return _classify_distinct(
+      self, lambda s: _REX_YMD_LIKE.search(s) is not None, na_default
+      )
 
-  res = self_str.str.contains(rex_ymd, regex = True)
 
-  res[self.isna()] = na_default
+# In[ ]:
 
-  return res
 
-@pf.register_series_method
-def is_ymd_like(self, na_default = True):
-  """与えられた文字列が ymd 形式っぽい日付かどうかを判定する関数"""
-  rex_ymd_like = '[Script=Han]{0,2}[0-9]{1,4}(?:年|-)[0-9]{1,2}(?:月|-)[0-9]{1,2}(?:日)?'
+_REX_INTEGER = re.compile('[+-]?[0-9]+')
+
+def _wilson_interval(p, n, conf_level = 0.95):
+  """比率 p（標本サイズ n）の Wilson スコア信頼区間"""
+  z = sp.stats.norm.ppf(0.5 + conf_level / 2)
+  center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+  half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+  lower = 0.0 if p == 0 else max(center - half, 0.0)
+  upper = 1.0 if p == 1 else min(center + half, 1.0)
+  return lower, upper
+
+def _infer_column_type(args, sample = None, conf_level = 0.95, tol = 0.0):
+  x, seed = args
+  position = np.flatnonzero(x.notna().to_numpy())
+  n = len(position)
+  if sample is not None and n > sample:
+    rng = np.random.default_rng(seed)
+    position = np.sort(rng.choice(position, size = sample, replace = False))
+  x = x.iloc[position]
+  m = len(x)
+  if m == 0:
+    return [n, m, 'object', np.nan, np.nan, np.nan]
+
+  is_num = is_number(x).to_numpy(dtype = bool)
+  is_date = is_ymd(x).to_numpy(dtype = bool)
+  nonconform = {
+      'numeric':1 - is_num.mean(),
+      'datetime64[ns]':1 - is_date.mean()
+      }
+  suggested = min(nonconform, key = nonconform.get)
+  share = nonconform[suggested]
+  if share > tol:
+    suggested = 'object'
+  elif suggested == 'numeric':
+    is_int = _classify_distinct(
+        x[is_num], lambda s: _REX_INTEGER.fullmatch(s.strip()) is not None, True
+        )
+    suggested = 'Int64' if is_int.all() else 'float64'
 
-  self_str = self.copy().astype(str)
+  if m < n:
+    lower, upper = _wilson_interval(share, m, conf_level)
+  else:
+    lower, upper = share, share
+  return [n, m, suggested, share, lower, upper]
 
-  res = self_str.str.contains(rex_ymd_like, regex = True)
+def infer_types(
+    data, sample = None, tol = 0.0, conf_level = 0.95,
+    n_jobs = 1, backend = 'thread', random_state = None
+    ):
+  """
+  文字列とカテゴリー型の列について `is_number()` と `is_ymd()` で値を判定し、変換先のデータ型を提案します。
+  - `suggested`：変換先のデータ型の候補（`'Int64'`, `'float64'`, `'datetime64[ns]'`, `'object'`）
+  - `nonconform`：数値または日付の候補のうち、当てはまらない値の割合が小さい方の割合。これが `tol` を超える列は `'object'` とします。
+  - `lower`, `upper`：`sample` を指定した場合の `nonconform` の信頼区間（Wilson のスコア区間）
+  `sample` に整数を指定すると、各列の欠測値以外の値から `sample` 個を無作為に抽出して判定するため、列数の多いデータでも計算時間が抑えられます。
+  """
+  if sample is not None: bild.assert_count(sample, lower = 1, arg_name = 'sample')
+  bild.assert_numeric(tol, lower = 0, upper = 1, arg_name = 'tol')
+  bild.assert_numeric(conf_level, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'conf_level')
+
+  target = [
+      col for col, x in data.items()
+      if pandas.api.types.is_object_dtype(x) or pandas.api.types.is_string_dtype(x) \
+        or isinstance(x.dtype, pd.CategoricalDtype)
+      ]
+  seeds = np.random.SeedSequence(random_state).spawn(len(target))
 
-  res[self.isna()] = na_default
+  result = _map_columns(
+      functools.partial(_infer_column_type, sample = sample, conf_level = conf_level, tol = tol),
+      [(data[col], seed) for col, seed in zip(target, seeds)],
+      n_jobs = n_jobs, backend = backend
+      )
 
+  res = pd.DataFrame(result, index = target, columns = [
+      'count', 'sampled', 'suggested', 'nonconform', 'lower', 'upper'
+      ])
+  res.insert(0, 'dtype', [str(data[col].dtype) for col in target])
   return res
 
 
@@ -906,38 +1944,214 @@ def set_prop_miss(x, prop = 0.1, method = 'random', random_state = None, na_valu
 # In[ ]:
 
 
-@pf.register_dataframe_method
-def check_that(data, rule_dict, **kwargs):
-  if(isinstance(rule_dict, pd.Series)): rule_dict = rule_dict.to_dict()
+def _miss_weights(data, columns, mechanism, by, strength):
+  """各列で欠測値にする行を選ぶ重み（列数 × n の配列）。MCAR では全て1になります。"""
+  weights = np.ones((len(columns), len(data)))
+  if mechanism == 'MCAR': return weights
+
+  for j, col in enumerate(columns):
+    if mechanism == 'MAR':
+      driver = by.get(col) if isinstance(by, dict) else by
+      if driver is None or driver == col: continue
+    else:
+      driver = col
+    x = data[driver]
+    if not pandas.api.types.is_numeric_dtype(x) or pandas.api.types.is_bool_dtype(x):
+      x = x.astype('category').cat.codes.where(x.notna())
+    x = x.to_numpy(dtype = 'float64', na_value = np.nan)
+    sd = np.nanstd(x)
+    if not sd > 0: continue
+    z = np.nan_to_num((x - np.nanmean(x)) / sd)
+    weights[j] = np.exp(strength * z)
+  return weights
+
+def _draw_miss_mask(is_na, weights, n_add, rng):
+  """Efraimidis-Spirakis 法による重み付き非復元抽出で、各列 n_add[j] 行を選びます。"""
+  # 指数分布に従う乱数を重みで割った値が小さい順に選ぶことは、重みに比例した非復元抽出と同じです。
+  keys = rng.standard_exponential(weights.shape) / weights
+  keys[is_na] = np.inf
+  mask = np.zeros(weights.shape, dtype = bool)
+  for k in np.unique(n_add[n_add > 0]):
+    cols = np.flatnonzero(n_add == k)
+    position = np.argpartition(keys[cols], k - 1, axis = 1)[:, :k]
+    mask[cols[:, np.newaxis], position] = True
+  return mask
+
+def _miss_mask_setup(data, prop, mechanism, by, columns):
+  mechanism = bild.arg_match(mechanism, ['MCAR', 'MAR', 'MNAR'], arg_name = 'mechanism')
+  if columns is None: columns = data.columns.to_list()
+  if isinstance(columns, str): columns = [columns]
+  if mechanism == 'MAR':
+    assert by is not None, "argument 'by' must be specified when mechanism = 'MAR'."
+  if isinstance(prop, dict): prop = pd.Series(prop)
+  prop = pd.Series(prop, index = columns) if not isinstance(prop, pd.Series) \
+    else prop.reindex(columns).fillna(0)
+  bild.assert_numeric(prop, lower = 0, upper = 1, arg_name = 'prop')
+
+  # 列毎の処理が連続したメモリ上で行えるよう、配列は（列数 × n）の形で扱います。
+  is_na = data[columns].isna().to_numpy().T
+  n_miss = is_na.sum(axis = 1)
+  # set_prop_miss() と同様に、欠測率が約 prop になるよう不足分の欠測値を追加します。
+  n_add = np.round(len(data) * prop.to_numpy()).astype('int64') - n_miss
+  n_add = np.clip(n_add, 0, len(data) - n_miss)
+  return mechanism, columns, is_na, n_add
+
+def _mask_frame(mask, data, columns):
+  """（列数 × n）のマスクを、columns 以外の列を False とした data と同じ形のデータフレームにします。"""
+  res = np.zeros(data.shape, dtype = bool)
+  res[:, data.columns.get_indexer(columns)] = mask.T
+  return pd.DataFrame(res, index = data.index, columns = data.columns)
+
+def miss_mask(
+    data, prop = 0.1, mechanism = 'MCAR', by = None,
+    strength = 1.0, columns = None, random_state = None
+    ):
+  """
+  データフレームの各列の欠測率が約 `prop` になるように、新たに欠測値とする位置を True としたブール値のデータフレームを返します。
+  - `'MCAR'`：全ての行から等確率で選びます。
+  - `'MAR'`：`by` に指定した列（または列名から列名への辞書）の値が大きい行ほど選ばれやすくなります。
+  - `'MNAR'`：その列自身の値が大きい行ほど選ばれやすくなります。
+  選ばれやすさは標準化した値 z に対して `exp(strength * z)` に比例し、`strength` が負なら値が小さい行ほど選ばれやすくなります。
+  返り値は `data` と同じ行と列をもち、`columns` に含まれない列は全て False となるため、欠測値は `data.mask(mask)` で代入できます。
+  """
+  mechanism, columns, is_na, n_add = _miss_mask_setup(data, prop, mechanism, by, columns)
+  weights = _miss_weights(data, columns, mechanism, by, strength)
+  mask = _draw_miss_mask(is_na, weights, n_add, np.random.default_rng(random_state))
+  return _mask_frame(mask, data, columns)
+
+def miss_mask_rep(
+    data, n_rep, prop = 0.1, mechanism = 'MCAR', by = None,
+    strength = 1.0, columns = None, random_state = None
+    ):
+  """
+  `miss_mask()` のマスクを `n_rep` 個、順に生成するジェネレーターを返します。
+  重みの計算は1回だけ行い、各反復の乱数列は `random_state` から `SeedSequence.spawn()` で生成します。
+  """
+  bild.assert_count(n_rep, lower = 1, arg_name = 'n_rep')
+  mechanism, columns, is_na, n_add = _miss_mask_setup(data, prop, mechanism, by, columns)
+  weights = _miss_weights(data, columns, mechanism, by, strength)
 
-  [bild.assert_character(x, arg_name = 'rule_dict') for x in rule_dict.values()]
+  def generator():
+    for seed in np.random.SeedSequence(random_state).spawn(n_rep):
+      mask = _draw_miss_mask(is_na, weights, n_add, np.random.default_rng(seed))
+      yield _mask_frame(mask, data, columns)
+  return generator()
+
+
+# In[ ]:
 
-  result_list = []
-  for i, name in enumerate(rule_dict):
-    condition = data.eval(rule_dict[name], **kwargs)
-    condition = pd.Series(condition)
-    assert bild.is_logical(condition),\
-    f"Result of rule(s) must be of type 'bool'. But result of '{name}' is '{condition.dtype}'."
 
-    if len(condition) == len(data):
-      in_exper = [s in rule_dict[name] for s in data.columns]
-      any_na = data.loc[:, in_exper].isna().any(axis = 'columns')
-      condition[any_na] = pd.NA
-      condition = condition.astype('boolean')
+import ast
+
+# `DataFrame.eval()` で使われるバッククオートと `@` によるローカル変数の参照
+_BACKTICK_PATTERN = re.compile(r'`([^`]*)`')
+_LOCAL_VAR_PATTERN = re.compile(r'@(?=[A-Za-z_])')
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+def _rule_columns(expr, columns):
+  """expression を構文解析し、参照されている列名を重複なく返します。"""
+  quoted = _BACKTICK_PATTERN.findall(expr)
+  body = _BACKTICK_PATTERN.sub(' __backtick__ ', expr)
+  body = _LOCAL_VAR_PATTERN.sub('__local__', body)
+  try:
+    nodes = list(ast.walk(ast.parse(body.strip(), mode = 'eval')))
+    # `max(x)` のような関数呼び出しの関数名は列名として扱いません。
+    func_names = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    names = [
+        node.id for node in nodes
+        if isinstance(node, ast.Name) and id(node) not in func_names
+        ]
+  except SyntaxError:
+    # 構文解析できない場合は、文字列リテラルを除いた識別子で判定します。
+    body = re.sub(r"'[^']*'|\"[^\"]*\"", ' ', body)
+    names = _IDENTIFIER_PATTERN.findall(body)
+  cols = set(columns)
+  return list(dict.fromkeys(v for v in quoted + names if v in cols))
+
+def _eval_rules(data, rule_dict, **kwargs):
+  """
+  全てのルールを1つの複数行の式にまとめて1回の `DataFrame.eval()` で評価し、
+  ルールの結果と参照している列名の辞書を返します。
+  """
+  if(isinstance(rule_dict, pd.Series)): rule_dict = rule_dict.to_dict()
+  [bild.assert_character(x, arg_name = 'rule_dict') for x in rule_dict.values()]
 
-    res_df = pd.DataFrame({
-        'item':len(condition),
-        'passes':condition.sum(skipna = True),
-        'fails':(~condition).sum(skipna = True),
-        'coutna':condition.isna().sum(),
-        'expression':rule_dict[name]
-        }, index = [name])
+  names = list(rule_dict.keys())
+  rule_columns = {name: _rule_columns(rule_dict[name], data.columns) for name in names}
+  # 各ルールを `__rule_i__ = 式` の形の1行に変換し、結果を辞書に代入します。
+  program = '\n'.join(
+      f'__rule_{i}__ = ' + ' '.join(rule_dict[name].splitlines())
+      for i, name in enumerate(names)
+      )
 
-    result_list.append(res_df)
+  # どれかのルールで参照されている列だけを渡すことで、列数の多いデータでの評価を軽くします。
+  used = list(dict.fromkeys(v for name in names for v in rule_columns[name]))
+  target = pd.DataFrame({v: data[v] for v in used}, copy = False) if len(used) > 0 else data
+  results = {}
+  if len(names) > 0:
+    try:
+      target.eval(program, target = results, inplace = True, **kwargs)
+    except pd.errors.UndefinedVariableError:
+      results = {}
+      data.eval(program, target = results, inplace = True, **kwargs)
+
+  conditions = {}
+  for i, name in enumerate(names):
+    condition = results[f'__rule_{i}__']
+    assert bild.is_logical(pd.Series(condition)),\
+    f"Result of rule(s) must be of type 'bool'. But result of '{name}' is '{condition.dtype}'."
+    conditions[name] = condition
+  return rule_dict, conditions, rule_columns
+
+def _check_counts(data, rule_dict, **kwargs):
+  rule_dict, conditions, rule_columns = _eval_rules(data, rule_dict, **kwargs)
+  conditions = {name: pd.Series(condition) for name, condition in conditions.items()}
+
+  # 列毎の欠測値の判定はルールの間で共有します。
+  na_cache = {}
+  def na_mask(col):
+    if col not in na_cache:
+      na_cache[col] = data[col].isna().to_numpy()
+    return na_cache[col]
+
+  names = list(rule_dict.keys())
+  full = [name for name in names if len(conditions[name]) == len(data)]
+  counts = pd.DataFrame(
+      0, index = pd.Index(names, name = 'name'),
+      columns = ['item', 'passes', 'fails', 'coutna']
+      )
 
-  result_df = pd.concat(result_list)
-  result_df.index.name = 'name'
+  if len(full) > 0:
+    # 行数の一致するルールの結果を2次元配列にまとめて一度に集計します。
+    values = np.empty((len(full), len(data)), dtype = bool)
+    is_na = np.zeros((len(full), len(data)), dtype = bool)
+    for i, name in enumerate(full):
+      condition = conditions[name]
+      is_na[i] = condition.isna().to_numpy()
+      values[i] = condition.fillna(False).to_numpy(dtype = bool)
+      for col in rule_columns[name]:
+        is_na[i] |= na_mask(col)
+    coutna = is_na.sum(axis = 1)
+    passes = (values & ~is_na).sum(axis = 1)
+    counts.loc[full, 'item'] = len(data)
+    counts.loc[full, 'passes'] = passes
+    counts.loc[full, 'fails'] = len(data) - coutna - passes
+    counts.loc[full, 'coutna'] = coutna
+
+  for name in names:
+    if name in full: continue
+    condition = conditions[name]
+    counts.loc[name] = [
+        len(condition), condition.sum(skipna = True),
+        (~condition).sum(skipna = True), condition.isna().sum()
+        ]
+
+  return rule_dict, counts
 
+@pf.register_dataframe_method
+def check_that(data, rule_dict, **kwargs):
+  rule_dict, result_df = _check_counts(data, rule_dict, **kwargs)
+  result_df['expression'] = result_df.index.map(rule_dict)
   return result_df
 
 
@@ -946,16 +2160,12 @@ def check_that(data, rule_dict, **kwargs):
 
 @pf.register_dataframe_method
 def check_viorate(data, rule_dict, **kwargs):
-  if(isinstance(rule_dict, pd.Series)): rule_dict = rule_dict.to_dict()
-  [bild.assert_character(x, arg_name = 'rule_dict') for x in rule_dict.values()]
-
-  df_viorate = pd.DataFrame()
-  for i, name in enumerate(rule_dict):
-    condition = data.eval(rule_dict[name], **kwargs)
-    assert bild.is_logical(condition),\
-    f"Result of rule(s) must be of type 'bool'. But result of '{name}' is '{condition.dtype}'."
+  rule_dict, conditions, _ = _eval_rules(data, rule_dict, **kwargs)
 
-    df_viorate[name] = ~condition
+  df_viorate = pd.DataFrame(
+      {name: ~condition for name, condition in conditions.items()},
+      index = data.index
+      )
 
   df_viorate['any'] = df_viorate.any(axis = 'columns')
   df_viorate['all'] = df_viorate.all(axis = 'columns')
@@ -963,6 +2173,53 @@ def check_viorate(data, rule_dict, **kwargs):
   return df_viorate
 
 
+_CHECK_COUNT_COLUMNS = ['item', 'passes', 'fails', 'coutna']
+
+def _add_check_results(previous, result_df):
+  """`check_that()` の集計表どうしを、ルール名ごとに件数を足し合わせて結合します。"""
+  assert all(v in previous.columns for v in _CHECK_COUNT_COLUMNS + ['expression']), \
+    f"argument 'previous' must be a result of check_that() with columns {_CHECK_COUNT_COLUMNS + ['expression']}."
+
+  common = previous.index.intersection(result_df.index)
+  differ = common[previous.loc[common, 'expression'] != result_df.loc[common, 'expression']]
+  assert len(differ) == 0, \
+    f"expression of rule(s) {bild.oxford_comma_and(differ.to_list())} differ from 'previous'."
+
+  names = previous.index.append(result_df.index.difference(previous.index, sort = False))
+  counts = previous[_CHECK_COUNT_COLUMNS].reindex(names, fill_value = 0)\
+    .add(result_df[_CHECK_COUNT_COLUMNS].reindex(names, fill_value = 0))
+  counts['expression'] = previous['expression'].combine_first(result_df['expression'])
+  counts.index.name = 'name'
+  return counts
+
+def check_that_stream(
+    data, rule_dict, previous = None, chunksize = 100_000, read_kwargs = None, **kwargs
+    ):
+  """
+  ファイルまたはデータフレームのイテラブルを分割して読み込みながら、`check_that()` と同じ集計表を計算します。
+  `previous` に以前の集計結果を指定すると、その件数に新しいデータの件数を足し合わせます。
+  `profit.mean() > 0` のように結果が1つの値になるルールは、チャンク毎に評価されます。
+  """
+  if(isinstance(rule_dict, pd.Series)): rule_dict = rule_dict.to_dict()
+  read_kwargs = read_kwargs or {}
+
+  counts = pd.DataFrame(
+      0, index = pd.Index(list(rule_dict.keys()), name = 'name'),
+      columns = _CHECK_COUNT_COLUMNS
+      )
+  for chunk in bild.read_chunks(data, chunksize = chunksize, **read_kwargs):
+    _, res = _check_counts(chunk, rule_dict, **kwargs)
+    counts += res
+
+  result_df = counts
+  result_df['expression'] = result_df.index.map(rule_dict)
+
+  if previous is not None:
+    result_df = _add_check_results(previous, result_df)
+
+  return result_df
+
+
 # ### helper function for pandas `DataFrame.eval()`
 
 # In[ ]:
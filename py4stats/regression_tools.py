@@ -22,6 +22,9 @@ import statsmodels.api as sm
 import statsmodels.formula.api as smf
 
 import sys
+import os
+import html
+import importlib.util
 
 from py4stats import bilding_block as bild # py4stats のプログラミングを補助する関数群
 
@@ -223,7 +226,26 @@ def glance(x):
 @glance.register(PoissonResultsWrapper)
 @glance.register(NegativeBinomialResultsWrapper)
 def glance_glm(x):
-  res = pd.DataFrame({
+  res = pd.DataFrame(_glance_values(x), index = [0])
+  return res
+
+# 線形回帰用のメソッド
+@glance.register(RegressionResultsWrapper)
+def glance_ols(x):
+    res = pd.DataFrame(_glance_values(x), index = [0])
+    return res
+
+# glance() の1行分の値を辞書で返す関数 ------------------------------
+@singledispatch
+def _glance_values(x):
+  # 個別の実装がないモデルは glance() の結果から値を取り出します。
+  return glance(x).iloc[0].to_dict()
+
+@_glance_values.register(BinaryResultsWrapper)
+@_glance_values.register(PoissonResultsWrapper)
+@_glance_values.register(NegativeBinomialResultsWrapper)
+def _glance_values_glm(x):
+  return {
       'prsquared':x.prsquared,
       'LL-Null':x.llnull ,
       'df_null':x.nobs - 1,
@@ -234,24 +256,76 @@ def glance_glm(x):
       'nobs':x.nobs,
       'df': int(x.df_model),
       'df_resid':int(x.df_resid)
-  }, index = [0])
+  }
+
+@_glance_values.register(RegressionResultsWrapper)
+def _glance_values_ols(x):
+  return {
+      'rsquared':x.rsquared,
+      'rsquared_adj':x.rsquared_adj,
+      'nobs':int(x.nobs),
+      'df':int(x.df_model),
+      'sigma':np.sqrt(x.mse_resid),
+      'F_values':x.fvalue,
+      'p_values':x.f_pvalue,
+      'AIC':x.aic,
+      'BIC':x.bic
+  }
+
+
+# ### 複数のモデルをまとめて要約する関数
+
+# In[ ]:
+
+
+def _default_model_name(n):
+  return [f'model {i + 1}' for i in range(n)]
+
+def tidy_many(list_models, model_name = None, conf_level = 0.95):
+  """
+  複数の回帰分析の結果を、(model, term) を index とする1つの縦長のデータフレームにまとめます。
+  全てのモデルの回帰係数と標準誤差を1つの配列に連結し、検定統計量・p-値・信頼区間をまとめて計算します。
+  t分布を使わないモデル（`use_t = False`）では、自由度を無限大として正規分布を用います。
+  """
+  assert pandas.api.types.is_list_like(list_models), "argument 'list_models' is must be a list of models."
+  bild.assert_float(conf_level, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'conf_level')
+  if model_name is None: model_name = _default_model_name(len(list_models))
+
+  term = [list(mod.model.exog_names) for mod in list_models]
+  n_term = [len(v) for v in term]
+  estimate = np.concatenate([np.asarray(mod.params, dtype = 'float64') for mod in list_models])
+  std_err = np.concatenate([np.asarray(mod.bse, dtype = 'float64') for mod in list_models])
+  df = np.repeat([
+      mod.df_resid if getattr(mod, 'use_t', False) else np.inf for mod in list_models
+      ], n_term).astype('float64')
+
+  statistics = estimate / std_err
+  p_value = 2 * t.sf(np.abs(statistics), df)
+  t_alpha = t.isf((1 - conf_level) / 2, df)
+
+  index = pd.MultiIndex.from_arrays(
+      [np.repeat(model_name, n_term), np.concatenate(term)], names = ['model', 'term']
+      )
+  res = pd.DataFrame({
+      'estimate':estimate,
+      'std_err':std_err,
+      'statistics':statistics,
+      'p_value':p_value,
+      'conf_lower':estimate - t_alpha * std_err,
+      'conf_higher':estimate + t_alpha * std_err
+  }, index = index)
   return res
 
-# 線形回帰用のメソッド
-@glance.register(RegressionResultsWrapper)
-def glance_ols(x):
-    res = pd.DataFrame({
-        'rsquared':x.rsquared,
-        'rsquared_adj':x.rsquared_adj,
-        'nobs':int(x.nobs),
-        'df':int(x.df_model),
-        'sigma':np.sqrt(x.mse_resid),
-        'F_values':x.fvalue,
-        'p_values':x.f_pvalue,
-        'AIC':x.aic,
-        'BIC':x.bic
-    }, index = [0])
-    return res
+def glance_many(list_models, model_name = None):
+  """複数の回帰分析の結果について、glance() の値を1つのデータフレームにまとめます。"""
+  assert pandas.api.types.is_list_like(list_models), "argument 'list_models' is must be a list of models."
+  if model_name is None: model_name = _default_model_name(len(list_models))
+
+  res = pd.DataFrame(
+      [_glance_values(mod) for mod in list_models],
+      index = pd.Index(model_name, name = 'model')
+      )
+  return res
 
 
 # In[ ]:
@@ -286,8 +360,8 @@ from varname import argname
 
 def assert_reg_reuslt(x):
   x = pd.Series(x)
-  condition =  x.apply(lambda x: isinstance(x, (RegressionResultsWrapper))).all()
-  assert condition, f"Argment '{argname('x')}' must be of type '{RegressionResultsWrapper}'."
+  condition =  x.apply(lambda x: isinstance(x, (RegressionResultsWrapper, OLSStreamResults))).all()
+  assert condition, f"Argment '{argname('x')}' must be of type '{RegressionResultsWrapper}' or 'OLSStreamResults'."
 
 
 # In[ ]:
@@ -311,32 +385,14 @@ def compare_ols(
   assert pandas.api.types.is_list_like(list_models), "argument 'list_models' is must be a list of models."
   assert_reg_reuslt(list_models)
 
-  tidy_list = [tidy(mod) for mod in list_models]
-
-  # モデル名が指定されていない場合、連番を作成する
-  if model_name is None:
-      model_name = [f'model {i + 1}' for i in range(len(tidy_list))]
-
-  # lineup_models() を適用してモデルを比較する表を作成
-  res = lineup_models(
-          tidy_list, model_name = model_name,
-          digits = digits, stats = stats,
-          add_stars = add_stars, table_style = table_style,
-          subset = subset,
-          line_break = line_break,
-          **kwargs
+  # 回帰係数と当てはまりの指標は数値のまま保持し、文字列への変換は表示するときに行います。
+  res = ModelTable(
+      _tidy_stack(list_models), glance_many(list_models, model_name = range(len(list_models))),
+      model_name = model_name, tidy_fun = _tidy_stack,
+      subset = subset, stats = stats, add_stars = add_stars,
+      stats_glance = stats_glance, digits = digits,
+      table_style = table_style, line_break = line_break
       )
-  res.index.name = 'term'
-  # 表の下部にモデルの当てはまりに関する統計値を追加
-  if stats_glance is not None: # もし stats_glance が None なら統計値を追加しない
-      res2 = make_glance_tab(
-          list_models,
-          model_name = model_name,
-          stats_glance = stats_glance,
-          digits = digits
-          )
-      res = pd.concat([res, res2])
-
   return res
 
 
@@ -355,32 +411,205 @@ def make_glance_tab(
   if model_name is None:
       model_name = [f'model {i + 1}' for i in range(len(list_models))]
 
-  glance_list = [glance(mod) for mod in list_models]
-
-  # glance_list 内のデータフレームの列名の和集合を取得
-  # つまり、代入されたどのモデルの、当てはまりの指標にもない名前を指定することはできないという処理
-  union_set = glance_list[0].columns
-  for i in range(1, len(glance_list)):
-    union_set = union_set.union(glance_list[i].columns)
+  glance_tab = glance_many(list_models)
+  stats_glance = _glance_args(stats_glance, glance_tab)
+  return _glance_tab_str(glance_tab, model_name, stats_glance, digits)
 
+def _glance_args(stats_glance, glance_tab):
   # 引数に妥当な値が指定されているかを検証
+  # つまり、代入されたどのモデルの、当てはまりの指標にもない名前を指定することはできないという処理
   stats_glance = bild.arg_match(
               stats_glance,
-              values = union_set.to_list(),
+              values = glance_tab.columns.to_list(),
               arg_name = 'stats_glance',
               multiple = True
               )
+  if isinstance(stats_glance, str): stats_glance = [stats_glance]
+  return stats_glance
 
-  res = pd.concat(glance_list)\
-    .loc[:, stats_glance]\
-    .round(digits)\
-    .apply(bild.pad_zero, digits = digits).T
+def _glance_tab_str(glance_tab, model_name, stats_glance, digits):
+  res = pd.DataFrame({
+      col:_format_glance_column(glance_tab[col], digits) for col in stats_glance
+      }).T
 
   res.columns = model_name
-  res[res == 'nan'] = ''
   res.index.name = 'term'
   return res
 
+def _format_glance_column(x, digits):
+  """整数の列はそのまま、それ以外の列は小数点以下 digits 桁に揃えた文字列に変換します。欠測値は空白とします。"""
+  if pandas.api.types.is_integer_dtype(x):
+    return x.astype(str).to_numpy()
+  values = x.to_numpy(dtype = 'float64')
+  res = bild.format_number(values, digits = digits, big_mark = '')
+  res[np.isnan(values)] = ''
+  return res
+
+
+# In[ ]:
+
+
+def _tidy_stack(list_models):
+  """(モデルの番号, term) を index とする tidy の表"""
+  return tidy_many(list_models, model_name = list(range(len(list_models))))
+
+def _tidy_mfx_stack(list_models, at = 'overall', method = 'dydx', dummy = False):
+  """(モデルの番号, term) を index とする限界効果の表"""
+  if method == 'coef':
+      tidy_list = [tidy(mod) for mod in list_models]
+  else:
+      tidy_list = [
+          tidy_mfx(mod, at = at, method = method, dummy = dummy)
+          for mod in list_models
+          ]
+  return pd.concat(tidy_list, keys = range(len(tidy_list)), names = ['model', 'term'])
+
+# render() の出力形式ごとに必要となる、pandas の任意依存ライブラリー
+_RENDER_DEPENDS = {'latex': 'jinja2', 'markdown': 'tabulate'}
+
+def _require_module(name, caller):
+  if importlib.util.find_spec(name) is None:
+    raise ImportError(
+        f"{caller} requires the optional dependency '{name}'. "
+        f"Use pip install {name} or pip install py4stats[render]."
+        )
+
+def _latex_cell(x, line_break = '\n'):
+  # LaTeX の表ではセル内で改行できないため、改行を含むセルは makecell パッケージの \makecell{} で囲みます。
+  if not line_break or line_break not in x: return x
+  return '\\makecell{' + x.replace(line_break, ' \\\\ ') + '}'
+
+def _html_cell(x, line_break = None):
+  x = html.escape(str(x))
+  if not line_break: return x
+  return x.replace(html.escape(line_break), '<br>')
+
+class ModelTable:
+  """
+  `compare_ols()` と `compare_mfx()` の返り値。回帰係数・標準誤差・p-値・信頼区間を数値のまま
+  (モデルの番号, term) を index とする縦長の表 `tidy` として保持し、当てはまりの指標は `glance` に保持します。
+  文字列の表への変換は、表示（`print()` や Jupyter での表示）や `to_frame()`、`render()` の呼び出し時にはじめて行うため、
+  表示形式の変更や回帰係数の絞り込み、モデルの追加で既存のモデルの tidy と glance が再計算されることはありません。
+  `loc` や `to_excel()` など `pd.DataFrame` の属性には、文字列化した表を通してアクセスできます。
+  """
+  def __init__(
+      self, tidy, glance, model_name = None, tidy_fun = _tidy_stack, subset = None,
+      stats = 'std_err', add_stars = True, stats_glance = ['rsquared_adj', 'nobs', 'df'],
+      digits = 4, table_style = 'two_line', line_break = '\n'
+      ):
+    if model_name is None: model_name = _default_model_name(len(glance))
+    assert len(model_name) == len(glance), "argument 'model_name' must have the same length as 'list_models'."
+    self.tidy = tidy
+    self.glance = glance
+    self.model_name = list(model_name)
+    self.subset = subset
+    self._tidy_fun = tidy_fun
+    self.options = self._check_options(dict(
+        stats = stats, add_stars = add_stars, stats_glance = stats_glance,
+        digits = digits, table_style = table_style, line_break = line_break
+        ))
+    self._rendered = None
+
+  def _check_options(self, options):
+    # 引数の検証は表の作成時に1回だけ行います。
+    options['stats'], options['table_style'] = _gazer_args(options['stats'], options['table_style'])
+    bild.assert_count(options['digits'], arg_name = 'digits')
+    if options['stats_glance']: # None もしくは空のリストなら当てはまりの指標を表示しない
+      options['stats_glance'] = _glance_args(options['stats_glance'], self.glance)
+    return options
+
+  def _replace(self, **kwargs):
+    args = dict(
+        tidy = self.tidy, glance = self.glance, model_name = self.model_name,
+        tidy_fun = self._tidy_fun, subset = self.subset, **self.options
+        )
+    args.update(kwargs)
+    return ModelTable(**args)
+
+  def to_frame(self, **kwargs):
+    """
+    表示用の文字列に変換した pd.DataFrame を返します。`stats` や `digits` などの表示形式を
+    キーワード引数で指定した場合は、その設定で作り直した表を返します。
+    """
+    if not kwargs:
+      if self._rendered is None: self._rendered = self._render(**self.options)
+      return self._rendered
+    return self._render(**self._check_options({**self.options, **kwargs}))
+
+  def _render(self, stats, add_stars, stats_glance, digits, table_style, line_break):
+    res = _lineup_stacked(
+        self.tidy, model_name = self.model_name, subset = self.subset,
+        stats = stats, add_stars = add_stars, digits = digits,
+        table_style = table_style, line_break = line_break
+        )
+    res.index.name = 'term'
+    # 表の下部にモデルの当てはまりに関する統計値を追加
+    if stats_glance:
+      res2 = _glance_tab_str(self.glance, self.model_name, stats_glance, digits)
+      res = pd.concat([res, res2])
+    return res
+
+  def render(self, output = 'text', **kwargs):
+    """
+    表を 'text', 'html', 'latex', 'markdown' のいずれかの形式の文字列に変換します。
+    表示形式を変更するキーワード引数は `to_frame()` に渡されます。
+    セル内の改行記号 `line_break` は、'html' と 'markdown' では `<br>` に、
+    'latex' では `\\makecell{}` の中の `\\\\` に置き換えます。
+    """
+    output = bild.arg_match(output, ['text', 'html', 'latex', 'markdown'], arg_name = 'output')
+    if output in _RENDER_DEPENDS: _require_module(_RENDER_DEPENDS[output], f"render(output = '{output}')")
+    res = self.to_frame(**kwargs)
+    if output == 'text': return res.to_string()
+
+    line_break = kwargs.get('line_break', self.options['line_break'])
+    if output == 'latex':
+      return res.map(_latex_cell, line_break = line_break).to_latex()
+    # html と markdown ではセル内の改行に <br> タグを使います。
+    res = res.map(_html_cell, line_break = line_break)
+    if output == 'html':
+      return res.rename(index = _html_cell, columns = _html_cell).to_html(escape = False)
+    return res.to_markdown()
+
+  def select(self, subset):
+    """表示する回帰係数を subset に絞り込んだ表を返します。"""
+    return self._replace(subset = subset)
+
+  def append(self, list_models, model_name = None):
+    """
+    list_models の推定結果を右側に追加した表を返します。
+    tidy と glance の計算は、追加したモデルについてだけ行います。
+    """
+    if not pandas.api.types.is_list_like(list_models): list_models = [list_models]
+    assert_reg_reuslt(list_models)
+    n = len(self.model_name)
+    if model_name is None:
+      model_name = [f'model {i + 1}' for i in range(n, n + len(list_models))]
+
+    new_tidy = self._tidy_fun(list_models)
+    new_tidy.index = new_tidy.index.set_levels(new_tidy.index.levels[0] + n, level = 0)
+    new_glance = glance_many(list_models, model_name = range(n, n + len(list_models)))
+
+    return self._replace(
+        tidy = pd.concat([self.tidy, new_tidy]),
+        glance = pd.concat([self.glance, new_glance]),
+        model_name = self.model_name + list(model_name)
+        )
+
+  def __repr__(self): return repr(self.to_frame())
+
+  def __str__(self): return str(self.to_frame())
+
+  def _repr_html_(self): return self.to_frame()._repr_html_()
+
+  def __getitem__(self, key): return self.to_frame()[key]
+
+  def __len__(self): return len(self.to_frame())
+
+  def __getattr__(self, name):
+    # 属性が見つからない場合は、文字列化した表の属性を返します。
+    if name.startswith('_'): raise AttributeError(name)
+    return getattr(self.to_frame(), name)
+
 
 # In[ ]:
 
@@ -390,14 +619,31 @@ def lineup_models(tidy_list, model_name = None, subset = None, **kwargs):
 
     # モデル名が指定されていない場合、連番を作成する
     if model_name is None:
-        model_name = [f'model {i + 1}' for i in range(len(tidy_list))]
+        model_name = _default_model_name(len(tidy_list))
 
-    # tidy_list の各要素に gazer() 関数を適用
-    list_gazer = [gazer(df, **kwargs) for df in tidy_list]
+    # tidy_list を縦に積み重ね、全てのモデルの値をまとめて整形します。
+    stacked = pd.concat(tidy_list, keys = range(len(tidy_list)), names = ['model', 'term'])
 
-    # model_name が列名になるように、辞書の key に設定してから pd.concat() で結合
-    res = pd.concat(dict(zip(model_name, list_gazer)), axis = 'columns')\
-        .droplevel(1, axis = 'columns') # 列名が2重に設定されるので、これを削除して1つにします。
+    return _lineup_stacked(stacked, model_name = model_name, subset = subset, **kwargs)
+
+def _lineup_stacked(
+    stacked, model_name, subset = None, estimate = 'estimate', stats = 'std_err',
+    digits = 4, add_stars = True, table_style = 'two_line', line_break = '\n',
+    **kwargs
+    ):
+    """(モデルの番号, term) を index とする tidy の表から、モデルを横に並べた表を作成する関数"""
+    stats, table_style = _gazer_args(stats, table_style)
+
+    values = _gazer_values(
+        stacked, estimate = estimate, stats = stats, digits = digits,
+        add_stars = add_stars, table_style = table_style, line_break = line_break
+        )
+    # term の順序は、各モデルで最初に現れた順とします。
+    term = stacked.index.get_level_values(-1)
+    res = pd.Series(values, index = stacked.index).unstack(level = 0)\
+        .reindex(index = pd.unique(term), columns = range(len(model_name)))
+    res.columns = model_name
+    res.index.name = None
 
     # subset が指定された場合は該当する変数を抽出します。
     if subset is not None:
@@ -412,17 +658,7 @@ def lineup_models(tidy_list, model_name = None, subset = None, **kwargs):
 # In[ ]:
 
 
-# 回帰係数と検定統計量を縦に並べる関数
-# 2024年1月30日変更 引数 stats と table_style について
-# 妥当な値が指定されているかを検証する機能を追加しました。
-# 2024年3月18日変更 数値の体裁を整える処理を bild.style_number() を使ったものに変更しました。
-def gazer(
-    res_tidy, estimate = 'estimate', stats = 'std_err',
-    digits = 4, add_stars = True,  p_min = 0.01,
-    table_style = 'two_line', line_break = '\n',
-    **kwargs
-    ):
-
+def _gazer_args(stats, table_style):
     # 引数に妥当な値が指定されているかを検証
     stats = bild.arg_match(
         stats, ['std_err', 'statistics', 'p_value', 'conf_int'],
@@ -433,47 +669,52 @@ def gazer(
         table_style, ['two_line', 'one_line'],
         arg_name = 'table_style'
         )
+    return stats, table_style
 
-    # --------------------
-    res = res_tidy.copy()
+def _gazer_values(res, estimate, stats, digits, add_stars, table_style, line_break):
+    """検証済みの引数を使い、回帰係数と検定統計量を配列全体でまとめて文字列に整形する関数"""
     # 有意性を表すアスタリスクを作成します
-    res['stars'] = ' ' + bild.p_stars(res['p_value'])
-
-    # # `estimate` と `stats` を見やすいフォーマットに変換します。
-    # res[[estimate, stats]] = res[[estimate, stats]]\
-    #     .apply(bild.style_number, digits = digits)
+    stars = ' ' + bild.format_stars(res['p_value'])
 
     # table_style に応じて改行とアスタリスクを追加する
-
     if(table_style == 'two_line'):
-        sep = line_break
-        if add_stars:
-            sep = res['stars'] + sep
+        sep = stars + line_break if add_stars else line_break
         sufix = ''
-
     elif(table_style == 'one_line'):
         sep = ''
-        if add_stars:
-            sufix = res['stars']
-        else:
-            sufix = ''
+        sufix = stars if add_stars else ''
 
     if(stats == 'conf_int'):
-      res[[estimate, 'conf_lower', 'conf_higher']] \
-        = res[[estimate, 'conf_lower', 'conf_higher']]\
-          .apply(bild.style_number, digits = digits)
-
-      res['value'] =  res[estimate] + sep\
-       + '[' + res['conf_lower'] + ', ' + res['conf_higher'] + ']'\
-       + sufix
+      est, lower, upper = bild.format_number(
+          res[[estimate, 'conf_lower', 'conf_higher']].to_numpy(dtype = 'float64'), digits = digits
+          ).T
+      value = est + sep + '[' + lower + ', ' + upper + ']' + sufix
     else:
       # `estimate` と `stats` を見やすいフォーマットに変換します。
-      res[[estimate, stats]] = res[[estimate, stats]]\
-        .apply(bild.style_number, digits = digits)
-      res['value'] = res[estimate] + sep + '(' + res[stats] + ')' + sufix
+      est, stat = bild.format_number(
+          res[[estimate, stats]].to_numpy(dtype = 'float64'), digits = digits
+          ).T
+      value = est + sep + '(' + stat + ')' + sufix
+    return value
 
-    # モデルで使用されていない変数について NaN が発生するので、空白で置き換えます。
-    res = res.fillna('')
+
+# 回帰係数と検定統計量を縦に並べる関数
+# 2024年1月30日変更 引数 stats と table_style について
+# 妥当な値が指定されているかを検証する機能を追加しました。
+# 2024年3月18日変更 数値の体裁を整える処理を bild.style_number() を使ったものに変更しました。
+def gazer(
+    res_tidy, estimate = 'estimate', stats = 'std_err',
+    digits = 4, add_stars = True,  p_min = 0.01,
+    table_style = 'two_line', line_break = '\n',
+    **kwargs
+    ):
+    stats, table_style = _gazer_args(stats, table_style)
+
+    res = res_tidy.copy()
+    res['value'] = _gazer_values(
+        res, estimate = estimate, stats = stats, digits = digits,
+        add_stars = add_stars, table_style = table_style, line_break = line_break
+        )
 
     return res[['value']]
 
@@ -630,6 +871,8 @@ def tidy_mfx(
 # In[ ]:
 
 
+from functools import partial
+
 # 複数のロジットモデルを比較する表を作成する関数
 def compare_mfx(
     list_models,
@@ -649,43 +892,16 @@ def compare_mfx(
   assert pandas.api.types.is_list_like(list_models), "argument 'list_models' is must be a list of models."
   assert_reg_reuslt(list_models)
   # 限界効果の推定-------------
-  if method == 'coef':
-      tidy_list = [tidy(mod) for mod in list_models]
-  else:
-      tidy_list = [
-          tidy_mfx(mod, at = at, method = method, dummy = dummy)
-          for mod in list_models
-          ]
-
-  # モデル名が指定されていない場合、連番を作成する
-  if model_name is None:
-      model_name = [f'model {i + 1}' for i in range(len(tidy_list))]
-
-  # lineup_models() を適用してモデルを比較する表を作成
-  res = lineup_models(
-      tidy_list,
-      model_name = model_name,
-      digits = digits,
-      subset = subset,
-      stats = stats,
-      add_stars = add_stars,
-      table_style = table_style,
-      estimate = 'estimate',
-      line_break = line_break,
-      **kwargs
+  tidy_fun = partial(_tidy_mfx_stack, at = at, method = method, dummy = dummy)
+
+  # 限界効果と当てはまりの指標は数値のまま保持し、文字列への変換は表示するときに行います。
+  res = ModelTable(
+      tidy_fun(list_models), glance_many(list_models, model_name = range(len(list_models))),
+      model_name = model_name, tidy_fun = tidy_fun,
+      subset = subset, stats = stats, add_stars = add_stars,
+      stats_glance = stats_glance, digits = digits,
+      table_style = table_style, line_break = line_break
       )
-
-  res.index.name = 'term'
-  # 表の下部にモデルの当てはまりに関する統計値を追加
-  if stats_glance is not None: # もし stats_glance が None なら統計値を追加しない
-      res2 = make_glance_tab(
-          list_models,
-          model_name = model_name,
-          stats_glance = stats_glance,
-          digits = digits
-          )
-      res = pd.concat([res, res2])
-
   return res
 
 
@@ -831,3 +1047,638 @@ def plot_Blinder_Oaxaca(
   if fig is not None:
     fig.tight_layout()
 
+
+
+# ## 複数の回帰式をまとめて推定する関数
+
+# In[ ]:
+
+
+import ast
+import concurrent.futures
+import patsy
+from collections import OrderedDict
+
+_FIT_MODELS = {
+    'ols':sm.OLS,
+    'logit':sm.Logit,
+    'probit':sm.Probit,
+    'poisson':sm.Poisson
+}
+
+def _formula_columns(descs, columns):
+  """回帰式の中で参照されている data の列名を、出現順に重複なく取得します。"""
+  names = []
+  for desc in descs:
+    for term in desc.lhs_termlist + desc.rhs_termlist:
+      for factor in term.factors:
+        names += [node.id for node in ast.walk(ast.parse(factor.code.strip())) if isinstance(node, ast.Name)]
+  return [v for v in pd.unique(pd.Series(names, dtype = object)) if v in columns]
+
+def _term_block(frame, design_info, term):
+  """1つの項だけを数値行列に変換し、欠測値のない行を表すマスクと組にして返します。"""
+  n = len(frame)
+  if not term.factors: # 切片項
+    return np.ones((n, 1)), np.ones(n, dtype = bool)
+  block_info = patsy.DesignInfo(
+      design_info.column_names[design_info.term_slices[term]],
+      factor_infos = {f:design_info.factor_infos[f] for f in term.factors},
+      term_codings = OrderedDict([(term, design_info.term_codings[term])])
+      )
+  block = patsy.build_design_matrices(
+      [block_info], frame, NA_action = 'drop', return_type = 'dataframe'
+      )[0]
+  mask = np.zeros(n, dtype = bool)
+  mask[block.index.to_numpy()] = True
+  return block.to_numpy(dtype = 'float64'), mask
+
+def _term_cache(formulas, data, eval_env):
+  """
+  全ての回帰式に現れる項を、それぞれ1回だけ評価して数値行列に変換します。
+  返り値は、項の値とマスクを保持する辞書と、回帰式毎の (被説明変数, 説明変数) の DesignInfo のリスト、
+  および回帰式毎の (被説明変数, 説明変数) の項のキーのリストです。
+  """
+  descs = [patsy.ModelDesc.from_formula(f) for f in formulas]
+
+  # 文字列の列は1度だけカテゴリー型に変換し、patsy による水準の探索と符号化を高速化します。
+  frame = pd.DataFrame({
+      v:data[v].astype('category').array if pandas.api.types.is_string_dtype(data[v]) else data[v].to_numpy()
+      for v in _formula_columns(descs, data.columns)
+      }, index = pd.RangeIndex(len(data)))
+
+  # center() などの状態を持つ変換は、patsy と同様に、回帰式で使う列に欠測値のない行で平均などを記憶します。
+  # 使用する行が同じ回帰式をまとめ、因子の型や水準の探索はグループ毎に1回だけ行います。
+  masks = [frame[_formula_columns([desc], frame.columns)].notna().all(axis = 1).to_numpy() for desc in descs]
+  groups = {}
+  for i, mask in enumerate(masks): groups.setdefault(mask.tobytes(), []).append(i)
+
+  cache, infos, keys = {}, [None] * len(descs), [None] * len(descs)
+  for group, members in enumerate(groups.values()):
+    sub = frame.loc[masks[members[0]]]
+    builders = patsy.design_matrix_builders(
+        [termlist for i in members for termlist in (descs[i].lhs_termlist, descs[i].rhs_termlist)],
+        lambda: iter([sub]), eval_env, NA_action = 'drop'
+        )
+    for j, i in enumerate(members):
+      infos[i] = (builders[2 * j], builders[2 * j + 1])
+      keys[i] = tuple(
+          [_term_key(design_info, term, group) for term in design_info.terms]
+          for design_info in infos[i]
+          )
+      # 記憶した状態を使って、項の値は全ての行について評価します。欠測値のある行は _assemble_design() で除外されます。
+      for design_info, term_keys in zip(infos[i], keys[i]):
+        for term, key in zip(design_info.terms, term_keys):
+          if key not in cache: cache[key] = _term_block(frame, design_info, term)
+  return cache, infos, keys
+
+def _term_key(design_info, term, group = 0):
+  # 同じ項でも、回帰式の他の項に応じて符号化の方法が変わるため、列名と組にして区別します。
+  # patsy の Term はプロセス間で受け渡せないため、項の名前を使います。
+  key = (term.name(), tuple(design_info.column_names[design_info.term_slices[term]]))
+  # 状態を持つ変換を含む項は、記憶した行のグループ毎に区別します。
+  if any(design_info.factor_infos[f].state.get('transforms') for f in term.factors):
+    key += (group, )
+  return key
+
+def _assemble_design(cache, keys_lhs, keys_rhs):
+  """キャッシュした項の値を横に並べ、被説明変数と説明変数の行列、および使用した行のマスクを返します。"""
+  # 回帰式に含まれるいずれかの項が欠測値となる行は除外します。
+  mask = np.logical_and.reduce([cache[key][1] for key in keys_lhs + keys_rhs])
+  endog, exog = [
+      np.hstack([cache[key][0][mask[cache[key][1]]] for key in keys])
+      for keys in (keys_lhs, keys_rhs)
+      ]
+  return endog, exog, mask
+
+_FIT_CACHE = None
+
+def _fit_init(cache):
+  global _FIT_CACHE
+  _FIT_CACHE = cache
+
+def _fit_design(args):
+  """キャッシュした項の値からデザイン行列を組み立て、モデルを推定します。"""
+  model, keys_lhs, keys_rhs, names_lhs, names_rhs, index, fit_kwargs, cache = args
+  if cache is None: cache = _FIT_CACHE
+
+  endog, exog, mask = _assemble_design(cache, keys_lhs, keys_rhs)
+  index = index[mask]
+  endog = pd.Series(endog[:, 0], index = index, name = names_lhs[0])
+  exog = pd.DataFrame(exog, index = index, columns = names_rhs)
+  return _FIT_MODELS[model](endog, exog).fit(**fit_kwargs)
+
+def fit_many(formulas, data, model = 'ols', n_jobs = 1, backend = 'process', eval_env = 0, **kwargs):
+  """
+  複数の回帰式を同じデータに当てはめ、推定結果のリストを返します。
+  回帰式に現れる項は全ての回帰式を通して1回だけ評価し、デザイン行列はそのキャッシュから組み立てます。
+  返り値は `compare_ols()` や `compare_mfx()` にそのまま代入できます。
+  kwargs は各モデルの `fit()` メソッドに渡されます。
+  """
+  if isinstance(formulas, str): formulas = [formulas]
+  assert pandas.api.types.is_list_like(formulas), "argument 'formulas' is must be a list of formulas."
+  model = bild.arg_match(model, list(_FIT_MODELS.keys()), arg_name = 'model')
+  bild.assert_count(n_jobs, lower = 1, arg_name = 'n_jobs')
+  backend = bild.arg_match(backend, ['thread', 'process'], arg_name = 'backend')
+
+  eval_env = patsy.EvalEnvironment.capture(eval_env, reference = 1)
+  cache, infos, keys = _term_cache(formulas, data, eval_env)
+
+  tasks = []
+  for formula, (info_lhs, info_rhs), (keys_lhs, keys_rhs) in zip(formulas, infos, keys):
+    if len(info_lhs.column_names) != 1:
+      raise ValueError(
+          f"The left-hand side of '{formula}' must evaluate to a single numeric column, "
+          f"but it has {len(info_lhs.column_names)} columns."
+          )
+    tasks.append((
+        model, keys_lhs, keys_rhs,
+        info_lhs.column_names, info_rhs.column_names,
+        data.index, kwargs
+        ))
+
+  if n_jobs == 1 or len(tasks) <= 1:
+    res = [_fit_design(task + (cache, )) for task in tasks]
+  elif backend == 'thread':
+    with concurrent.futures.ThreadPoolExecutor(max_workers = n_jobs) as executor:
+      res = list(executor.map(_fit_design, [task + (cache, ) for task in tasks]))
+  else:
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers = n_jobs, initializer = _fit_init, initargs = (cache, )
+        ) as executor:
+      res = list(executor.map(_fit_design, [task + (None, ) for task in tasks]))
+
+  # smf.ols() などと同様に、回帰式と元のデータを結果に関連付けて predict() で新しいデータを使えるようにします。
+  for mod, formula, (info_lhs, info_rhs) in zip(res, formulas, infos):
+    mod.model.formula = formula
+    mod.model.data.frame = data
+    mod.model.data.design_info = mod.model.data.model_spec = info_rhs
+  return res
+
+
+# ### グループ毎の線形回帰
+
+# In[ ]:
+
+
+def _has_constant(exog):
+  """説明変数の列の線形結合で定数項が表せるかどうか（明示的もしくは暗黙の定数項）を判定します。"""
+  if ((np.ptp(exog, axis = 0) == 0) & (exog[0] != 0)).any(): return True
+  ones = np.ones(len(exog))
+  coef = np.linalg.lstsq(exog, ones, rcond = None)[0]
+  return np.allclose(exog @ coef, ones)
+
+def _ols_batched(exog, endog, group, n_group):
+  """
+  グループ番号 group の順に並べ替えた exog と endog について、グループ毎の最小二乗推定量を計算します。
+  観測値の数が近いグループをまとめ、ゼロ行で長さを揃えた3次元配列に対して QR 分解を一括で行います。
+  ゼロ行は推定量に影響しないため、結果は各グループで個別に推定した場合と一致します。
+  """
+  k = exog.shape[1]
+  nobs = np.bincount(group, minlength = n_group)
+  start = np.concatenate([[0], np.cumsum(nobs)[:-1]])
+  position = np.arange(len(group)) - start[group]
+
+  beta = np.full((n_group, k), np.nan)
+  cov_unscaled = np.full((n_group, k, k), np.nan)
+  rank = np.zeros(n_group, dtype = int)
+
+  # 観測値の数が2倍以上違わないグループ同士を同じバッチで処理します。
+  size_class = np.ceil(np.log2(np.maximum(nobs, 1))).astype(int)
+  row_class = size_class[group]
+  for c in np.unique(size_class[nobs > 0]):
+    members = np.flatnonzero((size_class == c) & (nobs > 0))
+    local = np.full(n_group, -1)
+    local[members] = np.arange(len(members))
+    rows = row_class == c
+
+    m = max(nobs[members].max(), k)
+    X = np.zeros((len(members), m, k))
+    y = np.zeros((len(members), m))
+    X[local[group[rows]], position[rows]] = exog[rows]
+    y[local[group[rows]], position[rows]] = endog[rows]
+
+    Q, R = np.linalg.qr(X)
+    Qty = np.einsum('gmk,gm->gk', Q, y)
+    # 多重共線性のあるグループでも statsmodels と同じ最小ノルム解となるように、R の擬似逆行列を使います。
+    R_inv = np.linalg.pinv(R, rcond = 1e-15)
+    singular_values = np.linalg.svd(R, compute_uv = False)
+    beta[members] = np.einsum('gij,gj->gi', R_inv, Qty)
+    cov_unscaled[members] = R_inv @ np.swapaxes(R_inv, 1, 2)
+    rank[members] = (singular_values > singular_values.max(axis = 1, keepdims = True) * k * np.finfo(float).eps).sum(axis = 1)
+
+  return beta, cov_unscaled, rank, nobs
+
+def ols_by(formula, data, by, conf_level = 0.95, eval_env = 0):
+  """
+  同じ回帰式による線形回帰を、by で指定したグループ毎に推定します。
+  デザイン行列は全体で1回だけ作成し、グループ毎の推定と標準誤差の計算は配列全体でまとめて行います。
+  返り値は (tidy, glance) のタプルで、それぞれ by と term、もしくは by を index とし、
+  列は `tidy()` と `glance()` の線形回帰の場合と同じです。
+  """
+  bild.assert_character(formula, arg_name = 'formula')
+  bild.assert_float(conf_level, lower = 0, upper = 1, inclusive = 'neither', arg_name = 'conf_level')
+  if isinstance(by, str): by = [by]
+  by = bild.arg_match(by, data.columns.to_list(), arg_name = 'by', multiple = True)
+  if isinstance(by, str): by = [by]
+
+  # デザイン行列の作成 -------------
+  eval_env = patsy.EvalEnvironment.capture(eval_env, reference = 1)
+  cache, ((info_lhs, info_rhs), ), ((keys_lhs, keys_rhs), ) = _term_cache([formula], data, eval_env)
+  endog, exog, mask = _assemble_design(cache, keys_lhs, keys_rhs)
+  endog = endog[:, 0]
+  term = info_rhs.column_names
+  k = len(term)
+
+  # グループ番号の作成と並べ替え -------------
+  grouped = data.loc[mask, by].groupby(by, sort = True, observed = True)
+  group = grouped.ngroup().to_numpy()
+  key_index = grouped.size().index
+  n_group = len(key_index)
+
+  # キーが欠測値の行は除外します。
+  use = group >= 0
+  order = np.argsort(group[use], kind = 'stable')
+  group, exog, endog = group[use][order], exog[use][order], endog[use][order]
+
+  # グループ毎の推定 -------------
+  beta, cov_unscaled, rank, nobs = _ols_batched(exog, endog, group, n_group)
+
+  resid = endog - np.einsum('nk,nk->n', exog, beta[group])
+  ssr = np.bincount(group, weights = resid ** 2, minlength = n_group)
+  k_constant = int(_has_constant(exog)) if len(exog) > 0 else 0
+  y_mean = np.bincount(group, weights = endog, minlength = n_group) / nobs
+  if k_constant:
+    tss = np.bincount(group, weights = (endog - y_mean[group]) ** 2, minlength = n_group)
+  else:
+    tss = np.bincount(group, weights = endog ** 2, minlength = n_group)
+
+  df_model = rank - k_constant
+  df_resid = nobs - rank
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    # 自由度が残らないグループの分散は推定できないため NaN とします。
+    scale = np.where(df_resid > 0, ssr / df_resid, np.nan)
+    std_err = np.sqrt(np.diagonal(cov_unscaled, axis1 = 1, axis2 = 2) * scale[:, None])
+    statistics = beta / std_err
+    p_value = 2 * t.sf(np.abs(statistics), df_resid[:, None])
+    t_alpha = t.isf((1 - conf_level) / 2, df_resid)[:, None]
+
+    rsquared = np.where(tss > 0, 1 - ssr / tss, np.nan)
+    rsquared_adj = 1 - (nobs - k_constant) / df_resid * (1 - rsquared)
+    F_values = ((tss - ssr) / df_model) / scale
+    p_values = f.sf(F_values, df_model, df_resid)
+    llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+
+  res_tidy = pd.DataFrame({
+      'estimate':beta.ravel(),
+      'std_err':std_err.ravel(),
+      'statistics':statistics.ravel(),
+      'p_value':p_value.ravel(),
+      'conf_lower':(beta - t_alpha * std_err).ravel(),
+      'conf_higher':(beta + t_alpha * std_err).ravel()
+  }, index = pd.MultiIndex.from_frame(
+      key_index.repeat(k).to_frame(index = False)\
+        .assign(term = np.tile(term, n_group))
+      ))
+
+  res_glance = pd.DataFrame({
+      'rsquared':rsquared,
+      'rsquared_adj':rsquared_adj,
+      'nobs':nobs,
+      'df':df_model,
+      'sigma':np.sqrt(scale),
+      'F_values':F_values,
+      'p_values':p_values,
+      'AIC':-2 * llf + 2 * rank,
+      'BIC':-2 * llf + np.log(nobs) * rank
+  }, index = key_index)
+
+  return res_tidy, res_glance
+
+
+# ### 大規模データのための逐次的な線形回帰
+
+# In[ ]:
+
+
+# HC0 / HC1 の4次のモーメントを累積する際に、1度に作成する一時的な配列の要素数の上限（float64 で 32MB）
+_OLS_BLOCK_ELEMENTS = 2 ** 22
+
+class OLSAccumulator:
+  """
+  データをチャンク毎に読み込みながら、線形回帰の推定に必要な十分統計量（X'X, X'y, y'y, n）を累積します。
+  桁落ちを防ぐため、最初のチャンクの平均値 `shift` を引いた w = (x - shift_x, y - shift_y, 1) について Σww' を累積し、
+  X'X などはそこから復元します。`cov_type` に 'HC0' もしくは 'HC1' を指定した場合は、
+  推定後の回帰係数から Σe²xx' を復元できるように w の4次のモーメントも累積します（説明変数の数を k として k^4/4 程度の記憶領域を使います）。
+  その計算に使う一時的な配列は、チャンクの行数によらず k^4/4 と 32MB の大きい方程度に抑えられます。
+  累積する値はすべて和であるため、`merge()` を使って別のプロセスで作成したアキュムレーターを結合できます。
+  カテゴリー変数の水準は、`levels` に {列名: 水準のリストもしくは pd.CategoricalDtype} の辞書で指定します。
+  `levels` に含まれない列の水準は、最初のチャンクから決まります。
+  """
+  def __init__(self, formula, cov_type = 'nonrobust', levels = None, eval_env = 0):
+    bild.assert_character(formula, arg_name = 'formula')
+    self.formula = formula
+    self.cov_type = bild.arg_match(cov_type, ['nonrobust', 'HC0', 'HC1'], arg_name = 'cov_type')
+    self.levels = {
+        v:lv if isinstance(lv, pd.CategoricalDtype) else pd.CategoricalDtype(lv)
+        for v, lv in (levels or {}).items()
+        }
+    self.endog_names = None
+    self.exog_names = None
+    self.n = 0
+    self.shift = None
+    self.moments = None
+    self.moments4 = None
+    self._eval_env = patsy.EvalEnvironment.capture(eval_env, reference = 1)
+    self._design_info = None
+
+  def __getstate__(self):
+    # patsy の DesignInfo と EvalEnvironment はプロセス間で受け渡せないため除外し、次の update() で作り直します。
+    state = self.__dict__.copy()
+    state['_eval_env'] = None
+    state['_design_info'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._eval_env = patsy.EvalEnvironment.capture(0)
+
+  def _with_levels(self, chunk):
+    """levels で指定した列を、全ての水準をもつカテゴリー型に変換します。"""
+    columns = [v for v in self.levels if v in chunk.columns]
+    if not columns: return chunk
+    converted = {v:chunk[v].astype(self.levels[v]) for v in columns}
+    for v in columns:
+      # 水準にない値は欠測値に変換されてしまうため、黙って除外せずにエラーとします。
+      unknown = converted[v].isna() & chunk[v].notna()
+      if unknown.any():
+        raise ValueError(f"Column '{v}' has values not in 'levels': {chunk[v][unknown].unique().tolist()}.")
+    return chunk.assign(**converted)
+
+  def _design(self, chunk):
+    chunk = self._with_levels(chunk)
+    if self._design_info is None:
+      desc = patsy.ModelDesc.from_formula(self.formula)
+      self._design_info = patsy.design_matrix_builders(
+          [desc.lhs_termlist, desc.rhs_termlist], lambda: iter([chunk]), self._eval_env, NA_action = 'drop'
+          )
+      endog_names, exog_names = [di.column_names for di in self._design_info]
+      if len(endog_names) != 1:
+        raise ValueError(
+            f"The left-hand side of '{self.formula}' must evaluate to a single numeric column, "
+            f"but it has {len(endog_names)} columns."
+            )
+      if self.exog_names is not None and exog_names != self.exog_names:
+        raise ValueError(f"The design matrix of this chunk has columns {exog_names}, expected {self.exog_names}.")
+      self.endog_names, self.exog_names = endog_names[0], exog_names
+    try:
+      endog, exog = patsy.build_design_matrices(self._design_info, chunk, NA_action = 'drop')
+    except patsy.PatsyError as e:
+      # 最初のチャンクになかった水準が現れた場合など
+      raise ValueError(
+          f"{e}\nIf a categorical variable has levels that are not in the first chunk, "
+          "specify all of them with argument 'levels'."
+          ) from e
+    return np.column_stack([exog, endog]).astype('float64')
+
+  def update(self, chunk):
+    """データフレーム chunk の観測値を累積します。回帰式の変数に欠測値を含む行は除外します。"""
+    xy = self._design(chunk)
+    if len(xy) == 0: return self
+    if self.shift is None:
+      self.shift = xy.mean(axis = 0)
+      self.moments = np.zeros((xy.shape[1] + 1, xy.shape[1] + 1))
+
+    w = np.column_stack([xy - self.shift, np.ones(len(xy))])
+    self.n += len(w)
+    self.moments += w.T @ w
+    if self.cov_type != 'nonrobust':
+      # ww' の上三角部分を並べた Z について Z'Z を累積します。
+      # Z はチャンクの行数 × (k + 2)(k + 3)/2 列になるため、行を分けて一時的な配列の大きさを抑えます。
+      iu = np.triu_indices(w.shape[1])
+      if self.moments4 is None: self.moments4 = np.zeros((len(iu[0]), len(iu[0])))
+      step = max(1, _OLS_BLOCK_ELEMENTS // len(iu[0]))
+      for start in range(0, len(w), step):
+        Z = w[start:start + step, iu[0]] * w[start:start + step, iu[1]]
+        self.moments4 += Z.T @ Z
+    return self
+
+  def merge(self, other):
+    """同じ回帰式で作成した別のアキュムレーターを結合します。"""
+    assert isinstance(other, OLSAccumulator), "argument 'other' must be an OLSAccumulator."
+    assert (other.formula, other.cov_type) == (self.formula, self.cov_type), \
+      "Only accumulators with the same 'formula' and 'cov_type' can be merged."
+    if other.n == 0: return self
+    if self.n == 0:
+      self.endog_names, self.exog_names, self.shift = other.endog_names, other.exog_names, other.shift.copy()
+      self.moments = np.zeros_like(other.moments)
+    if other.exog_names != self.exog_names:
+      raise ValueError(f"The accumulators have different columns {other.exog_names} and {self.exog_names}.")
+
+    # other の w を、このアキュムレーターの shift を基準とした値 L w に変換してから足し合わせます。
+    L = np.eye(len(other.moments))
+    L[:-1, -1] = other.shift - self.shift
+    self.n += other.n
+    self.moments += L @ other.moments @ L.T
+    if other.moments4 is not None:
+      m = len(L)
+      iu = np.triu_indices(m)
+      pair = np.zeros((m, m), dtype = int)
+      pair[iu] = np.arange(len(iu[0]))
+      pair = pair + np.triu(pair, 1).T
+      T4 = other.moments4[np.ix_(pair.ravel(), pair.ravel())].reshape((m, ) * 4)
+      for axis in range(4):
+        T4 = np.moveaxis(np.tensordot(L, T4, axes = ([1], [axis])), 0, axis)
+      moments4 = T4[iu[0], iu[1]][:, iu[0], iu[1]]
+      self.moments4 = moments4 if self.moments4 is None else self.moments4 + moments4
+    return self
+
+  def _raw_moments(self):
+    """元の尺度の (x, y, 1) について Σ(x, y, 1)(x, y, 1)' を返します。"""
+    L = np.eye(len(self.moments))
+    L[:-1, -1] = self.shift
+    return L @ self.moments @ L.T
+
+  @property
+  def XtX(self): return self._raw_moments()[:-2, :-2]
+
+  @property
+  def Xty(self): return self._raw_moments()[:-2, -2]
+
+  @property
+  def yty(self): return self._raw_moments()[-2, -2]
+
+  def _meat(self, a):
+    """残差が e = a'w で表されるとき、Σ e²ww' を計算します。"""
+    m = len(a)
+    iu = np.triu_indices(m)
+    # (a'w)² = Σ_q c_q Z_q となる係数（非対角成分は2回現れます）
+    c = a[iu[0]] * a[iu[1]] * np.where(iu[0] == iu[1], 1, 2)
+    meat = np.zeros((m, m))
+    meat[iu] = self.moments4 @ c
+    return meat + np.triu(meat, 1).T
+
+  def fit(self):
+    """累積した値から推定結果 `OLSStreamResults` を作成します。"""
+    assert self.n > 0, "No observations have been accumulated yet."
+    return OLSStreamResults(self)
+
+
+def _null_space(gram):
+  """
+  グラム行列 gram の階数と、零空間の基底を列とする行列を返します。
+  列の尺度の違いに左右されないように、対角成分で基準化してから固有値分解します。
+  """
+  d = np.sqrt(gram.diagonal())
+  d = np.divide(1, d, out = np.ones_like(d), where = d > 0)
+  eigval, eigvec = np.linalg.eigh(gram * np.outer(d, d))
+  small = eigval <= eigval.max() * len(eigval) * np.finfo(float).eps
+  return int((~small).sum()), d[:, None] * eigvec[:, small]
+
+class OLSStreamResults:
+  """
+  `OLSAccumulator.fit()` の返り値。statsmodels の線形回帰の結果と同じ名前の属性をもち、
+  `tidy()`、`glance()`、`compare_ols()`、`coefplot()` に代入できます。
+  statsmodels と同様に、頑健な標準誤差を使う場合の検定と信頼区間は正規分布に基づきます。
+  """
+  def __init__(self, model):
+    self.model = model
+    self.cov_type = model.cov_type
+    self.use_t = self.cov_type == 'nonrobust'
+    names = model.exog_names
+    n = model.n
+    k = len(names)
+
+    raw = model._raw_moments()
+    M = model.moments
+    XtX, Xty, sum_x = raw[:k, :k], raw[:k, k], raw[:k, k + 1]
+    shift_x, shift_y = model.shift[:k], model.shift[k]
+
+    # 階数と定数項の有無は、元の尺度の X'X ではなく shift を引いた z = (x - shift_x, 1) の積率から判定します。
+    # 平均が大きく散らばりの小さい説明変数があると、X'X は数値的に退化してしまうためです。
+    idx = list(range(k)) + [k + 1]
+    rank_z, null = _null_space(M[np.ix_(idx, idx)])
+    # z の零空間のベクトル v について、c'v = shift_x'v[:k] - v[k] がゼロでなければ h = v[:k] / c'v が Xh = 1 を満たし、
+    # X の列の線形結合で定数項が表せます（明示的もしくは暗黙の定数項）。
+    c = np.append(shift_x, -1.0)
+    cv = c @ null
+    has_one = np.abs(cv) > 1e-8 * (np.abs(c) @ np.abs(null))
+    k_constant = int(has_one.any())
+    # X = z T の階数は、z の階数から定数項を含まない場合に 1 を引いた値です。
+    rank = rank_z - 1 + k_constant
+
+    # 定数の列：平均を引いた値の平方和がゼロで、値がゼロでない列
+    centered_ss = M[:k, :k].diagonal() - M[:k, k + 1] ** 2 / n
+    is_const = (centered_ss <= 1e-12 * np.maximum(XtX.diagonal(), 1e-300)) & (sum_x != 0)
+
+    if k_constant and rank == k:
+      # 定数項を含む場合は、z への回帰 θ に変換して推定し、
+      # β = Tθ + h shift_y（h は 1 = Xh となる係数）で元に戻します。平均から離れた説明変数でも精度を保てます。
+      j = np.argmax(has_one)
+      h = null[:k, j] / cv[j]
+      bread = np.column_stack([np.eye(k) - np.outer(h, shift_x), h]) \
+        @ np.linalg.pinv(M[np.ix_(idx, idx)], rcond = 1e-15, hermitian = True)
+      params = bread @ M[idx, k] + h * shift_y
+      R = np.eye(k + 2)[idx]
+    else:
+      # x = R w
+      bread = np.linalg.pinv(XtX, rcond = 1e-15, hermitian = True)
+      params = bread @ Xty
+      R = np.column_stack([np.eye(k), np.zeros(k), shift_x])
+
+    # 残差は、shift を引いた値 w を使って e = a'w と表し、桁落ちを避けて計算します。
+    a = np.concatenate([-params, [1.0, shift_y - shift_x @ params]])
+
+    self.nobs = float(n)
+    self.df_model = float(rank - k_constant)
+    self.df_resid = float(n - rank)
+    self.k_constant = k_constant
+    self.ssr = max(a @ M @ a, 0.0)
+    centered_tss = M[k, k] - M[k, k + 1] ** 2 / n
+    tss = centered_tss if k_constant else raw[k, k]
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+      self.mse_resid = self.ssr / self.df_resid
+      self.rsquared = 1 - self.ssr / tss
+      self.rsquared_adj = 1 - (n - k_constant) / self.df_resid * (1 - self.rsquared)
+      self.llf = -n / 2 * (np.log(2 * np.pi) + np.log(self.ssr / n) + 1)
+
+    # 分散共分散行列 bread (R Ω R') bread'
+    if self.cov_type == 'nonrobust':
+      cov = self.mse_resid * bread @ R @ M @ R.T @ bread.T
+    else:
+      cov = bread @ R @ model._meat(a) @ R.T @ bread.T
+      if self.cov_type == 'HC1': cov = cov * n / self.df_resid
+
+    self.params = pd.Series(params, index = names)
+    self._cov = pd.DataFrame(cov, index = names, columns = names)
+    self.bse = pd.Series(np.sqrt(np.diag(cov)), index = names)
+    self.tvalues = self.params / self.bse
+    self.pvalues = pd.Series(2 * t.sf(np.abs(self.tvalues), self._df_dist), index = names)
+
+    self.aic = -2 * self.llf + 2 * (self.df_model + k_constant)
+    self.bic = -2 * self.llf + np.log(n) * (self.df_model + k_constant)
+    self.fvalue, self.f_pvalue = self._f_test(params, cov, tss, is_const)
+
+  def _f_test(self, params, cov, tss, is_const):
+    # 定数項以外の全ての回帰係数がゼロであることを帰無仮説とする Wald 検定
+    if self.k_constant and not is_const.any():
+      # 暗黙の定数項のみを含む場合は、説明変数の寄与による平方和を使います。
+      fvalue = ((tss - self.ssr) / self.df_model) / self.mse_resid
+    else:
+      idx = np.flatnonzero(~is_const)
+      fvalue = params[idx] @ np.linalg.pinv(cov[np.ix_(idx, idx)]) @ params[idx] / self.df_model
+    return fvalue, f.sf(fvalue, self.df_model, self.df_resid)
+
+  def cov_params(self):
+    return self._cov
+
+  @property
+  def _df_dist(self):
+    # t分布の自由度（正規分布を使う場合は無限大）
+    return self.df_resid if self.use_t else np.inf
+
+  def conf_int(self, alpha = 0.05):
+    t_alpha = t.isf(alpha / 2, self._df_dist)
+    return pd.concat([self.params - t_alpha * self.bse, self.params + t_alpha * self.bse], axis = 1)
+
+  def __repr__(self):
+    return f'<OLSStreamResults: {self.model.formula}, nobs = {int(self.nobs)}, cov_type = {self.cov_type}>'
+
+tidy.register(OLSStreamResults, tidy_regression)
+glance.register(OLSStreamResults, glance_ols)
+_glance_values.register(OLSStreamResults, _glance_values_ols)
+
+def _stream_levels(formula, data, chunksize = 100_000, **kwargs):
+  """
+  回帰式で使う文字列の列について、データ全体に現れる水準を探索します。
+  2回目の読み込みでは該当する列だけを読み込みます。1度しか読み込めないイテレーターの場合は None を返します。
+  """
+  if not isinstance(data, (str, os.PathLike, pd.DataFrame, list, tuple)): return None
+  first = next(bild.read_chunks(data, chunksize = chunksize, **kwargs), None)
+  if first is None: return None
+  columns = [
+      v for v in _formula_columns([patsy.ModelDesc.from_formula(formula)], first.columns)
+      if pandas.api.types.is_string_dtype(first[v])
+      ]
+  if not columns: return {}
+
+  values = {v:set() for v in columns}
+  for chunk in bild.read_chunks(data, chunksize = chunksize, columns = columns, **kwargs):
+    for v in columns: values[v].update(chunk[v].dropna().unique())
+  # patsy と同様に、水準は値の昇順に並べます。
+  return {v:sorted(values[v]) for v in columns}
+
+def ols_stream(formula, data, cov_type = 'nonrobust', chunksize = 100_000, levels = None, eval_env = 0, **kwargs):
+  """
+  CSV もしくは Parquet ファイルのパス、またはデータフレームのイテラブルからチャンク毎にデータを読み込み、
+  デザイン行列全体をメモリに保持せずに線形回帰を推定します。kwargs はファイルの読み込み関数に渡されます。
+  levels を指定しない場合、ファイルのパスとデータフレームのリストについては、文字列の列だけを先に読み込んで水準を探索します。
+  """
+  if levels is None: levels = _stream_levels(formula, data, chunksize = chunksize, **kwargs)
+  acc = OLSAccumulator(
+      formula, cov_type = cov_type, levels = levels,
+      eval_env = patsy.EvalEnvironment.capture(eval_env, reference = 1)
+      )
+  for chunk in bild.read_chunks(data, chunksize = chunksize, **kwargs):
+    acc.update(chunk)
+  return acc.fit()
@@ -15,5 +15,8 @@ setup(
     description="sample tools for regression analisys",  # 説明
     author='Hiroto Tensho',  # 作者名
     packages = find_packages(),  # 使うモジュール一覧を指定する
+    extras_require = {  # ModelTable.render() の 'latex' と 'markdown' 出力で使用
+        'render': ['jinja2', 'tabulate'],
+    },
     license='MIT',  # ライセンス
 )
\ No newline at end of file
@@ -0,0 +1,7 @@
+import pytest
+from palmerpenguins import load_penguins
+
+
+@pytest.fixture
+def penguins():
+  return load_penguins()
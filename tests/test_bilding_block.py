@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from py4stats import bilding_block as bild
+
+
+# format_number() / format_stars() --------------------------------------------------
+
+@pytest.mark.parametrize('digits', [0, 2, 4])
+@pytest.mark.parametrize('big_mark', [',', ''])
+def test_format_number_matches_style_number(digits, big_mark):
+  x = np.array([2000, 1000, 0.5, 0.11, 0.123, -12345.6789])
+  res = bild.format_number(x, digits = digits, big_mark = big_mark)
+  assert res.tolist() == bild.style_number(x, digits = digits, big_mark = big_mark).to_list()
+  assert bild.format_number(x.reshape(2, 3), digits = digits).shape == (2, 3)
+
+
+def test_format_stars_matches_p_stars():
+  p = np.array([0.0, 0.001, 0.01, 0.03, 0.05, 0.07, 0.1, 0.5, 1.0])
+  expected = bild.p_stars(p[p > 0]).to_list()
+  assert bild.format_stars(p)[1:].tolist() == expected
+  # p_stars() では NaN になる p = 0 も最も厳しい水準とします。
+  assert bild.format_stars(p)[0] == '***'
+  assert bild.format_stars([np.nan, 0.2]).tolist() == ['', '']
+  assert bild.format_stars([0.02], stars = {'+':0.05}).tolist() == ['+']
+
+
+# read_chunks() --------------------------------------------------------------------
+
+def test_read_chunks_columns(penguins, tmp_path):
+  path = tmp_path / 'penguins.csv'
+  penguins.to_csv(path, index = False)
+  columns = ['species', 'sex']
+  for data in [path, penguins, [penguins.iloc[:100], penguins.iloc[100:]]]:
+    res = pd.concat(list(bild.read_chunks(data, chunksize = 60, columns = columns)), ignore_index = True)
+    pd.testing.assert_frame_equal(res, penguins[columns])
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pl = pytest.importorskip('polars')
+pytest.importorskip('tidypolars')
+
+from py4stats import eda_tools as eda
+try:
+  from py4stats import eda_pl
+except AttributeError:
+  # eda_pl が前提とする tidypolars の API（tp.tibble.Tibble）がない場合
+  pytest.skip('incompatible version of tidypolars', allow_module_level = True)
+
+
+@pytest.fixture
+def penguins_pl(penguins):
+  return pl.from_pandas(penguins)
+
+
+# polars.DataFrame 向けのメソッド ----------------------------------------------------
+
+def test_diagnose_pl_matches_pandas(penguins, penguins_pl):
+  expected = eda.diagnose(penguins)
+  res = eda.diagnose(penguins_pl).to_pandas().set_index('columns')
+  np.testing.assert_array_equal(res['missing_count'], expected['missing_count'])
+  # polars は欠測値もユニーク値の1つとして数えます。
+  np.testing.assert_array_equal(
+      res['unique_count'], expected['unique_count'] + (expected['missing_count'] > 0)
+      )
+
+
+def test_remove_constant_pl(penguins, penguins_pl):
+  penguins['const'] = 1
+  res = eda.remove_constant(pl.from_pandas(penguins))
+  assert res.columns == list(penguins_pl.columns)
+
+
+def test_freq_table_pl_matches_pandas(penguins, penguins_pl):
+  expected = eda.freq_table(penguins, 'species')
+  res = eda.freq_table(penguins_pl, 'species').to_pandas().set_index('species')
+  np.testing.assert_array_equal(res['freq'], expected['freq'])
+  np.testing.assert_allclose(res['cumperc'], expected['cumperc'])
+  assert list(res.index) == list(expected.index)
+
+
+def test_crosstab2_pl_matches_pandas(penguins, penguins_pl):
+  expected = eda.crosstab2(penguins, index = 'species', columns = 'island', margins = True)
+  res = eda.crosstab2(penguins_pl, index = 'species', columns = 'island', margins = True)\
+    .to_pandas().set_index('species')
+  np.testing.assert_array_equal(res.to_numpy(), expected.to_numpy())
+
+
+def test_compare_group_means_pl(penguins):
+  g1 = penguins.query('species == "Adelie"')
+  g2 = penguins.query('species == "Gentoo"')
+  expected = eda.compare_group_means(g1, g2)
+  res = eda.compare_group_means(pl.from_pandas(g1), pl.from_pandas(g2))
+  pd.testing.assert_frame_equal(res, expected.loc[res.index], check_dtype = False)
+
+
+def test_tabyl_pl_matches_pandas(penguins, penguins_pl):
+  expected = eda.tabyl(penguins, 'species', 'island')
+  res = eda.tabyl(penguins_pl, 'species', 'island')
+  pd.testing.assert_frame_equal(res.to_frame(), expected.to_frame(), check_dtype = False)
+
+
+def test_crosstab2_pl_bool_columns():
+  data = pd.DataFrame({'a':list('xxyxy'), 'b':[True, False, True, True, False]})
+  expected = eda.crosstab2(data, 'a', 'b', margins = True)
+  res = eda.crosstab2(pl.from_pandas(data), 'a', 'b', margins = True).to_pandas().set_index('a')
+  assert list(res.columns) == [str(v) for v in expected.columns]
+  np.testing.assert_array_equal(res.to_numpy(), expected.to_numpy())
+  for index, columns in [('a', 'b'), ('b', 'a')]:
+    pd.testing.assert_frame_equal(
+        eda.tabyl(pl.from_pandas(data), index, columns).to_frame(),
+        eda.tabyl(data, index, columns).to_frame(), check_dtype = False
+        )
+
+
+@pytest.mark.parametrize('index, columns', [('island', 'sex'), ('sex', 'island')])
+def test_tabyl_pl_keeps_missing_levels(penguins, penguins_pl, index, columns):
+  # dropna = False（初期設定）では、欠測値も1つの水準として集計します。
+  res = eda.tabyl(penguins_pl, index, columns).to_frame()
+  expected = eda.tabyl(penguins, index, columns).to_frame()
+  assert res.loc['All', 'All'] == str(len(penguins))
+  # pandas では欠測値の水準の合計（行・列）が NaN や 0 になるため、それ以外のセルを比較します。
+  body = expected.index[expected.index.notna() & (expected.index != 'All')]
+  pd.testing.assert_frame_equal(res.loc[body], expected.loc[body], check_dtype = False)
+  assert res.index.isna().sum() == expected.index.isna().sum()
+
+  res = eda.tabyl(penguins_pl, index, columns, dropna = True).to_frame()
+  pd.testing.assert_frame_equal(res, eda.tabyl(penguins, index, columns, dropna = True).to_frame(), check_dtype = False)
+
+
+def test_crosstab2_pl_dropna(penguins, penguins_pl):
+  res = eda.crosstab2(penguins_pl, 'island', 'sex', dropna = False).to_pandas().set_index('island')
+  expected = eda.crosstab2(penguins, 'island', 'sex', dropna = False)
+  assert list(res.columns) == ['female', 'male', 'null']
+  np.testing.assert_array_equal(res.to_numpy(), expected.to_numpy())
+
+
+# polars.LazyFrame 向けのメソッド ----------------------------------------------------
+
+def test_lazy_methods_match_eager(penguins_pl):
+  lf = penguins_pl.lazy()
+  res, expected = eda.diagnose(lf), eda.diagnose(penguins_pl)
+  assert res.drop('dtype').equals(expected.drop('dtype'))
+  assert list(map(str, res['dtype'])) == list(map(str, expected['dtype']))
+  assert eda.freq_table(lf, ['species', 'island']).equals(eda.freq_table(penguins_pl, ['species', 'island']))
+  assert eda.crosstab2(lf, index = 'species', columns = 'island')\
+    .equals(eda.crosstab2(penguins_pl, index = 'species', columns = 'island'))
+  assert isinstance(eda.remove_constant(lf), pl.LazyFrame)
+
+
+def test_crosstab2_lazy_rownames(penguins, penguins_pl):
+  expected = eda.crosstab2(penguins, 'species', 'island', rownames = ['R'], margins = True)
+  for data in [penguins_pl, penguins_pl.lazy()]:
+    res = eda.crosstab2(data, 'species', 'island', rownames = 'R', margins = True)
+    assert res.columns[0] == 'R'
+    np.testing.assert_array_equal(res.to_pandas().set_index('R').to_numpy(), expected.to_numpy())
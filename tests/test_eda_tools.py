@@ -0,0 +1,571 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy as sp
+
+from py4stats import eda_tools as eda
+
+
+# diagnose(approx = True) / HyperLogLog ----------------------------------------
+
+def test_diagnose_approx_close_to_exact(penguins):
+  exact = eda.diagnose(penguins)
+  approx = eda.diagnose(penguins, approx = True)
+  pd.testing.assert_series_equal(exact['missing_count'], approx['missing_count'])
+  rel = (approx['unique_count'] - exact['unique_count']).abs() / exact['unique_count']
+  assert (rel < 0.05).all()
+
+
+def test_diagnose_approx_unique_rate_bounded():
+  df = pd.DataFrame({'x': np.arange(200_000), 'y': np.random.default_rng(0).normal(size = 200_000)})
+  res = eda.diagnose(df, approx = True)
+  assert (res['unique_count'] <= len(df)).all()
+  assert (res['unique_rate'] <= 100).all()
+
+
+def test_hyperloglog_distinguishes_large_integers():
+  x = pd.Series(np.int64(2 ** 60) + np.arange(5000))
+  assert abs(eda.HyperLogLog().update(x).count() - 5000) < 100
+
+
+def test_hyperloglog_int_and_float_hash_alike():
+  a = eda.HyperLogLog().update(pd.Series([1, 2, 3]))
+  b = eda.HyperLogLog().update(pd.Series([1.0, 2.0, np.nan, 4.5]))
+  assert a.merge(b).count() == 4
+
+
+# diagnose_file() ---------------------------------------------------------------
+
+def test_diagnose_file_matches_diagnose(penguins, tmp_path):
+  path = tmp_path / 'penguins.csv'
+  penguins.to_csv(path, index = False)
+  exact = eda.diagnose(pd.read_csv(path))
+  res = eda.diagnose_file(path, chunksize = 50)
+  pd.testing.assert_series_equal(exact['missing_count'], res['missing_count'])
+  assert (res['dtype'] == exact['dtype']).all()
+  assert ((res['unique_count'] - exact['unique_count']).abs() <= 0.05 * exact['unique_count']).all()
+
+
+def test_diagnose_file_parquet(penguins, tmp_path):
+  pytest.importorskip('pyarrow')
+  path = tmp_path / 'penguins.parquet'
+  penguins.to_parquet(path)
+  res = eda.diagnose_file(path, chunksize = 100)
+  pd.testing.assert_series_equal(eda.diagnose(penguins)['missing_count'], res['missing_count'])
+
+
+def test_diagnose_state_merge(penguins):
+  whole = eda.DiagnoseState().update(penguins).result()
+  merged = eda.DiagnoseState().update(penguins.iloc[:100])\
+    .merge(eda.DiagnoseState().update(penguins.iloc[100:])).result()
+  pd.testing.assert_frame_equal(whole, merged)
+
+
+def test_diagnose_file_top_values(penguins, tmp_path):
+  path = tmp_path / 'penguins.csv'
+  penguins.to_csv(path, index = False)
+  res = eda.diagnose_file(path, chunksize = 50)
+  assert 'top' not in res.columns
+
+  res = eda.diagnose_file(path, chunksize = 50, top_k = 5)
+  exact = pd.read_csv(path)
+  for col in ['species', 'island', 'sex', 'year']:
+    counts = exact[col].value_counts()
+    assert res.loc[col, 'top'] == counts.index[0]
+    # Misra-Gries の推定度数は真の度数の下限で、誤差は n / (k + 1) 以下です。
+    bound = counts.sum() / 6
+    assert counts.iloc[0] - bound <= res.loc[col, 'top_freq'] <= counts.iloc[0]
+
+  state = eda.DiagnoseState(top_k = 5).update(penguins)
+  assert state.top_values['species'].top(3).index.tolist() == penguins['species'].value_counts().index.tolist()
+
+
+# diagnose_category() ------------------------------------------------------------
+
+def test_diagnose_category_matches_column_helpers(penguins):
+  penguins['dummy'] = (penguins['sex'] == 'male').astype(int)
+  res = eda.diagnose_category(penguins)
+  assert list(res.index) == ['species', 'island', 'sex', 'dummy']
+  for col in ['species', 'island', 'sex']:
+    x = penguins[col]
+    assert res.loc[col, 'count'] == x.count()
+    assert res.loc[col, 'unique'] == x.nunique()
+    assert res.loc[col, 'top'] == x.mode()[0]
+    assert res.loc[col, 'freq'] == x.value_counts().iloc[0]
+    assert res.loc[col, 'missing_percent'] == pytest.approx(100 * x.isna().mean())
+    assert res.loc[col, 'std_entropy'] == pytest.approx(eda.std_entropy(x.dropna()))
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_diagnose_category_parallel(penguins, backend):
+  expected = eda.diagnose_category(penguins)
+  res = eda.diagnose_category(penguins, n_jobs = 2, backend = backend)
+  pd.testing.assert_frame_equal(res, expected)
+
+
+# freq_table(top_k = ...) / freq_table_stream() ------------------------------------
+
+@pytest.mark.parametrize('subset', ['species', ['species', 'sex'], ['island', 'sex', 'year']])
+def test_freq_table_top_k_matches_full_table(penguins, subset):
+  full = eda.freq_table(penguins, subset)
+  res = eda.freq_table(penguins, subset, top_k = 2)
+  np.testing.assert_array_equal(res['freq'].iloc[:2], full['freq'].iloc[:2])
+  assert res['freq'].iloc[-1] == full['freq'].iloc[2:].sum()
+  assert res['cumfreq'].iloc[-1] == len(penguins)
+
+
+def test_freq_table_top_k_with_missing_levels(penguins):
+  # 欠測値を含む MultiIndex の度数でも上位 top_k 件を選択できる
+  res = eda.freq_table(penguins, ['species', 'sex'], top_k = 3, ascending = True)
+  assert res['freq'].iloc[:3].tolist() == [5, 6, 34]
+  assert res['freq'].sum() == len(penguins)
+
+
+def test_freq_table_stream_matches_freq_table(penguins):
+  chunks = [penguins.iloc[i:i + 50] for i in range(0, len(penguins), 50)]
+  res = eda.freq_table_stream(chunks, ['species', 'sex'], top_k = 3, capacity = 20)
+  expected = eda.freq_table(penguins, ['species', 'sex'], top_k = 3)
+  pd.testing.assert_frame_equal(res, expected, check_names = False, check_dtype = False)
+
+
+def test_misra_gries_error_bound():
+  x = pd.Series(np.random.default_rng(1).zipf(1.5, 100_000))
+  summary = eda.MisraGries(50)
+  for i in range(0, len(x), 10_000):
+    summary.update(x.iloc[i:i + 10_000])
+  top = summary.top(10)
+  diff = x.value_counts()[top.index] - top
+  assert ((diff >= 0) & (diff <= summary.error_bound)).all()
+
+
+# tabyl() / TabylResult ----------------------------------------------------------
+
+@pytest.mark.parametrize('normalize', ['index', 'columns', 'all'])
+@pytest.mark.parametrize('margins', [True, False])
+@pytest.mark.parametrize('dropna', [True, False])
+def test_tabyl_proportions_match_crosstab(penguins, normalize, margins, dropna):
+  res = eda.tabyl(penguins, 'species', 'sex', normalize = normalize, margins = margins, dropna = dropna)
+  expected = pd.crosstab(
+      penguins['species'], penguins['sex'], normalize = normalize, margins = margins, dropna = dropna
+      )
+  pd.testing.assert_frame_equal(res.proportions, expected)
+  pd.testing.assert_frame_equal(
+      res.counts,
+      pd.crosstab(penguins['species'], penguins['sex'], margins = margins, dropna = dropna)
+      )
+
+
+def test_tabyl_formats_lazily(penguins):
+  res = eda.tabyl(penguins, 'species', 'island', digits = 2)
+  assert res._rendered is None
+  assert res.loc['Adelie', 'Biscoe'] == '44 (28.95%)'
+  assert res.loc['Adelie', 'All'] == '152'
+  assert res.to_frame(digits = 0).loc['Adelie', 'Biscoe'] == '44 (29%)'
+  assert res.shape == (4, 4) and len(res) == 4
+
+
+def test_tabyl_keeps_bool_columns(penguins):
+  penguins['male'] = penguins['sex'] == 'male'
+  eda.tabyl(penguins, 'species', 'male')
+  assert penguins['male'].dtype == bool
+
+
+# compare_df_stats() --------------------------------------------------------------
+
+def test_compare_df_stats_matches_pairwise_isclose(penguins):
+  df2 = penguins.assign(bill_length_mm = penguins['bill_length_mm'] * (1 + 1e-9))
+  df3 = penguins.assign(body_mass_g = penguins['body_mass_g'] + 100)
+  res = eda.compare_df_stats([penguins, df2, df3])
+  assert not res.loc['body_mass_g', 'match_stats']
+  assert res.drop(index = 'body_mass_g')['match_stats'].all()
+  assert list(eda.compare_df_stats([penguins, df2, df3], return_match = 'mismatch').index) == ['body_mass_g']
+
+
+def test_compare_df_stats_reads_files(penguins, tmp_path):
+  paths = []
+  for i, (_, df) in enumerate(penguins.groupby('island')):
+    paths.append(tmp_path / f'part{i}.csv')
+    df.to_csv(paths[-1], index = False)
+  expected = eda.compare_df_stats([pd.read_csv(p) for p in paths])
+  res = eda.compare_df_stats(paths, read_kwargs = {'usecols': ['bill_length_mm', 'year']})
+  pd.testing.assert_frame_equal(res.drop(columns = 'match_stats'), expected.loc[res.index].drop(columns = 'match_stats'))
+  assert res['match_stats'].tolist() == [False, False]
+  assert list(eda.compare_df_stats(paths, return_match = 'match').index) == []
+
+
+# compare_df_record(key = ...) ----------------------------------------------------
+
+def test_compare_df_record_keyed_matches_positional(penguins):
+  df1 = penguins.reset_index(names = 'id')
+  df2 = df1.copy()
+  df2.loc[[3, 10], 'body_mass_g'] += 100
+  df2.loc[20, 'species'] = 'Gentoo'
+  df2.loc[30, 'bill_depth_mm'] *= 1 + 1e-9 # 許容誤差の範囲内
+
+  positional = eda.compare_df_record(df1, df2)
+  changed = positional.drop(columns = 'id').stack()
+  # 両方とも欠測値のセルは一致とみなします。
+  both_na = (df1.isna() & df2.isna()).drop(columns = 'id').stack()
+  changed = changed[~changed & ~both_na]
+
+  res = eda.compare_df_record(df1, df2.sample(frac = 1, random_state = 0), key = 'id', chunksize = 7)
+  assert set(zip(res['id'], res['column'])) == set(changed.index)
+  assert (res['status'] == 'changed').all()
+  row = res.query('id == 20').iloc[0]
+  assert (row['df1'], row['df2']) == ('Adelie', 'Gentoo')
+
+
+def test_compare_df_record_keyed_added_and_removed(penguins):
+  df1 = penguins.reset_index(names = 'id')
+  df2 = pd.concat([df1.iloc[5:], df1.iloc[[0]].assign(id = 1000)])
+  res = eda.compare_df_record(df1, df2, key = ['id'])
+  assert sorted(res.query('status == "removed"')['id']) == [0, 1, 2, 3, 4]
+  assert res.query('status == "added"')['id'].tolist() == [1000]
+  assert len(res) == 6
+  assert eda.compare_df_record(df1, df1, key = 'id').empty
+
+
+def test_compare_df_record_keyed_nullable_dtypes(penguins):
+  # Parquet から読み込んだデータのような nullable な型（string, Int64, Float64）の pd.NA を扱えること
+  df1 = penguins.reset_index(names = 'id').convert_dtypes()
+  assert df1['sex'].dtype == 'string' and df1['body_mass_g'].dtype == 'Int64'
+  df2 = df1.copy()
+  df2.loc[0, 'sex'] = pd.NA          # 値 -> 欠測値
+  df2.loc[3, 'sex'] = 'female'       # 欠測値 -> 値
+  df2.loc[5, 'body_mass_g'] += 100
+  df2.loc[3, 'body_mass_g'] = 4000   # 欠測値 -> 値
+  df2.loc[6, 'bill_depth_mm'] = pd.NA
+
+  res = eda.compare_df_record(df1, df2, key = 'id')
+  assert set(zip(res['id'], res['column'])) == {
+      (0, 'sex'), (3, 'sex'), (5, 'body_mass_g'), (3, 'body_mass_g'), (6, 'bill_depth_mm')
+      }
+  row = res.query('id == 0').iloc[0]
+  assert row['df1'] == 'male' and row['df2'] is pd.NA
+
+
+# check_that() / check_viorate() ---------------------------------------------------
+
+RULES = {
+    'bill':'bill_length_mm > 40',
+    'species':"species == 'Adelie'",
+    'mean':'body_mass_g.mean() > 4000',
+    'and':'bill_length_mm > 35 and sex == "male"',
+    'implies':eda.implies_exper("species == 'Gentoo'", 'body_mass_g > 4000')
+    }
+
+def _check_that_loop(data, rule_dict):
+  # ルールを1つずつ DataFrame.eval() で評価する素朴な実装
+  rows = {}
+  for name, expr in rule_dict.items():
+    condition = pd.Series(data.eval(expr))
+    if len(condition) == len(data):
+      cols = eda._rule_columns(expr, data.columns)
+      condition = condition.astype('boolean')
+      condition[data[cols].isna().any(axis = 'columns')] = pd.NA
+    rows[name] = [
+        len(condition), condition.sum(skipna = True),
+        (~condition).sum(skipna = True), condition.isna().sum()
+        ]
+  return pd.DataFrame.from_dict(rows, orient = 'index', columns = ['item', 'passes', 'fails', 'coutna'])
+
+
+def test_check_that_matches_rule_by_rule_eval(penguins):
+  res = eda.check_that(penguins, RULES)
+  expected = _check_that_loop(penguins, RULES)
+  pd.testing.assert_frame_equal(
+      res[['item', 'passes', 'fails', 'coutna']], expected, check_names = False, check_dtype = False
+      )
+  assert res['expression'].tolist() == list(RULES.values())
+
+
+def test_check_that_passes_eval_kwargs(penguins):
+  res = eda.check_that(penguins, {'heavy':'body_mass_g > @th'}, local_dict = {'th':4000})
+  assert res.loc['heavy', 'passes'] == (penguins['body_mass_g'] > 4000).sum()
+
+
+def test_check_that_rejects_non_logical_rule(penguins):
+  with pytest.raises(AssertionError, match = "'mass'"):
+    eda.check_that(penguins, {'ok':'year > 2000', 'mass':'body_mass_g + 1'})
+
+
+def test_check_viorate(penguins):
+  rules = {k: v for k, v in RULES.items() if k != 'mean'}
+  res = eda.check_viorate(penguins, rules)
+  for name, expr in rules.items():
+    pd.testing.assert_series_equal(res[name], ~penguins.eval(expr), check_names = False)
+  pd.testing.assert_series_equal(res['any'], res[list(rules)].any(axis = 'columns'), check_names = False)
+
+
+# check_that_stream() ----------------------------------------------------------------
+
+def test_check_that_stream_matches_check_that(penguins, tmp_path):
+  rules = {k: v for k, v in RULES.items() if k != 'mean'}
+  expected = eda.check_that(penguins, rules)
+  path = tmp_path / 'penguins.csv'
+  penguins.to_csv(path, index = False)
+  res = eda.check_that_stream(path, rules, chunksize = 50)
+  pd.testing.assert_frame_equal(res, expected, check_dtype = False)
+  res = eda.check_that_stream(path, rules, chunksize = 50, read_kwargs = {'nrows': 100})
+  assert (res['item'] == 100).all()
+
+
+def test_check_that_stream_incremental(penguins):
+  rules = {k: v for k, v in RULES.items() if k != 'mean'}
+  first = eda.check_that(penguins.iloc[:200], rules)
+  res = eda.check_that_stream([penguins.iloc[200:]], rules, previous = first)
+  pd.testing.assert_frame_equal(res, eda.check_that(penguins, rules), check_dtype = False)
+  with pytest.raises(AssertionError):
+    eda.check_that_stream([penguins], {'bill':'bill_length_mm > 50'}, previous = first)
+
+
+# is_number() / is_ymd() / is_ymd_like() -------------------------------------------
+
+STRINGS = pd.Series([
+    '123', '-1.5', '1e+10', '2.5E-3', '090-1234-5678', '2024-01-15', '2024年1月15日',
+    'abc', 'あいう', 'カタカナ', '漢字12', '12 34', '', ' 7 ', '1,000', None, '123', np.nan
+    ])
+
+def _is_number_str(x):
+  # pandas の文字列メソッドによる素朴な実装
+  s = x.astype(str)
+  res = s.str.contains('[0-9]+') & ~s.str.contains('[0-9]{0,4}(?: |-)[0-9]{0,4}(?: |-)[0-9]{0,4}')\
+    & ~s.str.contains('[ぁ-ゟ]+') & ~s.str.contains('[ァ-ヿ]+')\
+    & ~s.str.contains('[A-z]+') & ~s.map(eda.detect_Kanzi)\
+    & ~s.str.contains(eda._REX_YMD_LIKE.pattern)
+  res[s.str.contains('[0-9]+[E,e]+(?:\\+|-)[0-9]+')] = True
+  return res
+
+
+@pytest.mark.parametrize('na_default', [True, False])
+def test_is_number_matches_str_methods(na_default):
+  expected = _is_number_str(STRINGS)
+  expected[STRINGS.isna()] = na_default
+  pd.testing.assert_series_equal(eda.is_number(STRINGS, na_default = na_default), expected)
+  pd.testing.assert_series_equal(
+      eda.is_number(STRINGS.astype('category'), na_default = na_default), expected
+      )
+
+
+def test_is_ymd_matches_str_methods():
+  for fun, pattern in [(eda.is_ymd, eda._REX_YMD), (eda.is_ymd_like, eda._REX_YMD_LIKE)]:
+    expected = STRINGS.astype(str).str.contains(pattern.pattern)
+    expected[STRINGS.isna()] = False
+    pd.testing.assert_series_equal(fun(STRINGS, na_default = False), expected)
+
+
+# infer_types() ----------------------------------------------------------------------
+
+def test_infer_types_suggests_dtypes():
+  df = pd.DataFrame({
+      'int':['1', '2', None, '30'] * 25,
+      'float':['1.5', '2', '3.25', None] * 25,
+      'date':['2024-01-01', '2024-2-3', None, '2023-12-31'] * 25,
+      'text':['a', 'b', '1', None] * 25,
+      'cat':pd.Categorical(['10', '20', '30', '40'] * 25),
+      'num':np.arange(100)
+      })
+  res = eda.infer_types(df)
+  assert list(res.index) == ['int', 'float', 'date', 'text', 'cat']
+  assert res['suggested'].tolist() == ['Int64', 'float64', 'datetime64[ns]', 'object', 'Int64']
+  assert res.loc['text', 'nonconform'] == pytest.approx(2 / 3)
+  assert res.loc['int', 'count'] == 75
+  assert eda.infer_types(df, tol = 0.7).loc['text', 'suggested'] != 'object'
+
+
+def test_infer_types_sample_interval():
+  x = pd.Series(['1'] * 900 + ['x'] * 100)
+  df = pd.DataFrame({'x': x.sample(frac = 1, random_state = 0).to_numpy()})
+  res = eda.infer_types(df, sample = 200, random_state = 1)
+  assert res.loc['x', 'sampled'] == 200
+  assert res.loc['x', 'lower'] <= 0.1 <= res.loc['x', 'upper']
+  pd.testing.assert_frame_equal(res, eda.infer_types(df, sample = 200, random_state = 1, n_jobs = 2))
+
+
+# mean_qi() / median_qi() / mean_ci() の by 引数 ------------------------------------
+
+NUMERIC = ['bill_length_mm', 'body_mass_g']
+
+@pytest.mark.parametrize('fun', [eda.mean_qi, eda.median_qi, eda.mean_ci])
+@pytest.mark.parametrize('by', ['species', ['species', 'sex']])
+def test_qi_by_matches_group_loop(penguins, fun, by):
+  res = fun(penguins[NUMERIC], by = penguins[by] if isinstance(by, str) else [penguins[v] for v in by])
+  for key, df in penguins.groupby(by):
+    expected = fun(df[NUMERIC])
+    key = key if isinstance(key, tuple) else (key, )
+    pd.testing.assert_frame_equal(res.loc[key], expected, check_names = False)
+
+
+def test_qi_by_series(penguins):
+  res = eda.median_qi(penguins['bill_length_mm'], by = penguins['island'])
+  expected = penguins.groupby('island')['bill_length_mm'].median()
+  np.testing.assert_allclose(res['median'], expected)
+  assert res.index.names == ['island', 'variable']
+
+
+# KLLSketch / median_qi_stream() -----------------------------------------------------
+
+def _rank_error(x, q, estimate):
+  return np.abs(np.searchsorted(np.sort(x), estimate) / len(x) - q)
+
+
+def test_kll_sketch_rank_error():
+  x = np.random.default_rng(0).lognormal(size = 200_000)
+  sketch = eda.KLLSketch(k = 200, random_state = 1)
+  for i in range(0, len(x), 10_000):
+    sketch.update(x[i:i + 10_000])
+  q = np.array([0.01, 0.25, 0.5, 0.75, 0.99])
+  assert (_rank_error(x, q, sketch.quantile(q)) < 0.02).all()
+  assert sum(len(v) for v in sketch.levels) < 3 * 200
+
+
+def test_kll_sketch_merge():
+  x = np.random.default_rng(0).normal(size = 100_000)
+  merged = eda.KLLSketch(random_state = 1).update(x[:50_000])\
+    .merge(eda.KLLSketch(random_state = 2).update(x[50_000:]))
+  assert merged.n == len(x)
+  assert _rank_error(x, 0.5, merged.quantile(0.5)) < 0.02
+
+
+def test_median_qi_stream_close_to_median_qi(penguins):
+  expected = eda.median_qi(penguins[NUMERIC])
+  chunks = [penguins.iloc[i:i + 40] for i in range(0, len(penguins), 40)]
+  res = eda.median_qi_stream(chunks, subset = NUMERIC, k = 400, random_state = 0)
+  # 推定値の順位と真の分位点の順位の差は 1% 未満になります。
+  for col in NUMERIC:
+    x = penguins[col].dropna().to_numpy()
+    for stat, q in [('median', 0.5), ('lower', 0.025), ('upper', 0.975)]:
+      assert _rank_error(x, q, res.loc[col, stat]) < 0.01
+  assert list(res.columns) == list(expected.columns)
+
+
+# boot_ci() -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('method', ['percentile', 'bca'])
+def test_boot_ci_close_to_scipy(method):
+  x = np.random.default_rng(0).exponential(size = 300)
+  res = eda.boot_ci(pd.Series(x, name = 'x'), B = 4000, method = method, random_state = 1)
+  expected = sp.stats.bootstrap(
+      (x, ), np.mean, n_resamples = 4000, method = method, random_state = 2
+      ).confidence_interval
+  assert res.loc['x', 'mean'] == pytest.approx(x.mean())
+  assert res.loc['x', 'lower'] == pytest.approx(expected.low, abs = 0.02)
+  assert res.loc['x', 'upper'] == pytest.approx(expected.high, abs = 0.02)
+
+
+def test_boot_ci_reproducible_across_jobs(penguins):
+  kwargs = dict(stat = 'median', B = 500, batch_size = 100, random_state = 0)
+  res = eda.boot_ci(penguins[NUMERIC], **kwargs)
+  pd.testing.assert_frame_equal(res, eda.boot_ci(penguins[NUMERIC], n_jobs = 2, backend = 'thread', **kwargs))
+  pd.testing.assert_frame_equal(res, eda.boot_ci(penguins[NUMERIC], n_jobs = 2, backend = 'process', **kwargs))
+  assert (res['lower'] <= res['median']).all() and (res['median'] <= res['upper']).all()
+
+
+def test_boot_ci_callable_stat(penguins):
+  res = eda.boot_ci(penguins['body_mass_g'], stat = np.max, B = 200, random_state = 0)
+  assert list(res.columns) == [np.max.__name__, 'lower', 'upper']
+  assert res.iloc[0, 0] == penguins['body_mass_g'].max()
+
+
+# miss_mask() / miss_mask_rep() ----------------------------------------------------
+
+def test_miss_mask_subset_keeps_other_columns(penguins):
+  mask = eda.miss_mask(penguins, columns = ['bill_length_mm', 'species'], random_state = 0)
+  assert mask.shape == penguins.shape and list(mask.columns) == list(penguins.columns)
+  assert not mask.drop(columns = ['bill_length_mm', 'species']).any().any()
+  res = penguins.mask(mask)
+  pd.testing.assert_frame_equal(res['island'].to_frame(), penguins['island'].to_frame())
+  assert res['bill_length_mm'].isna().sum() == round(0.1 * len(penguins))
+  # 元から欠測値の位置は選ばれません。
+  assert not (mask['bill_length_mm'] & penguins['bill_length_mm'].isna()).any()
+
+
+def test_miss_mask_prop_by_column(penguins):
+  mask = eda.miss_mask(penguins, prop = {'sex':0.3, 'body_mass_g':0.5}, random_state = 0)
+  for col, prop in [('sex', 0.3), ('body_mass_g', 0.5)]:
+    assert penguins.mask(mask)[col].isna().sum() == round(prop * len(penguins))
+  assert mask.drop(columns = ['sex', 'body_mass_g']).sum().sum() == 0
+
+
+def test_miss_mask_mar_and_mnar_direction(penguins):
+  x = penguins['body_mass_g']
+  mar = eda.miss_mask(penguins, prop = 0.3, mechanism = 'MAR', by = 'body_mass_g',
+                      columns = 'bill_length_mm', strength = 2, random_state = 0)
+  assert x[mar['bill_length_mm']].mean() > x.mean()
+  mnar = eda.miss_mask(penguins, prop = 0.3, mechanism = 'MNAR',
+                       columns = 'body_mass_g', strength = -2, random_state = 0)
+  assert x[mnar['body_mass_g']].mean() < x.mean()
+
+
+def test_miss_mask_rep_is_reproducible(penguins):
+  masks = list(eda.miss_mask_rep(penguins, n_rep = 3, columns = 'sex', random_state = 1))
+  again = list(eda.miss_mask_rep(penguins, n_rep = 3, columns = 'sex', random_state = 1))
+  assert len(masks) == 3
+  for a, b in zip(masks, again): pd.testing.assert_frame_equal(a, b)
+  assert not masks[0].equals(masks[1])
+  assert masks[0].shape == penguins.shape
+
+
+# prune() ---------------------------------------------------------------------------
+
+def _prune_pipeline(data, empty, constant, dropna):
+  if empty: data = eda.remove_empty(data)
+  if constant: data = eda.remove_constant(data, dropna = dropna)
+  return data
+
+
+@pytest.fixture
+def penguins_prune(penguins):
+  df = penguins.copy()
+  df['empty'] = np.nan
+  df['const'] = 1
+  df['const_na'] = pd.Series('a', index = df.index).where(df.index % 7 != 0)
+  df['cat'] = pd.Categorical(['x'] * len(df))
+  df.loc[5] = np.nan # 空白行
+  return df
+
+
+@pytest.mark.parametrize('empty', [True, False])
+@pytest.mark.parametrize('constant', [True, False])
+@pytest.mark.parametrize('dropna', [True, False])
+def test_prune_matches_remove_empty_remove_constant(penguins_prune, empty, constant, dropna):
+  res, report = eda.prune(penguins_prune, empty = empty, constant = constant, dropna = dropna)
+  expected = _prune_pipeline(penguins_prune, empty, constant, dropna)
+  pd.testing.assert_frame_equal(res, expected)
+  removed_cols = set(penguins_prune.columns) - set(expected.columns)
+  assert set(report.query('axis == "columns"')['name']) == removed_cols
+  assert set(report.query('axis == "index"')['name']) == set(penguins_prune.index) - set(expected.index)
+
+
+def test_prune_empty_row_does_not_hide_constant(penguins_prune):
+  res, report = eda.prune(penguins_prune)
+  assert 'const' not in res.columns and 'cat' not in res.columns
+  assert report.set_index('name').loc['const', 'reason'] == 'constant'
+
+
+def test_prune_parallel(penguins_prune):
+  res, report = eda.prune(penguins_prune)
+  res2, report2 = eda.prune(penguins_prune, n_jobs = 2)
+  pd.testing.assert_frame_equal(res, res2)
+  pd.testing.assert_frame_equal(report, report2)
+
+
+# make_rank_table() -----------------------------------------------------------------
+
+def test_make_rank_table_matches_pivot_table(penguins):
+  res = eda.make_rank_table(penguins, 'island', 'body_mass_g')
+  expected = pd.pivot_table(penguins, index = 'island', values = 'body_mass_g', aggfunc = 'sum', fill_value = 0)\
+    .sort_values('body_mass_g', ascending = False)
+  pd.testing.assert_series_equal(res['body_mass_g'], expected['body_mass_g'])
+  assert res['cumshare'].iloc[-1] == pytest.approx(1)
+
+
+def test_make_rank_table_top_n():
+  rng = np.random.default_rng(0)
+  df = pd.DataFrame({'maker':rng.integers(0, 5000, 50_000).astype(str), 'sales':rng.exponential(size = 50_000)})
+  full = eda.make_rank_table(df, 'maker', 'sales')
+  res = eda.make_rank_table(df, 'maker', 'sales', top_n = 20, other_name = 'others')
+  assert len(res) == 21 and res.index[-1] == 'others'
+  pd.testing.assert_frame_equal(res.iloc[:20], full.iloc[:20])
+  assert res.loc['others', 'sales'] == pytest.approx(full['sales'].iloc[20:].sum())
+  assert res['cumshare'].iloc[-1] == pytest.approx(1)
@@ -0,0 +1,292 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+
+from py4stats import regression_tools as reg
+from py4stats import bilding_block as bild
+
+
+@pytest.fixture
+def penguins_fit(penguins):
+  penguins = penguins.dropna().reset_index(drop = True)
+  penguins['female'] = (penguins['sex'] == 'female').astype(int)
+  return penguins
+
+
+@pytest.fixture
+def models(penguins_fit):
+  return [
+      smf.ols('body_mass_g ~ bill_length_mm', data = penguins_fit).fit(),
+      smf.ols('body_mass_g ~ bill_length_mm + species', data = penguins_fit).fit(cov_type = 'HC1'),
+      smf.ols('body_mass_g ~ bill_length_mm + bill_depth_mm + species + sex', data = penguins_fit).fit()
+      ]
+
+
+# tidy_many() / glance_many() -------------------------------------------------------
+
+def test_tidy_many_matches_tidy(models, penguins_fit):
+  models = models + [smf.logit('female ~ body_mass_g + species', data = penguins_fit).fit(disp = 0)]
+  res = reg.tidy_many(models)
+  for i, mod in enumerate(models):
+    pd.testing.assert_frame_equal(
+        res.loc[f'model {i + 1}'], reg.tidy(mod), check_names = False, rtol = 1e-10
+        )
+
+
+def test_glance_many_matches_glance(models):
+  res = reg.glance_many(models, model_name = ['a', 'b', 'c'])
+  assert list(res.index) == ['a', 'b', 'c']
+  for name, mod in zip(res.index, models):
+    pd.testing.assert_series_equal(
+        res.loc[name], reg.glance(mod).iloc[0], check_names = False, check_dtype = False
+        )
+
+
+# gazer() / lineup_models() / make_glance_tab() ------------------------------------------
+
+@pytest.mark.parametrize('stats', ['std_err', 'statistics', 'p_value'])
+def test_gazer_two_line(models, stats):
+  tidied = reg.tidy(models[1])
+  res = reg.gazer(tidied, stats = stats, digits = 3)
+  for term, row in tidied.iterrows():
+    stars = bild.format_stars([row['p_value']])[0]
+    assert res.loc[term, 'value'] == f"{row['estimate']:,.3f} {stars}\n({row[stats]:,.3f})"
+
+
+def test_gazer_one_line_conf_int(models):
+  tidied = reg.tidy(models[0])
+  res = reg.gazer(tidied, stats = 'conf_int', table_style = 'one_line', add_stars = False, digits = 2)
+  row = tidied.iloc[1]
+  assert res['value'].iloc[1] == f"{row['estimate']:,.2f}[{row['conf_lower']:,.2f}, {row['conf_higher']:,.2f}]"
+
+
+def test_lineup_models_aligns_terms(models):
+  tidy_list = [reg.tidy(mod) for mod in models]
+  res = reg.lineup_models(tidy_list, model_name = ['a', 'b', 'c'])
+  assert list(res.columns) == ['a', 'b', 'c']
+  # term は各モデルで最初に現れた順に並びます。
+  assert list(res.index) == list(pd.unique(pd.concat(tidy_list).index))
+  assert res.loc['bill_depth_mm', 'a'] == ''
+  for name, tidied in zip(res.columns, tidy_list):
+    pd.testing.assert_series_equal(
+        res.loc[tidied.index, name], reg.gazer(tidied)['value'], check_names = False
+        )
+
+
+def test_make_glance_tab(models):
+  res = reg.make_glance_tab(models, stats_glance = ['rsquared_adj', 'nobs', 'AIC'], digits = 2)
+  glance = reg.glance_many(models)
+  assert res.loc['nobs'].tolist() == [str(v) for v in glance['nobs']]
+  assert res.loc['rsquared_adj'].tolist() == [f'{v:.2f}' for v in glance['rsquared_adj']]
+  assert res.loc['AIC'].tolist() == [f'{v:.2f}' for v in glance['AIC']]
+
+
+def test_compare_ols_matches_parts(models):
+  res = reg.compare_ols(models).to_frame()
+  coef = reg.lineup_models([reg.tidy(mod) for mod in models])
+  glance = reg.make_glance_tab(models)
+  pd.testing.assert_frame_equal(res, pd.concat([coef, glance]), check_names = False)
+
+
+# ModelTable ---------------------------------------------------------------------------
+
+def test_model_table_render_html_line_break(models):
+  tab = reg.compare_ols(models)
+  res = tab.render('html')
+  assert '\n(' not in res
+  coef = tab.to_frame().iloc[1, 0].split('\n')
+  assert f'{coef[0]}<br>{coef[1]}' in res
+  # one_line の表には改行がありません。
+  assert '<br>' not in tab.render('html', table_style = 'one_line')
+
+
+def test_model_table_render_latex_line_break(models):
+  pytest.importorskip('jinja2')
+  res = reg.compare_ols(models).render('latex')
+  assert '\\makecell{' in res
+
+
+@pytest.mark.parametrize('output, module', [('latex', 'jinja2'), ('markdown', 'tabulate')])
+def test_model_table_render_requires_optional_module(models, output, module, monkeypatch):
+  monkeypatch.setattr(reg.importlib.util, 'find_spec', lambda name: None)
+  with pytest.raises(ImportError, match = module):
+    reg.compare_ols(models).render(output)
+
+
+def test_model_table_select_and_append(models):
+  tab = reg.compare_ols(models[:2], model_name = ['a', 'b'])
+  full = reg.compare_ols(models, model_name = ['a', 'b', 'c'])
+  pd.testing.assert_frame_equal(tab.append(models[2], model_name = ['c']).to_frame(), full.to_frame())
+
+  subset = ['bill_length_mm', 'bill_depth_mm']
+  res = full.select(subset).to_frame()
+  pd.testing.assert_frame_equal(res.loc[subset], full.to_frame().loc[subset])
+
+
+# fit_many() ---------------------------------------------------------------------------
+
+FORMULAS = [
+    'body_mass_g ~ bill_length_mm',
+    'body_mass_g ~ bill_length_mm + species',
+    'body_mass_g ~ bill_length_mm * sex + np.log(flipper_length_mm)',
+    'body_mass_g ~ center(bill_length_mm)',
+    'body_mass_g ~ center(bill_length_mm) + sex',
+    'body_mass_g ~ standardize(bill_length_mm) + scale(flipper_length_mm) + species',
+    ]
+
+def _smf_dropna(fun, formula, data, **kwargs):
+  # smf.ols() では欠測値を含むデータに center() などを使えないため、回帰式で使う列に欠測値のない行で推定します。
+  columns = [v for v in data.columns if v in formula]
+  return fun(formula, data = data.dropna(subset = columns)).fit(**kwargs)
+
+
+def test_fit_many_matches_smf_with_missing(penguins):
+  res = reg.fit_many(FORMULAS, penguins)
+  for formula, mod in zip(FORMULAS, res):
+    expected = _smf_dropna(smf.ols, formula, penguins)
+    assert mod.nobs == expected.nobs
+    pd.testing.assert_series_equal(mod.params, expected.params, rtol = 1e-8)
+    pd.testing.assert_series_equal(mod.bse, expected.bse, rtol = 1e-8)
+    np.testing.assert_allclose(mod.predict(penguins.head(20)), expected.predict(penguins.head(20)))
+
+
+def test_fit_many_logit(penguins_fit):
+  formulas = ['female ~ body_mass_g', 'female ~ center(body_mass_g) + species']
+  res = reg.fit_many(formulas, penguins_fit, model = 'logit', disp = 0)
+  for formula, mod in zip(formulas, res):
+    expected = smf.logit(formula, data = penguins_fit).fit(disp = 0)
+    pd.testing.assert_series_equal(mod.params, expected.params, rtol = 1e-6)
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_fit_many_n_jobs(penguins, backend):
+  res1 = reg.fit_many(FORMULAS, penguins)
+  res2 = reg.fit_many(FORMULAS, penguins, n_jobs = 2, backend = backend)
+  for mod1, mod2 in zip(res1, res2):
+    pd.testing.assert_series_equal(mod1.params, mod2.params)
+
+
+# ols_by() -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('by', ['species', ['species', 'island']])
+def test_ols_by_matches_smf(penguins, by):
+  formula = 'body_mass_g ~ bill_length_mm + bill_depth_mm + sex'
+  res_tidy, res_glance = reg.ols_by(formula, penguins, by = by)
+  by = [by] if isinstance(by, str) else by
+  glance_cols = ['rsquared', 'rsquared_adj', 'nobs', 'df', 'sigma', 'F_values', 'p_values', 'AIC', 'BIC']
+
+  groups = penguins.groupby(by)
+  assert len(res_glance) == groups.ngroups
+  for key, group in groups:
+    fit = smf.ols(formula, data = group).fit()
+    key = key if len(by) > 1 else key[0]
+    pd.testing.assert_frame_equal(
+        res_tidy.loc[key].set_axis(fit.params.index), reg.tidy(fit),
+        check_names = False, rtol = 1e-6
+        )
+    np.testing.assert_allclose(
+        res_glance.loc[key, glance_cols].to_numpy(dtype = float),
+        reg.glance(fit)[glance_cols].to_numpy(dtype = float).ravel(), rtol = 1e-6
+        )
+
+
+# ols_stream() / OLSAccumulator --------------------------------------------------------
+
+def _chunks(data, size):
+  return [data.iloc[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def stream_data():
+  rng = np.random.default_rng(2)
+  n = 5000
+  data = pd.DataFrame({
+      'x1':rng.normal(size = n), 'x2':rng.uniform(1, 3, size = n),
+      'h':pd.Categorical(rng.choice(list('abc'), n))
+      })
+  data['y'] = 1 + data['x1'] * data['x2'] + rng.normal(size = n) * data['x2']
+  data.loc[::97, 'x1'] = np.nan
+  return data
+
+
+@pytest.mark.parametrize('cov_type', ['nonrobust', 'HC0', 'HC1'])
+@pytest.mark.parametrize('formula', ['y ~ x1 + np.log(x2) + h', 'y ~ x1 - 1', 'y ~ h - 1 + x1'])
+def test_ols_stream_matches_smf(stream_data, formula, cov_type):
+  res = reg.ols_stream(formula, iter(_chunks(stream_data, 700)), cov_type = cov_type)
+  expected = smf.ols(formula, data = stream_data).fit(cov_type = cov_type)
+  pd.testing.assert_frame_equal(reg.tidy(res), reg.tidy(expected), rtol = 1e-7)
+  glance_res, glance_expected = reg.glance(res), reg.glance(expected)
+  if formula == 'y ~ h - 1 + x1' and cov_type != 'nonrobust':
+    # 暗黙の定数項を含むモデルの頑健な F 検定は、statsmodels では計算されません（NaN）。
+    glance_res, glance_expected = [g.drop(columns = ['F_values', 'p_values']) for g in (glance_res, glance_expected)]
+  pd.testing.assert_frame_equal(glance_res, glance_expected, rtol = 1e-7, check_dtype = False)
+
+
+def test_ols_accumulator_merge_after_pickle(stream_data):
+  import pickle
+  formula = 'y ~ x1 + np.log(x2) + h'
+  accs = []
+  for part in np.array_split(np.arange(len(stream_data)), 3):
+    acc = reg.OLSAccumulator(formula, cov_type = 'HC1')
+    for chunk in _chunks(stream_data.iloc[part], 400): acc.update(chunk)
+    accs.append(pickle.loads(pickle.dumps(acc)))
+  for acc in accs[1:]: accs[0].merge(acc)
+  pd.testing.assert_frame_equal(
+      reg.tidy(accs[0].fit()), reg.tidy(smf.ols(formula, data = stream_data).fit(cov_type = 'HC1')), rtol = 1e-7
+      )
+
+
+@pytest.mark.parametrize('center, spread', [(1e4, 1), (1.7e9, 1e5)])
+@pytest.mark.parametrize('cov_type', ['nonrobust', 'HC1'])
+def test_ols_stream_offset_regressor(center, spread, cov_type):
+  # 平均が大きく散らばりの小さい説明変数（UNIX 時間など）でも、階数と定数項を正しく判定します。
+  rng = np.random.default_rng(0)
+  x = center + rng.uniform(-spread, spread, 5000)
+  data = pd.DataFrame({'x':x, 'y':2 * (x - center) + rng.normal(size = 5000) * spread})
+  res = reg.ols_stream('y ~ x', iter(_chunks(data, 700)), cov_type = cov_type)
+  expected = smf.ols('y ~ x', data = data).fit(cov_type = cov_type)
+  assert (res.df_model, res.k_constant) == (1, 1)
+  pd.testing.assert_series_equal(res.params, expected.params, rtol = 1e-6)
+  pd.testing.assert_series_equal(res.bse, expected.bse, rtol = 1e-6)
+
+
+@pytest.mark.parametrize('ext', ['csv', 'parquet'])
+def test_ols_stream_levels_from_file(penguins, tmp_path, ext):
+  # penguins の最初の60行には Adelie しか含まれません。
+  formula = 'body_mass_g ~ bill_length_mm + species'
+  path = tmp_path / f'penguins.{ext}'
+  if ext == 'csv':
+    penguins.to_csv(path, index = False)
+  else:
+    pytest.importorskip('pyarrow')
+    penguins.to_parquet(path)
+  res = reg.ols_stream(formula, path, chunksize = 60)
+  expected = smf.ols(formula, data = penguins).fit()
+  pd.testing.assert_frame_equal(reg.tidy(res), reg.tidy(expected), rtol = 1e-7)
+
+
+def test_ols_stream_levels_argument(penguins):
+  formula = 'body_mass_g ~ bill_length_mm + species'
+  expected = smf.ols(formula, data = penguins).fit()
+  # イテレーターは水準の探索のために読み直せないため、levels で水準を指定します。
+  with pytest.raises(ValueError, match = 'levels'):
+    reg.ols_stream(formula, iter(_chunks(penguins, 60)))
+
+  res = reg.ols_stream(formula, iter(_chunks(penguins, 60)), levels = {'species':['Adelie', 'Chinstrap', 'Gentoo']})
+  pd.testing.assert_series_equal(res.params, expected.params, rtol = 1e-7)
+  res = reg.ols_stream(formula, _chunks(penguins, 60))
+  pd.testing.assert_series_equal(res.params, expected.params, rtol = 1e-7)
+
+  with pytest.raises(ValueError, match = 'Gentoo'):
+    reg.ols_stream(formula, penguins, levels = {'species':['Adelie', 'Chinstrap']})
+
+
+def test_ols_accumulator_blocked_fourth_moments(stream_data, monkeypatch):
+  # 4次のモーメントを数行ずつに分けて累積しても、結果は変わりません。
+  formula = 'y ~ x1 + np.log(x2) + h'
+  expected = reg.OLSAccumulator(formula, cov_type = 'HC0').update(stream_data)
+  monkeypatch.setattr(reg, '_OLS_BLOCK_ELEMENTS', 100)
+  res = reg.OLSAccumulator(formula, cov_type = 'HC0').update(stream_data)
+  np.testing.assert_allclose(res.moments4, expected.moments4, atol = 1e-10 * np.abs(expected.moments4).max())
+  pd.testing.assert_frame_equal(reg.tidy(res.fit()), reg.tidy(expected.fit()), rtol = 1e-8)